@@ -4,13 +4,24 @@ import json
 import logging
 import os
 import time
-from fnmatch import fnmatchcase
 
 import oss2
 from rich.progress import (BarColumn, Progress, TextColumn,
                            TimeElapsedColumn)
 
-from oss_sync_libs import (Colored, FileCount, OssOperation, bytes_to_str, calculate_local_file_sha256, check_configs, sct_push)
+from oss_sync_libs import (Colored, FileCount, OssOperation, bytes_to_str, check_configs, sct_push, sha256_sidecar_name, sha256_to_path)
+from units.chunk_store import ChunkStore
+from units.chunker import Chunker
+from units.diff_engine import COPY, SKIP, UPLOAD, DiffEngine
+from units.exclude_matcher import ExcludeMatcher
+from units.hash_cache import HashCache
+from units.pack_store import PackStore
+from units.parallel_hash import HashPool
+from units.index_journal import IndexJournal
+from units.remote_index import DigestIndex, RemoteIndex
+from units.restore_orchestrator import RestoreOrchestrator
+from units.scanner import walk_roots
+from units.upload_scheduler import UploadScheduler
 
 try:
     import config
@@ -36,52 +47,143 @@ def create_logger(no_file_logger: bool = False):
         logger.addHandler(fhlr)
 
 
-def sha256_to_path(__sha256: str) -> str:
-    """将sha256字符串转换为目录结构
+def new_progress() -> Progress:
+    return Progress(
+        "[progress.percentage]{task.percentage:>3.2f}%",
+        BarColumn(),
+        FileCount(),
+        "•",
+        "[progress.elapsed]已用时间", TimeElapsedColumn(),
+        "•",
+        "[progress.description]{task.description}",
+        TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
+        )
+
+
+def copy_with_progress(copy_list: dict, src_sizes: dict = None, restore: bool = False, restore_configuration: int = None):
+    """并行复制远程文件并显示进度，复制失败的文件会从local_files_sha256中移除，下次运行时重新处理
+
+    Args:
+        copy_list (dict): {目标文件: 源文件}
+        src_sizes (dict, 可选): {源文件: 大小}
+        restore (bool, 可选): 源文件为归档/冷归档类型，需要先解冻，每个源文件解冻完成后立即复制
+        restore_configuration (int, 可选): 冷归档文件的解冻优先级，见OssOperation.restore_remote_file
+    """
+    with new_progress() as progress:
+        task = progress.add_task("[red]正在解冻并复制文件" if restore else "[red]正在复制文件", total=len(copy_list), filename="")
+
+        def callback(dst_obj, succeeded):
+            progress.update(task, advance=1, filename=dst_obj)
+
+        if restore:
+            orchestrator = RestoreOrchestrator(oss, config.temp_dir + config.remote_base_dir[:-1] + "-restore.db", max_workers=config.Restore_Workers,
+                                               copy_workers=config.Copy_Workers)
+            failed = orchestrator.run(copy_list, restore_configuration=restore_configuration, storage_class=config.default_storage_class,
+                                      src_sizes=src_sizes, progress_callback=callback)
+        else:
+            failed = oss.copy_remote_files(copy_list, storage_class=config.default_storage_class, src_sizes=src_sizes, progress_callback=callback)
+    for dst_obj in failed:
+        logger.warning("无法复制文件%s" % dst_obj)
+        local_files_sha256.pop(dst_obj[len(config.remote_base_dir):], None)
+
+
+def process_upload_results(results, record_upload: bool = True) -> int:
+    """处理UploadScheduler返回的上传结果，上传失败的文件会从local_files_sha256中移除
+
+    Args:
+        results (Iterable[UploadResult])
+        record_upload (bool, 可选): 是否将上传成功的文件记入upload_list
+
+    Returns:
+        int: 上传成功的文件总大小
     """
-    if len(__sha256) != 64:
-        logger.error("[sha256_to_path]不正确的输入\"%s\"" % str(__sha256))
-        raise ValueError
-    __str_list = list(__sha256)
-    __str_list.insert(1, "/")
-    __str_list.insert(5, "/")
-    return "".join(__str_list)
+    uploaded_size = 0
+    for result in results:
+        path = result.local_file_name
+        if result.error is None:
+            if path in stream_paths:
+                local_files_sha256[path] = result.file_sha256
+                if hash_cache:
+                    hash_cache.set(path, stream_paths[path], result.file_sha256)
+            journal.add(path, local_files_sha256[path])
+            if record_upload:
+                upload_list.append(path)
+                uploaded_size += result.file_size
+            if config.Encrypted_Filename_With_Sha256 and result.file_sha256:
+                sha256_to_remote_file[result.file_sha256] = sha256_to_path(result.file_sha256)
+            continue
+        if isinstance(result.error, FileNotFoundError):
+            logger.warning("上传时无法找到文件%s" % path)
+        elif isinstance(result.error, ValueError):
+            logger.warning("文件%s在计算sha256之后被修改，将在下次运行时重新上传" % path)
+        else:
+            logger.warning("由于网络错误无法上传文件%s" % path)
+        local_files_sha256.pop(path, None)
+    return uploaded_size
 
 
-def is_dir_excluded(_dir: str) -> bool:
-    """如果目录在排除列表中则返回True，反之返回False
+def process_pack_results(results) -> int:
+    """处理PackStore返回的上传结果，所在的包上传失败的文件会从local_files_sha256中移除
+
+    Returns:
+        int: 上传成功的文件总大小
     """
-    for exclude_dir in config.backup_exclude:
-        if fnmatchcase(_dir, exclude_dir):
-            return True
-    return False
+    uploaded_size = 0
+    for sha256_list, error in results:
+        for sha256 in sha256_list:
+            for path, file_size in packed_paths.pop(sha256, ()):
+                if error is None:
+                    journal.add(path, sha256)
+                    upload_list.append(path)
+                    uploaded_size += file_size
+                else:
+                    logger.warning("由于网络错误无法上传文件%s" % path)
+                    local_files_sha256.pop(path, None)
+    return uploaded_size
+
+
+def stored_as_object(sha256: str) -> bool:
+    """sha256对应的远端文件是否为单独的Object(而不是分块或打包存储)"""
+    return not (chunk_store.has_file(sha256) or pack_store.has_file(sha256))
 
 
-def scan_backup_dirs() -> dict:
-    """扫描备份目录
+def scan_backup_dirs():
+    """扫描备份目录，逐个返回扫描到的文件，扫描结束后输出统计信息
+
+    Yields:
+        FileRecord
     """
     global logger
-    local_files_to_sha256 = {}
-    oss_waste_size = total_file_size = 0
+    file_count = oss_waste_size = total_file_size = 0
     oss_block_size = 1024 * 64
-    for backup_dirs in config.backup_dirs:
-        logger.info("正在读取备份目录:" + backup_dirs)
-        for root, dirs, files in os.walk(backup_dirs):
-            for file_path in files:
-                relative_path = os.path.join(root, file_path)  # 合成相对于local_base_dir的路径
-                if is_dir_excluded(relative_path) or file_path == '.DS_Store' or os.path.islink(relative_path):
-                    continue
-                file_size = os.path.getsize(relative_path)
-                if file_size == 0:
-                    continue  # 排除文件大小为0的空文件
-                local_files_to_sha256[relative_path] = ""
-                total_file_size += file_size
-                if file_size < oss_block_size:
-                    oss_waste_size += oss_block_size - file_size
+    exclude_matcher = ExcludeMatcher(config.backup_exclude, style=config.backup_exclude_style)
+    logger.info("正在读取备份目录:" + ", ".join(config.backup_dirs))
+    for record in walk_roots(config.backup_dirs, is_excluded=exclude_matcher.match_file, is_dir_excluded=exclude_matcher.match_dir):
+        if os.path.basename(record.path) == '.DS_Store' or record.size == 0:
+            continue  # 排除文件大小为0的空文件
+        file_count += 1
+        total_file_size += record.size
+        if record.size < oss_block_size:
+            oss_waste_size += oss_block_size - record.size
+        yield record
     logger.info("备份文件扫描完成\n备份文件总数：%s\n备份文件总大小：%s\n实际占用OSS大小：%s\n浪费的OSS容量：%s\n存储类型为：%s\n是否加密文件名：%s" %
-                (color.red(len(local_files_to_sha256)), color.red(bytes_to_str(total_file_size)), color.red(bytes_to_str(oss_waste_size + total_file_size)),
+                (color.red(file_count), color.red(bytes_to_str(total_file_size)), color.red(bytes_to_str(oss_waste_size + total_file_size)),
                  color.red(bytes_to_str(oss_waste_size)), color.red(config.default_storage_class), color.red(config.Encrypted_Filename_With_Sha256)))
-    return local_files_to_sha256
+
+
+def iter_hash_inputs(records):
+    """将扫描到的文件登记到local_files_sha256，并把需要单次读取上传的新增大文件分流至stream_paths，其余文件交给HashPool计算sha256
+
+    已知sha256的文件(如被重命名的文件)即使是新增的大文件也按原流程处理，以便复制远端文件；需要分块上传的文件也需要先计算sha256
+    """
+    for record in records:
+        local_files_sha256[record.path] = ""
+        if (config.Single_Pass_Upload_Size and not config.Encrypted_Filename_With_Sha256 and record.size >= config.Single_Pass_Upload_Size
+                and not (config.Chunked_Upload_Size and record.size >= config.Chunked_Upload_Size)
+                and record.path not in remote_files_sha256 and not (hash_cache and hash_cache.get_by_inode(record))):
+            stream_paths[record.path] = record
+            continue
+        yield record
 
 
 if __name__ == "__main__":
@@ -90,6 +192,8 @@ if __name__ == "__main__":
     parser.add_argument('--compare_sha256_before_uploading', action='store_true', help='添加此选项将会在上传文件前对比远端Object Header中的sha256，如相同则会跳过上传。适用于远端index不再可靠时')
     parser.add_argument('--rsa_passphrase', help='RSA私钥密码')
     parser.add_argument('--no_file_logger', action='store_true', help='不将日志写入文件')
+    parser.add_argument('--no_confirm', action='store_true', help='不等待确认，扫描的同时开始计算哈希和上传')
+    parser.add_argument('--rehash_older_than', type=float, default=None, help='强制重新计算sha256缓存中超过指定天数的文件')
     args = parser.parse_args()
 
     create_logger(args.no_file_logger)
@@ -97,42 +201,46 @@ if __name__ == "__main__":
     color = Colored()
     oss = OssOperation(rsa_passphrase=args.rsa_passphrase)
     local_json_filename = config.temp_dir + config.remote_base_dir[:-1] + "sha256_local_index.json"
-    remote_json_filename = config.temp_dir + config.remote_base_dir[:-1] + "sha256_remote_index.json"
+    index_cache_dir = config.temp_dir + config.remote_base_dir[:-1] + "-index/"
+    remote_index = RemoteIndex(oss, config.remote_base_dir, index_cache_dir, prefix_length=config.Index_Shard_Prefix_Length)
     os.chdir(config.local_base_dir)
+    hash_cache = None
+    if config.hash_cache_file:
+        hash_cache = HashCache(config.hash_cache_file,
+                               rehash_older_than=args.rehash_older_than * 86400 if args.rehash_older_than is not None else None)
 
     ######################################################################
 
     start_time = time.time()
     # 扫描备份目录，获取文件列表
-    local_files_sha256 = scan_backup_dirs()
-
-    if not str(input("确认继续请输入Y，否则输入N：")) in ['y', 'Y']:
-        exit()
-
-    with Progress(  # 初始化进度条
-            "[progress.percentage]{task.percentage:>3.2f}%",
-            BarColumn(),
-            FileCount(),
-            "•",
-            "[progress.elapsed]已用时间", TimeElapsedColumn(),
-            "•",
-            "[progress.description]{task.description}",
-            TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
-            ) as progress:
-        task = progress.add_task("[red]正在准备上传...", total=len(local_files_sha256), start=False, filename="")
-
-        # 获取远程文件json
-        json_on_oss = "index/%s.json" % config.remote_base_dir[:-1]
-        req = oss.download_and_decrypt_file(remote_json_filename, json_on_oss)
-        if req == 200:
-            with open(remote_json_filename, 'r') as fobj:
-                remote_files_sha256 = json.load(fobj)
-            sha256_to_remote_file = {}  # sha256与远程文件对应表
-            for file, sha256 in remote_files_sha256.items():
-                sha256_to_remote_file[sha256] = file
-        elif req == 404:
-            remote_files_sha256 = {}
-            sha256_to_remote_file = {}
+    local_files = scan_backup_dirs()
+    if not args.no_confirm:
+        local_files = list(local_files)
+        if not str(input("确认继续请输入Y，否则输入N：")) in ['y', 'Y']:
+            exit()
+    local_files_sha256 = {}
+
+    with new_progress() as progress:  # 初始化进度条
+        task = progress.add_task("[red]正在准备上传...", total=len(local_files) if not args.no_confirm else 0, start=False, filename="")
+
+        # 获取远程文件索引
+        remote_index.load()
+        remote_files_sha256 = remote_index.load_paths()  # {远程文件: sha256}
+        # 索引的修改在运行期间持续写入日志，上次运行中断时从日志恢复已完成的上传
+        journal = IndexJournal(oss, remote_index, index_cache_dir + "journal.jsonl", segment_records=config.Index_Journal_Segment_Records,
+                               segment_interval=config.Index_Journal_Segment_Interval, compact_segments=config.Index_Journal_Compact_Segments,
+                               fsync_interval=config.Index_Journal_Fsync_Interval)
+        journal.replay(remote_files_sha256)
+        sha256_to_remote_file = DigestIndex.from_path_index(remote_files_sha256)  # sha256与远程文件对应表，应用日志后只生成一次
+        # 即使禁用了分块上传也需要读取远端的分块存储，以识别之前分块上传的文件
+        chunk_store = ChunkStore(oss, config.remote_base_dir, config.temp_dir + config.remote_base_dir[:-1] + "-chunks/",
+                                 chunker=Chunker(config.Chunk_Min_Size, config.Chunk_Avg_Size, config.Chunk_Max_Size),
+                                 storage_class=config.Chunk_Pack_Storage_Class)
+        chunk_store.load()
+        pack_store = PackStore(oss, config.remote_base_dir, config.temp_dir + config.remote_base_dir[:-1] + "-packs/", pack_size=config.Pack_Size,
+                               storage_class=config.Chunk_Pack_Storage_Class)
+        pack_store.load()
+        diff_engine = DiffEngine(remote_files_sha256, sha256_to_remote_file, by_sha256=config.Encrypted_Filename_With_Sha256)
 
         # 计算备份文件的sha256
         copy_list = {}  # 需要复制的文件列表{目标文件: 源文件}
@@ -140,105 +248,96 @@ if __name__ == "__main__":
         uploaded_file_size = 0.0
 
         progress.start_task(task)
-        i = 0
-        for path in list(local_files_sha256):
-            if i >= 2500:
-                time.sleep(30)
-                i = 0
-            progress.update(task, description="[red]正在计算哈希", advance=1, filename=path)
-            sha256 = calculate_local_file_sha256(path)
-            progress.update(task, description="[red]正在上传文件")
+        uploader = UploadScheduler(oss, max_workers=config.Upload_Workers, max_large_uploads=config.Upload_Large_Workers,
+                                   large_file_size=config.Upload_Large_File_Size, chunk_store=chunk_store)
+        hash_pool = HashPool(max_workers=config.Hash_Workers, per_device=config.Hash_Workers_Per_Device,
+                             use_process_pool=config.Hash_Use_Process_Pool)
+
+        # 新增的大文件使用单次读取上传，在上传的同时计算sha256，避免先计算哈希再上传时读取两遍磁盘
+        stream_paths = {}  # {文件路径: FileRecord}
+        replaced_objects = []  # 改为分块或打包上传的文件，上传完成后删除远端原有的Object
+        packed_paths = {}  # 等待所在的包上传完成的文件{sha256: [(路径, 大小)]}
+
+        for path, sha256, file_stat in hash_pool.imap_unordered(iter_hash_inputs(local_files), cache=hash_cache):
+            if args.no_confirm:
+                progress.update(task, total=len(local_files_sha256))
+            progress.update(task, description="[red]正在上传文件", advance=1, filename=path)
             if not sha256:  # 计算sha256时出错，跳过该文件
                 del (local_files_sha256[path])
                 logger.warning("上传时无法找到文件%s，可能是由于文件被删除" % path)
                 continue
             local_files_sha256[path] = sha256
 
-            if not config.Encrypted_Filename_With_Sha256:
-                if path in remote_files_sha256:
-                    if remote_files_sha256[path] == sha256:  # 如果远端同名文件的sha256相同则跳过
-                        continue
-                    elif sha256 in sha256_to_remote_file:  # 如果远端存在同sha256文件则将本文件加入copy_list
-                        copy_list[config.remote_base_dir + path] = config.remote_base_dir + sha256_to_remote_file[sha256]
-                    else:  # 上传文件并覆盖
-                        i += 1
-                        try:
-                            oss.encrypt_and_upload_files(path, config.remote_base_dir + path, storage_class=config.default_storage_class,
-                                                         file_sha256=sha256, compare_sha256_before_uploading=args.compare_sha256_before_uploading)
-                        except FileNotFoundError:
-                            logger.warning("上传时无法找到文件%s" % path)
-                            del (local_files_sha256[path])
-                        except oss2.exceptions.RequestError:
-                            logger.warning("由于网络错误无法上传文件%s" % path)
-                            del (local_files_sha256[path])
-                        else:
-                            upload_list.append(path)
-                            uploaded_file_size += os.path.getsize(path)
-                elif sha256 in sha256_to_remote_file:
-                    copy_list[config.remote_base_dir + path] = config.remote_base_dir + sha256_to_remote_file[sha256]
-                else:  # 上传新增文件
-                    i += 1
-                    try:
-                        oss.encrypt_and_upload_files(path, config.remote_base_dir + path, storage_class=config.default_storage_class,
-                                                     file_sha256=sha256, compare_sha256_before_uploading=args.compare_sha256_before_uploading)
-                    except FileNotFoundError:
-                        logger.warning("上传时无法找到文件%s" % path)
-                        del (local_files_sha256[path])
-                    except oss2.exceptions.RequestError:
-                        logger.warning("由于网络错误无法上传文件%s" % path)
-                        del (local_files_sha256[path])
-                    else:
-                        upload_list.append(path)
-                        uploaded_file_size += os.path.getsize(path)
-
-            elif sha256 not in sha256_to_remote_file:
-                i += 1
-                remote_filename = sha256
+            action, source = diff_engine.classify(path, sha256)
+            if action != SKIP and not stored_as_object(sha256):  # 相同内容的文件已分块或打包存储，只需更新索引
+                journal.add(path, sha256)
+            elif action == UPLOAD and config.Chunked_Upload_Size and file_stat.st_size >= config.Chunked_Upload_Size:
+                old_sha256 = remote_files_sha256.get(path)
+                if not config.Encrypted_Filename_With_Sha256 and old_sha256 and stored_as_object(old_sha256):
+                    replaced_objects.append(path)
+                uploader.submit(path, config.remote_base_dir + path, file_sha256=sha256, file_size=file_stat.st_size, chunked=True)
+            elif action == UPLOAD and file_stat.st_size < config.Pack_File_Size:
+                old_sha256 = remote_files_sha256.get(path)
+                if not config.Encrypted_Filename_With_Sha256 and old_sha256 and stored_as_object(old_sha256):
+                    replaced_objects.append(path)
                 try:
-                    oss.encrypt_and_upload_files(path, config.remote_base_dir + sha256_to_path(sha256), storage_class=config.default_storage_class,
-                                                 file_sha256=sha256)
-                except FileNotFoundError:
-                    logger.warning("上传时无法找到文件%s" % path)
-                    del (local_files_sha256[path])
-                except oss2.exceptions.RequestError:
-                    logger.warning("由于网络错误无法上传文件%s" % path)
-                    del (local_files_sha256[path])
+                    pack_store.add(path, sha256)
+                except (OSError, ValueError):
+                    logger.warning("文件%s在计算sha256之后被修改或删除，将在下次运行时重新上传" % path)
+                    del local_files_sha256[path]
                 else:
-                    upload_list.append(path)
-                    uploaded_file_size += os.path.getsize(path)
-                    sha256_to_remote_file[sha256] = sha256_to_path(sha256)
+                    packed_paths.setdefault(sha256, []).append((path, file_stat.st_size))
+                uploaded_file_size += process_pack_results(pack_store.completed())
+            elif action == SKIP:  # 远端同名文件的sha256相同，或以sha256作为文件名时远端已存在该文件
+                if config.Encrypted_Filename_With_Sha256:
+                    journal.add(path, sha256)
+            elif action == COPY:  # 远端存在同sha256文件则将本文件加入copy_list
+                copy_list[config.remote_base_dir + path] = config.remote_base_dir + source
+            elif not config.Encrypted_Filename_With_Sha256:  # 上传新增文件或覆盖远端文件
+                uploader.submit(path, config.remote_base_dir + path, file_sha256=sha256, file_size=file_stat.st_size,
+                                storage_class=config.default_storage_class, compare_sha256_before_uploading=args.compare_sha256_before_uploading)
+            else:
+                uploader.submit(path, config.remote_base_dir + sha256_to_path(sha256), file_sha256=sha256, file_size=file_stat.st_size,
+                                storage_class=config.default_storage_class)
+            uploaded_file_size += process_upload_results(uploader.completed())
+
+        del local_files
+        for path, file_stat in stream_paths.items():
+            progress.update(task, description="[red]正在上传文件", advance=1, filename=path)
+            uploader.submit(path, config.remote_base_dir + path, file_size=file_stat.st_size, stream=True, storage_class=config.default_storage_class)
+            uploaded_file_size += process_upload_results(uploader.completed())
+
+        progress.update(task, description="[red]正在等待上传完成", filename="")
+        uploaded_file_size += process_upload_results(uploader.join())
+        uploaded_file_size += process_pack_results(pack_store.join())
+
+    remote_prefix_length = len(config.remote_base_dir)
+    # 源文件在本地已被修改时，上传完成后再复制会得到新内容，改为直接上传
+    stale_copies = DiffEngine.stale_copies({dst_obj[remote_prefix_length:]: src_obj[remote_prefix_length:] for dst_obj, src_obj in copy_list.items()},
+                                           local_files_sha256)
+    if stale_copies:
+        for path in stale_copies:
+            del copy_list[config.remote_base_dir + path]
+            uploader.submit(path, config.remote_base_dir + path, file_sha256=local_files_sha256[path], storage_class=config.default_storage_class)
+        uploaded_file_size += process_upload_results(uploader.join())
 
     if len(copy_list) != 0:
-        total_size_to_be_copied = 0.0
-        src_obj_list = []
-        remote_prefix_length = len(config.remote_base_dir)
-        for dst_obj, src_obj in copy_list.items():
-            if src_obj not in src_obj_list:
-                src_obj_list.append(src_obj)
-                total_size_to_be_copied += oss.get_remote_file_size(src_obj)
+        src_obj_list = list(dict.fromkeys(copy_list.values()))  # 去重并保持顺序
+        src_sizes = {src_obj: oss.get_remote_file_size(src_obj) for src_obj in src_obj_list}
+        total_size_to_be_copied = float(sum(src_sizes.values()))
 
         if config.stored_in_DeepColdArchive:
             logger.info("后续通过生命周期将存储类型沉降为DeepColdArchive，直接进行上传操作")
             for dst_obj, src_obj in copy_list.items():
-                try:
-                    oss.encrypt_and_upload_files(dst_obj[remote_prefix_length:], dst_obj, storage_class=config.default_storage_class)
-                except FileNotFoundError:
-                    logger.warning("上传时无法找到文件%s" % dst_obj[remote_prefix_length:])
-                    del (local_files_sha256[dst_obj[remote_prefix_length:]])
-                except oss2.exceptions.RequestError:
-                    logger.warning("由于网络错误无法上传文件%s" % dst_obj[remote_prefix_length:])
-                    del (local_files_sha256[dst_obj[remote_prefix_length:]])
+                uploader.submit(dst_obj[remote_prefix_length:], dst_obj, file_sha256=local_files_sha256[dst_obj[remote_prefix_length:]],
+                                storage_class=config.default_storage_class)
+            process_upload_results(uploader.join(), record_upload=False)
         elif config.default_storage_class == oss2.BUCKET_STORAGE_CLASS_COLD_ARCHIVE and total_size_to_be_copied <= config.skip_restore_if_copied_file_is_less:
             logger.info("当前需要复制%s文件，小于%s，自动启动上传操作" % (bytes_to_str(total_size_to_be_copied), bytes_to_str(config.skip_restore_if_copied_file_is_less)))
             for dst_obj, src_obj in copy_list.items():
-                try:
-                    oss.encrypt_and_upload_files(dst_obj[remote_prefix_length:], dst_obj, storage_class=config.default_storage_class)
-                except FileNotFoundError:
-                    logger.warning("上传时无法找到文件%s" % dst_obj[remote_prefix_length:])
-                    del (local_files_sha256[dst_obj[remote_prefix_length:]])
-                except oss2.exceptions.RequestError:
-                    logger.warning("由于网络错误无法上传文件%s" % dst_obj[remote_prefix_length:])
-                    del (local_files_sha256[dst_obj[remote_prefix_length:]])
+                uploader.submit(dst_obj[remote_prefix_length:], dst_obj, file_sha256=local_files_sha256[dst_obj[remote_prefix_length:]],
+                                storage_class=config.default_storage_class)
+            process_upload_results(uploader.join(), record_upload=False)
         elif config.default_storage_class == oss2.BUCKET_STORAGE_CLASS_COLD_ARCHIVE and total_size_to_be_copied > config.skip_restore_if_copied_file_is_less:
             total_size_to_be_copied_GB = total_size_to_be_copied / (1024*1024*1024)
             plan_description = "\n总共需要复制%s文件。请输入对应的数字以选择处理方案：" \
@@ -266,55 +365,60 @@ if __name__ == "__main__":
 
             if plan_number == 0:
                 for dst_obj, src_obj in copy_list.items():
-                    try:
-                        oss.encrypt_and_upload_files(dst_obj[remote_prefix_length:], dst_obj, storage_class=config.default_storage_class)
-                    except FileNotFoundError:
-                        logger.warning("上传时无法找到文件%s" % dst_obj[remote_prefix_length:])
-                        del (local_files_sha256[dst_obj[remote_prefix_length:]])
-                    except oss2.exceptions.RequestError:
-                        logger.warning("由于网络错误无法上传文件%s" % dst_obj[remote_prefix_length:])
-                        del (local_files_sha256[dst_obj[remote_prefix_length:]])
+                    uploader.submit(dst_obj[remote_prefix_length:], dst_obj, file_sha256=local_files_sha256[dst_obj[remote_prefix_length:]],
+                                    storage_class=config.default_storage_class)
+                process_upload_results(uploader.join(), record_upload=False)
             else:
-                for src_obj in src_obj_list:
-                    oss.restore_remote_file(src_obj, restore_configuration=plan_number-1)
-                if plan_number == 1:
-                    time.sleep(3600)
-                    delay = 30
-                elif plan_number == 2:
-                    time.sleep(3600*2)
-                    delay = 60
-                else:
-                    time.sleep(3600*5)
-                    delay = 120
-
-                for src_obj in src_obj_list:
-                    while oss.check_restore_status(src_obj) != 200:
-                        time.sleep(delay)
-                oss.copy_remote_files(copy_list, storage_class=config.default_storage_class)
+                copy_with_progress(copy_list, src_sizes, restore=True, restore_configuration=plan_number-1)
             # https://help.aliyun.com/document_detail/51374.html#title-vi1-wio-4gv
             # https://www.aliyun.com/price/product#/oss/detail
         elif config.default_storage_class == oss2.BUCKET_STORAGE_CLASS_ARCHIVE:
-            for src_obj in src_obj_list:
-                oss.restore_remote_file(src_obj)
-            time.sleep(90)
-            while oss.check_restore_status(src_obj_list[-1]) == 200:
-                time.sleep(10)
-            oss.copy_remote_files(copy_list, storage_class=config.default_storage_class)
+            copy_with_progress(copy_list, src_sizes, restore=True)
         else:
-            oss.copy_remote_files(copy_list, storage_class=config.default_storage_class)
+            copy_with_progress(copy_list, src_sizes)
+        for dst_obj in copy_list:
+            if dst_obj[remote_prefix_length:] in local_files_sha256:  # 改为上传且上传失败的文件已从local_files_sha256中移除
+                journal.add(dst_obj[remote_prefix_length:], local_files_sha256[dst_obj[remote_prefix_length:]])
 
-    delete_list = []  # 需要删除的文件列表
+    # 需要删除的文件列表
     if not config.Encrypted_Filename_With_Sha256:
-        for path, sha256 in remote_files_sha256.items():
-            if path not in local_files_sha256:
-                delete_list.append(config.remote_base_dir + path)
+        delete_list = [config.remote_base_dir + path for path in diff_engine.deletions(local_files_sha256)]
     else:
-        sha256_to_local_file = list(local_files_sha256.values())
-        for sha256 in sha256_to_remote_file:
-            if sha256 not in sha256_to_local_file:
-                delete_list.append(config.remote_base_dir + sha256_to_path(sha256))
+        delete_list = [config.remote_base_dir + sha256_to_path(sha256) for sha256 in diff_engine.deletions(local_files_sha256)]
     if len(delete_list) != 0:
-        oss.delete_remote_files(delete_list)
+        if not config.Encrypted_Filename_With_Sha256:
+            failed_deletes = set(oss.delete_remote_files(delete_list + [sha256_sidecar_name(obj) for obj in delete_list]))
+            for obj in delete_list:
+                if obj not in failed_deletes:
+                    journal.delete(obj[len(config.remote_base_dir):])
+            index_to_keep = {obj[len(config.remote_base_dir):] for obj in delete_list if obj in failed_deletes}
+        else:
+            failed_deletes = set(oss.delete_remote_files(delete_list))
+            failed_sha256 = {obj[len(config.remote_base_dir):].replace("/", "") for obj in failed_deletes}
+            index_to_keep = {path for path, sha256 in remote_files_sha256.items() if sha256 in failed_sha256} if failed_sha256 else set()
+        if failed_deletes:  # 删除失败的文件保留在索引中，下次运行时重试
+            logger.warning("以下文件删除失败，将在下次运行时重试：\n" + str(sorted(failed_deletes)))
+    else:
+        index_to_keep = set()
+    # 分块或打包上传成功后，按文件名备份时路径上原有的Object已不再被索引引用
+    replaced_objects = [config.remote_base_dir + path for path in replaced_objects if path in local_files_sha256]
+    if replaced_objects:
+        failed_deletes = set(oss.delete_remote_files(replaced_objects + [sha256_sidecar_name(obj) for obj in replaced_objects]))
+        if failed_deletes:
+            logger.warning("以下已改为分块或打包存储的文件删除失败：\n" + str(sorted(failed_deletes)))
+    live_sha256 = set(local_files_sha256.values()) | {remote_files_sha256[path] for path in index_to_keep if path in remote_files_sha256}
+    try:
+        chunk_store.collect_garbage(live_sha256)
+        pack_store.collect_garbage(live_sha256)
+    except oss2.exceptions.RequestError:
+        logger.warning("由于网络错误无法清理不再被引用的块和包，将在下次运行时重试")
+
+    uploader.shutdown()
+    pack_store.shutdown()
+    if hash_cache:
+        hash_cache.prune(local_files_sha256)
+        logger.info("sha256缓存命中%d个文件，重新计算%d个文件" % (hash_cache.hits, hash_cache.misses))
+        hash_cache.close()
 
     try:
         with open(local_json_filename, 'w') as fobj:
@@ -327,9 +431,10 @@ if __name__ == "__main__":
 
     ######################################################################
     try:
-        oss.encrypt_and_upload_files(local_json_filename, json_on_oss, storage_class='Standard', compare_sha256_before_uploading=True)
+        journal.reconcile(local_files_sha256, keep=index_to_keep)
+        journal.close()
     except oss2.exceptions.RequestError:
-        logger.warning("由于网络错误无法上传文件%s" % local_json_filename)
+        logger.warning("由于网络错误无法上传索引，本地索引已保存至%s" % local_json_filename)
 
     if not config.Encrypted_Filename_With_Sha256:
         logger.info("已复制的文件列表:\n" + str(copy_list).replace("': '", "' <-- '"))
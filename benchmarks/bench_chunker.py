@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""内容定义分块基准测试：Chunker与逐字节计算Gear滚动哈希的FastCDC实现对比
+
+分别测试随机数据和文本数据的分块速度、块大小分布，以及在文件中间插入/删除少量字节后需要重新上传的块数。
+逐字节实现速度很慢，只在前--reference_mb MB数据上运行
+
+用法: python benchmarks/bench_chunker.py [--size_mb 256] [--reference_mb 32] [--min 524288] [--avg 2097152] [--max 8388608]
+"""
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from units.chunker import Chunker  # noqa: E402
+
+
+class GearChunker(object):
+    """FastCDC的直接实现：逐字节更新Gear哈希，归一化分块"""
+
+    def __init__(self, min_size: int, avg_size: int, max_size: int, seed: int = 0):
+        rng = random.Random(seed)
+        self.gear = [rng.getrandbits(64) for _ in range(256)]
+        self.min_size, self.avg_size, self.max_size = min_size, avg_size, max_size
+        bits = avg_size.bit_length() - 1
+        self.strict_mask = ((1 << (bits + 2)) - 1) << (64 - bits - 2)
+        self.loose_mask = ((1 << (bits - 2)) - 1) << (64 - bits + 2)
+
+    def cut(self, data, start: int, end: int) -> int:
+        if end - start <= self.min_size:
+            return end
+        normal = start + min(self.avg_size, end - start)
+        limit = start + min(self.max_size, end - start)
+        gear, value = self.gear, 0
+        for position in range(start + self.min_size, limit):
+            value = ((value << 1) + gear[data[position]]) & 0xFFFFFFFFFFFFFFFF
+            if not value & (self.strict_mask if position < normal else self.loose_mask):
+                return position + 1
+        return limit
+
+
+def synthetic_text(size: int, seed: int = 0) -> bytes:
+    """生成类似日志/SQL转储的文本"""
+    rng = random.Random(seed)
+    words = [bytes(rng.choice(b"abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 10))) for _ in range(5000)]
+    lines = []
+    length = 0
+    while length < size:
+        line = b"%d INSERT INTO t VALUES (%d, '" % (length, rng.randrange(10 ** 9)) + b" ".join(rng.choices(words, k=rng.randint(3, 20))) + b"');\n"
+        lines.append(line)
+        length += len(line)
+    return b"".join(lines)[:size]
+
+
+def split(chunker, data) -> list:
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = chunker.cut(data, start, len(data))
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+def new_chunks(chunker, data: bytes, edited: bytes) -> int:
+    """编辑后的数据中远端不存在的块数"""
+    known = {hashlib.sha256(chunk).digest() for chunk in split(chunker, data)}
+    return sum(hashlib.sha256(chunk).digest() not in known for chunk in split(chunker, edited))
+
+
+def report(name: str, chunker, data: bytes, edits: dict):
+    start = time.perf_counter()
+    sizes = [len(chunk) for chunk in split(chunker, data)]
+    elapsed = time.perf_counter() - start
+    print("  %-8s %7.1f MB/s  块数%5d  平均%6.2f MB  中位数%6.2f MB  最大块占比%5.1f%%" %
+          (name, len(data) / elapsed / 1024 / 1024, len(sizes), statistics.mean(sizes) / 1024 / 1024, statistics.median(sizes) / 1024 / 1024,
+           100 * sum(size == chunker.max_size for size in sizes) / len(sizes)))
+    print("           " + "  ".join("%s: %d个新块" % (edit, new_chunks(chunker, data, edited)) for edit, edited in edits.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size_mb', type=int, default=256)
+    parser.add_argument('--reference_mb', type=int, default=32)
+    parser.add_argument('--min', type=int, default=1024 * 512)
+    parser.add_argument('--avg', type=int, default=1024 * 1024 * 2)
+    parser.add_argument('--max', type=int, default=1024 * 1024 * 8)
+    args = parser.parse_args()
+
+    chunker = Chunker(args.min, args.avg, args.max)
+    reference = GearChunker(args.min, args.avg, args.max)
+    size = args.size_mb * 1024 * 1024
+    for kind, data in (("随机数据", os.urandom(size)), ("文本数据", synthetic_text(size))):
+        middle = len(data) // 2
+        edits = {"插入1字节": data[:middle] + b"x" + data[middle:], "删除100字节": data[:middle] + data[middle + 100:],
+                 "覆盖4KB": data[:middle] + os.urandom(4096) + data[middle + 4096:]}
+        print("%s(%d MB)：" % (kind, args.size_mb))
+        report("Chunker", chunker, data, edits)
+        # 逐字节实现只在较小的数据上运行
+        small = data[:args.reference_mb * 1024 * 1024]
+        middle = len(small) // 2
+        report("Gear", reference, small, {"插入1字节": small[:middle] + b"x" + small[middle:]})
+
+    # 通过Chunker.chunks分块整个文件，与上传时的路径相同
+    with tempfile.NamedTemporaryFile() as fobj:
+        fobj.write(os.urandom(size))
+        fobj.flush()
+        start = time.perf_counter()
+        count = sum(1 for _ in chunker.chunks(fobj.name))
+        print("文件分块(readinto)：%.1f MB/s，%d个块" % (size / (time.perf_counter() - start) / 1024 / 1024, count))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""同步计划生成基准测试：DiffEngine与原先基于列表查找的实现对比
+
+原实现的复制源去重和按sha256删除的判断都是列表查找，复杂度为O(n²)，只在--legacy_limit以内的规模上运行
+
+用法: python benchmarks/bench_diff_engine.py [--sizes 100000,1000000,5000000] [--legacy_limit 20000]
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from units.diff_engine import DiffEngine  # noqa: E402
+
+
+def synthetic_snapshots(count: int, seed: int = 0):
+    """生成远端索引和本地快照：各1%的文件被修改、重命名、删除和新增
+
+    Returns:
+        tuple: (远端{路径: sha256}, 本地{路径: sha256})
+    """
+    rng = random.Random(seed)
+    remote = {"dir%d/sub%d/file%d.dat" % (i % 1000, i % 37, i): hashlib.sha256(b"%d" % i).hexdigest() for i in range(count)}
+    local = dict(remote)
+    paths = list(remote)
+    for path in rng.sample(paths, count // 25):
+        action = rng.randrange(4)
+        if action == 0:
+            local[path] = hashlib.sha256(path.encode() + b"modified").hexdigest()
+        elif action == 1:
+            local["renamed/" + path] = local.pop(path)
+        elif action == 2:
+            del local[path]
+        else:
+            local["new/" + path] = hashlib.sha256(path.encode() + b"new").hexdigest()
+    return remote, local
+
+
+def legacy_plan(remote: dict, local: dict):
+    sha256_to_remote_file = {sha256: path for path, sha256 in remote.items()}
+    copy_list = {}
+    for path, sha256 in local.items():
+        if remote.get(path) != sha256 and sha256 in sha256_to_remote_file:
+            copy_list[path] = sha256_to_remote_file[sha256]
+    src_obj_list = []
+    for src_obj in copy_list.values():
+        if src_obj not in src_obj_list:
+            src_obj_list.append(src_obj)
+    sha256_to_local_file = list(local.values())
+    delete_list = [sha256 for sha256 in sha256_to_remote_file if sha256 not in sha256_to_local_file]
+    return src_obj_list, delete_list
+
+
+def engine_plan(remote: dict, local: dict, by_sha256: bool):
+    sha256_to_remote_file = {sha256: path for path, sha256 in remote.items()}
+    engine = DiffEngine(remote, sha256_to_remote_file, by_sha256=by_sha256)
+    plan = engine.diff(local)
+    return list(dict.fromkeys(plan.copy.values())), plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default="100000,1000000,5000000")
+    parser.add_argument('--legacy_limit', type=int, default=20000)
+    args = parser.parse_args()
+
+    for size in (int(size) for size in args.sizes.split(',')):
+        remote, local = synthetic_snapshots(size)
+        print("文件数：%d" % size)
+        for by_sha256 in (False, True):
+            start = time.perf_counter()
+            src_obj_list, plan = engine_plan(remote, local, by_sha256)
+            print("  DiffEngine(by_sha256=%s)：%.2fs  上传%d 复制%d 删除%d 跳过%d" %
+                  (by_sha256, time.perf_counter() - start, len(plan.upload), len(plan.copy), len(plan.delete), len(plan.skip)))
+        if size <= args.legacy_limit:
+            start = time.perf_counter()
+            legacy_src, legacy_delete = legacy_plan(remote, local)
+            print("  列表查找实现：%.2fs" % (time.perf_counter() - start))
+            _, sha256_plan = engine_plan(remote, local, True)
+            if set(legacy_delete) != set(sha256_plan.delete) or legacy_src != engine_plan(remote, local, False)[0]:
+                raise SystemExit("DiffEngine与原实现的结果不一致")
+        del remote, local
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""客户端加密基准测试：RsaProvider与EnvelopeCryptoProvider加解密小文件的速度
+
+不访问OSS和KMS，KMS由本地的FakeKms代替并统计请求次数。每个文件依次执行上传时的create_content_material和加密，
+以及下载时的解密密钥、解密IV和解密内容
+
+用法: python benchmarks/bench_envelope_encryption.py [--files 2000] [--size 4096] [--max_uses 10000]
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.modules.setdefault('config', types.SimpleNamespace(OSSAccessKeyId='', OSSAccessKeySecret='', KMSRegion='', CMKID=''))
+import oss2  # noqa: E402
+from Crypto.PublicKey import RSA  # noqa: E402
+
+from units.envelope_encryption import EnvelopeCryptoProvider  # noqa: E402
+
+
+class FakeKms(object):
+    """本地的KMS替身，接口与KmsDataKeys相同"""
+
+    def __init__(self):
+        self.requests = 0
+        self.__keys = {}
+
+    def generate_data_key(self) -> tuple:
+        self.requests += 1
+        data_key, ciphertext_blob = os.urandom(32), base64.b64encode(os.urandom(48)).decode()
+        self.__keys[ciphertext_blob] = data_key
+        return data_key, ciphertext_blob
+
+    def decrypt(self, ciphertext_blob: str) -> bytes:
+        self.requests += 1
+        return self.__keys[ciphertext_blob]
+
+
+def run(name: str, provider, files: list, kms: FakeKms = None):
+    start = time.perf_counter()
+    for data in files:
+        material = provider.create_content_material()
+        encrypted = material.cipher.encrypt(data)
+        cipher = oss2.utils.AESCTRCipher()
+        cipher.initialize(provider.decrypt_encrypted_key(material.encrypted_key), provider.decrypt_encrypted_iv(material.encrypted_iv))
+        assert cipher.decrypt(encrypted) == data
+    elapsed = time.perf_counter() - start
+    print("%-10s %8.0f 文件/s  %6.3f ms/文件%s" % (name, len(files) / elapsed, elapsed / len(files) * 1000,
+                                              "  KMS请求%d次" % kms.requests if kms else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=4096)
+    parser.add_argument('--max_uses', type=int, default=10000)
+    args = parser.parse_args()
+
+    files = [os.urandom(args.size) for _ in range(args.files)]
+    key = RSA.generate(2048)
+    run("RSA", oss2.crypto.RsaProvider({'private_key': key.export_key().decode(), 'public_key': key.publickey().export_key().decode()}),
+        files)
+    kms = FakeKms()
+    run("Envelope", EnvelopeCryptoProvider(kms, max_uses=args.max_uses), files, kms)
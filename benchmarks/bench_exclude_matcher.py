@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""排除规则匹配基准测试：逐个fnmatchcase与编译后的ExcludeMatcher对比
+
+用法: python benchmarks/bench_exclude_matcher.py [--paths 1000000] [--patterns 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from fnmatch import fnmatchcase
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from units.exclude_matcher import ExcludeMatcher  # noqa: E402
+
+
+def synthetic_paths(count: int, seed: int = 0) -> list:
+    """生成类似NAS目录结构的相对路径"""
+    rng = random.Random(seed)
+    top = ["personal/", "www/nextcloud/data/"]
+    dirs = ["photos", "docs", ".recycle", "cache", "2019", "2020", "2021", "node_modules", "thumbnails", "projects"]
+    exts = [".jpg", ".png", ".txt", ".log", ".tmp", ".mp4", ".sql", ".json"]
+    paths = []
+    for i in range(count):
+        depth = rng.randint(1, 6)
+        parts = [rng.choice(dirs) + str(rng.randint(0, 30) if rng.random() < 0.5 else "") for _ in range(depth)]
+        paths.append(rng.choice(top) + "/".join(parts) + "/file%d%s" % (i, rng.choice(exts)))
+    return paths
+
+
+def synthetic_patterns(count: int) -> list:
+    patterns = ['*/.recycle/*', '*/node_modules/*', '*.tmp', '*/cache*/*', 'personal/photos1/*']
+    i = 0
+    while len(patterns) < count:
+        patterns.append('personal/docs%d/*' % i)
+        patterns.append('*/thumbnails%d/*.png' % i)
+        i += 1
+    return patterns[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paths', type=int, default=1000000)
+    parser.add_argument('--patterns', type=int, default=20)
+    args = parser.parse_args()
+
+    paths = synthetic_paths(args.paths)
+    patterns = synthetic_patterns(args.patterns)
+    print("路径数：%d，模式数：%d" % (len(paths), len(patterns)))
+
+    start = time.perf_counter()
+    baseline = [any(fnmatchcase(path, pattern) for pattern in patterns) for path in paths]
+    baseline_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = ExcludeMatcher(patterns)
+    compiled = [matcher.match_file(path) for path in paths]
+    compiled_time = time.perf_counter() - start
+
+    if baseline != compiled:
+        raise SystemExit("ExcludeMatcher与fnmatchcase的结果不一致")
+    directories = {path.rsplit('/', 1)[0] for path in paths}
+    pruned = sum(1 for directory in directories if matcher.match_dir(directory))
+    print("fnmatchcase循环：%.2fs" % baseline_time)
+    print("ExcludeMatcher：%.2fs (%.1fx)" % (compiled_time, baseline_time / compiled_time))
+    print("排除的文件数：%d，可整体跳过的目录：%d / %d" % (sum(compiled), pruned, len(directories)))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""启动时间基准测试：用python -X importtime测量各模块的导入耗时
+
+每个模块在独立的子进程中导入多次取中位数，并列出导入时加载的较重依赖和自身耗时最多的模块。
+config.py不存在时使用config.pyexample.py。超过--max_ms或--forbid中的模块被导入时以非0状态退出，可以在CI或cron中检查启动时间的退化
+
+用法: python benchmarks/bench_import_time.py [--runs 5] [--top 10] [--max_ms 0] [--forbid numpy] [模块 ...]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["oss_sync_libs", "units.parallel_hash", "units.chunk_store", "units.pack_store", "units.envelope_encryption",
+                   "backup", "restore"]
+HEAVY = ["oss2", "requests", "rich", "Crypto", "aliyunsdkcore", "alibabacloud_kms20160120", "aiohttp", "numpy"]
+
+
+def import_time(module: str, env: dict) -> tuple:
+    """在子进程中导入module
+
+    Returns:
+        tuple: (总耗时(微秒), {模块: 自身耗时(微秒)})
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], cwd=ROOT, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError("导入%s失败：\n%s" % (module, result.stderr[-2000:]))
+    total, self_times = 0, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if name.strip() == "site":  # 解释器启动时site导入的模块与被测模块无关
+            self_times = {}
+            continue
+        self_times[name.strip()] = int(self_us)
+        if name.strip() == module:
+            total = int(cumulative_us)
+    return total, self_times
+
+
+def loaded(package: str, self_times: dict) -> bool:
+    return any(name == package or name.startswith(package + ".") for name in self_times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='列出自身耗时最多的模块数')
+    parser.add_argument('--max_ms', type=float, default=0, help='任一模块导入耗时超过此值时失败，0为不检查')
+    parser.add_argument('--forbid', nargs='*', default=["numpy"], help='导入时不应加载的依赖')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    config_dir = None
+    if not os.path.exists(os.path.join(ROOT, "config.py")):
+        config_dir = tempfile.mkdtemp()
+        shutil.copy(os.path.join(ROOT, "config.pyexample.py"), os.path.join(config_dir, "config.py"))
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [config_dir, ROOT, env.get("PYTHONPATH")]))
+
+    failed = []
+    try:
+        for module in args.modules:
+            totals = []
+            for _ in range(max(1, args.runs)):
+                total, self_times = import_time(module, env)
+                totals.append(total)
+            median_ms = statistics.median(totals) / 1000
+            print("%-28s %8.1f ms  加载的较重依赖: %s" % (module, median_ms, ", ".join(name for name in HEAVY if loaded(name, self_times)) or "无"))
+            for name, self_us in sorted(self_times.items(), key=lambda item: -item[1])[:args.top]:
+                print("    %-40s %8.1f ms" % (name, self_us / 1000))
+            if args.max_ms and median_ms > args.max_ms:
+                failed.append("%s导入耗时%.1f ms，超过%.1f ms" % (module, median_ms, args.max_ms))
+            failed += ["%s导入了%s" % (module, name) for name in args.forbid if loaded(name, self_times)]
+    finally:
+        if config_dir:
+            shutil.rmtree(config_dir)
+    if failed:
+        print("\n".join(failed), file=sys.stderr)
+        sys.exit(1)
@@ -1,23 +1,26 @@
 # -*- coding: utf-8 -*-
 import argparse
 import hashlib
+import json
 import logging
 import os
 import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
-from time import sleep
-
-from Crypto.PublicKey import RSA
-import oss2
-import requests
-from numpy import square
-from rich.progress import ProgressColumn, Text
-from tenacity import (retry, retry_if_exception_type, stop_after_attempt,
-                      wait_exponential)
 
 import config
-
+from units.compression import CODEC_HEADER, NONE, SIZE_HEADER, Compressor, decompress_file, decompressor
+from units.lazy_import import lazy_import
+from units.rate_limiter import RateLimiter
+from units.retry_policy import PERMANENT, RetryPolicy, classify
+
+# 只计算sha256等不访问OSS的场景(包括进程池的工作进程)不需要导入oss2、requests和rich，首次使用时才导入
+oss2 = lazy_import("oss2")
+requests = lazy_import("requests")
 logger = logging.getLogger("oss_sync_libs")
+WRAP_ALGORITHM_MISMATCH = 'Envelope encryption/decryption algorithm is inconsistent'  # oss2读取由其他Provider加密的Object时的错误信息
 
 
 class Colored(object):
@@ -63,10 +66,6 @@ class Colored(object):
 
 
 color = Colored()
-try:
-    import crcmod._crcfunext
-except ModuleNotFoundError:
-    input("%s crcmod的C扩展模式安装失败，会造成上传文件效率低下，请参考 https://help.aliyun.com/document_detail/85288.html#h2-url-5 安装devel。\n按ENTER键继续..." % (color.red('[Warning]')))
 
 
 def sct_push(title: str, message: str) -> bool:
@@ -81,52 +80,128 @@ def sct_push(title: str, message: str) -> bool:
         return False
 
 
-class FileCount(ProgressColumn):
-    """呈现剩余文件数量和总数, e.g. '已处理 666 / 共 23333 个文件'."""
+def __getattr__(name):
+    # FileCount继承自rich的ProgressColumn，只在使用进度条的脚本导入时才创建，避免其他场景导入rich
+    if name == 'FileCount':
+        from rich.progress import ProgressColumn, Text
+
+        class FileCount(ProgressColumn):
+            """呈现剩余文件数量和总数, e.g. '已处理 666 / 共 23333 个文件'."""
+
+            def render(self, task):
+                return Text(f"已处理 {int(task.completed)} / 共 {int(task.total)} 个文件", style="progress.download")
+
+        globals()['FileCount'] = FileCount
+        return FileCount
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-    def render(self, task):
-        return Text(f"已处理 {int(task.completed)} / 共 {int(task.total)} 个文件", style="progress.download")
+
+_hash_buffer = threading.local()
+
+
+def fadvise(fd: int, advice: str):
+    """对整个文件调用posix_fadvise，不支持的平台上什么也不做
+
+    Args:
+        fd (int): 文件描述符
+        advice (str): SEQUENTIAL或DONTNEED
+    """
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, getattr(os, 'POSIX_FADV_' + advice))
+        except OSError:
+            pass
 
 
 def calculate_local_file_sha256(file_name: str):
     """计算sha256
 
+    使用每个线程独立、可复用的固定大小缓冲区读取文件，内存占用与文件大小无关；读取完成后通知内核丢弃该文件的页缓存，避免挤占其他服务的缓存
+
     Args:
         file_name (str): 需要计算sha256的文件名
 
     Returns:
         str: 文件的sha256
     """
+    buffer = getattr(_hash_buffer, 'buffer', None)
+    if buffer is None or len(buffer) != config.Hash_Buffer_Size:
+        buffer = _hash_buffer.buffer = bytearray(config.Hash_Buffer_Size)
+    view = memoryview(buffer)
     m = hashlib.sha256()
     try:
-        with open(file_name, 'rb') as fobj:
-            if os.path.getsize(file_name) > config.MaxMemoryUsageAllow:
-                while True:
-                    data = fobj.read(config.MaxMemoryUsageAllow)
-                    if not data:
-                        break
-                    m.update(data)
-            else:
-                m.update(fobj.read())
+        with open(file_name, 'rb', buffering=0) as fobj:
+            fadvise(fobj.fileno(), 'SEQUENTIAL')
+            while True:
+                size = fobj.readinto(buffer)
+                if not size:
+                    break
+                m.update(view[:size])
+            fadvise(fobj.fileno(), 'DONTNEED')
     except:
         logger.exception("[calculate_local_file_sha256] Fail to open the file: %s", file_name)
         return False
+    finally:
+        view.release()
     return m.hexdigest()
 
 
+def sha256_sidecar_name(remote_object_name: str) -> str:
+    """单次读取上传的Object在上传开始时sha256未知，其sha256记录在此sidecar object的Header中"""
+    return "index/sha256-sidecar/" + remote_object_name
+
+
+def sha256_to_path(__sha256: str) -> str:
+    """将sha256字符串转换为目录结构
+    """
+    if len(__sha256) != 64:
+        logger.error("[sha256_to_path]不正确的输入\"%s\"" % str(__sha256))
+        raise ValueError
+    __str_list = list(__sha256)
+    __str_list.insert(1, "/")
+    __str_list.insert(5, "/")
+    return "".join(__str_list)
+
+
+_http_session = None  # 检测网络连接时复用连接
+_oss_session = None
+_oss_session_lock = threading.Lock()
+
+
+def oss_session() -> 'oss2.Session':
+    """进程内所有oss2.Bucket共用的HTTP会话
+
+    oss2默认每个Bucket创建独立的连接池且只保留10个连接，并发线程数大于连接池大小时多出的连接在请求结束后被丢弃，下一次请求需要重新建立TCP和TLS连接
+    """
+    global _oss_session
+    with _oss_session_lock:
+        if _oss_session is None:
+            _oss_session = oss2.Session(pool_size=config.Connection_Pool_Size)
+        return _oss_session
+
+
 def check_connection_status():
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
     try:
-        requests.get("https://" + config.OssEndpoint, timeout=1)
+        _http_session.head("https://" + config.OssEndpoint, timeout=1)
     except requests.exceptions.ConnectionError:
         return False
     return True
 
 
-class OssOperation(object):  # TODO 使用@retry重写重试部分
+class OssOperation(object):
 
     def __init__(self, rsa_passphrase=None):
 
+        from Crypto.PublicKey import RSA
+
         oss2.set_file_logger(config.LogFile, 'oss2', config.LogLevel)
+        try:
+            import crcmod._crcfunext  # noqa: F401
+        except ModuleNotFoundError:
+            logger.warning("crcmod的C扩展模式安装失败，会造成上传文件效率低下，请参考 https://help.aliyun.com/document_detail/85288.html#h2-url-5 安装devel")
 
         __rsa_key_pair = {}  # 初始化密钥对
         if config.rsa_private_key:
@@ -151,11 +226,28 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
 
         self.__OssEndpoint = 'https://' + config.OssEndpoint
 
+        # 新上传的文件使用Envelope_Encryption选择的加密方式；另一种方式可用时，由它加密的已有文件通过__fallback_bucket读取
+        rsa_provider = oss2.crypto.RsaProvider(__rsa_key_pair, passphrase=rsa_passphrase)
+        envelope_provider = None
+        if config.Envelope_Encryption or config.CMKID:
+            from units.envelope_encryption import EnvelopeCryptoProvider
+            envelope_provider = EnvelopeCryptoProvider(max_uses=config.Data_Key_Max_Uses, max_age=config.Data_Key_Max_Age)
+        if config.Envelope_Encryption:
+            crypto_provider, fallback_provider = envelope_provider, rsa_provider if config.rsa_private_key else None
+        else:
+            crypto_provider, fallback_provider = rsa_provider, envelope_provider
         self.__bucket = oss2.CryptoBucket(
             oss2.Auth(config.OSSAccessKeyId, config.OSSAccessKeySecret),
             self.__OssEndpoint, config.bucket_name,
-            crypto_provider=oss2.crypto.RsaProvider(__rsa_key_pair, passphrase=rsa_passphrase)
+            crypto_provider=crypto_provider, session=oss_session()
             )
+        self.__fallback_bucket = None
+        if fallback_provider is not None:
+            self.__fallback_bucket = oss2.CryptoBucket(oss2.Auth(config.OSSAccessKeyId, config.OSSAccessKeySecret), self.__OssEndpoint,
+                                                       config.bucket_name, crypto_provider=fallback_provider, session=oss_session())
+        # CryptoBucket不支持分片复制，分片复制直接复制密文，使用普通Bucket即可
+        self.__plain_bucket = oss2.Bucket(oss2.Auth(config.OSSAccessKeyId, config.OSSAccessKeySecret), self.__OssEndpoint, config.bucket_name,
+                                          session=oss_session())
 
         try:  # 检测Bucket是否存在
             self.__bucket.get_bucket_info()
@@ -169,9 +261,26 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
 
         self.__restore_configuration_model = [oss2.models.RESTORE_TIER_EXPEDITED, oss2.models.RESTORE_TIER_STANDARD, oss2.models.RESTORE_TIER_BULK]
         self.__multipart_upload_size = 1024 * 1024 * 50  # 上传分片大小
+        self.__limiter = RateLimiter.from_config()  # 所有OSS请求共用的速率限制
+        self.__versioning = None  # Bucket是否开启了版本控制，首次删除文件时获取
+        self.__delete_policy = RetryPolicy.from_config("delete")
+        self.__compressor = Compressor.from_config()  # 上传前的可选压缩，索引中的sha256始终为原文件的sha256
 
         del __rsa_key_pair, rsa_passphrase
 
+    def __crypto_read(self, read):
+        """使用self.__bucket读取Object，Object由另一种加密方式(RSA/信封加密)加密时改用self.__fallback_bucket
+
+        Args:
+            read (callable): read(bucket)，返回读取结果
+        """
+        try:
+            return read(self.__bucket)
+        except oss2.exceptions.InconsistentError as err:
+            if self.__fallback_bucket is None or WRAP_ALGORITHM_MISMATCH not in str(err):
+                raise
+        return read(self.__fallback_bucket)
+
     def encrypt_and_upload_files(self, local_file_name, remote_object_name, storage_class='Standard', file_sha256=None, cache_control='no-store',
                                  compare_sha256_before_uploading=False):
         """使用KMS加密并上传文件
@@ -198,38 +307,150 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
             if remote_object_sha256 == file_sha256:
                 logger.info("[encrypt_and_upload_files]sha256相同，跳过%s文件的上传" % local_file_name)
                 return 200
-        retry_count = 0
-        while True:
-            try:
-                retry_count += 1
-                oss2.resumable_upload(
-                    self.__bucket, remote_object_name, local_file_name,
-                    store=oss2.ResumableStore(root=config.temp_dir),
-                    multipart_threshold=self.__multipart_upload_size,
-                    part_size=self.__multipart_upload_size,
-                    num_threads=4,
-                    headers={
-                        "Cache-Control": cache_control,
-                        "Content-Type": "application/octet-stream",
-                        "x-oss-server-side-encryption": "KMS",
-                        "x-oss-storage-class": storage_class,
-                        "x-oss-meta-sha256": file_sha256
-                        }
-                    )
-                break
-            except (oss2.exceptions.ClientError, oss2.exceptions.RequestError, ConnectionResetError) as err:
-                if retry_count < config.Max_Retries:
-                    logger.error("[encrypt_and_upload_files] error, retrying time %d" % retry_count)
-                    logger.error(err)
-                else:
-                    logger.exception("[encrypt_and_upload_files] Error")
-                    raise oss2.exceptions.RequestError
-                sleep(square(retry_count) * 10)
-                while not check_connection_status():
-                    logger.error("无法连接网络，10秒后重试")
-                    sleep(10)
+        codec = self.__compressor.choose(local_file_name)
+        if codec == NONE:
+            self.__resumable_upload(local_file_name, remote_object_name, storage_class, file_sha256, cache_control)
+            return 200
+        # 压缩后的文件名由远程文件名和sha256确定，上次运行中断时留下的压缩文件和断点续传记录可以继续使用
+        compressed_file_name = config.temp_dir + hashlib.md5((remote_object_name + file_sha256).encode('utf-8')).hexdigest() + "." + codec
+        if not os.path.exists(compressed_file_name):  # 已存在时不重新压缩，否则修改时间改变，oss2会丢弃断点续传记录
+            self.__compressor.compress_file(local_file_name, compressed_file_name + ".tmp")
+            os.replace(compressed_file_name + ".tmp", compressed_file_name)
+        try:
+            self.__resumable_upload(compressed_file_name, remote_object_name, storage_class, file_sha256, cache_control, codec,
+                                    os.path.getsize(local_file_name))
+        except Exception as err:
+            if classify(err) == PERMANENT:  # 重试也不会成功，不再保留
+                self.__discard_resumable_upload(compressed_file_name, remote_object_name)
+            raise
+        os.remove(compressed_file_name)
         return 200
 
+    def __discard_resumable_upload(self, local_file_name, remote_object_name):
+        """删除断点续传记录、中止其分片上传并删除local_file_name"""
+        store = oss2.ResumableStore(root=config.temp_dir)
+        store_key = store.make_store_key(self.__bucket.bucket_name, remote_object_name, local_file_name)
+        record = store.get(store_key)
+        if record:
+            try:
+                self.__bucket.abort_multipart_upload(remote_object_name, record['upload_id'])
+            except oss2.exceptions.OssError:
+                pass
+            store.delete(store_key)
+        os.remove(local_file_name)
+
+    @RetryPolicy.from_config("upload")
+    def __resumable_upload(self, local_file_name, remote_object_name, storage_class, file_sha256, cache_control, codec=NONE, plain_size=None):
+        """断点续传上传，重试时从已上传的分片继续，压缩的内容在Header中记录压缩方式和原文件大小"""
+        headers = {
+            "Cache-Control": cache_control,
+            "Content-Type": "application/octet-stream",
+            "x-oss-server-side-encryption": "KMS",
+            "x-oss-storage-class": storage_class,
+            "x-oss-meta-sha256": file_sha256
+            }
+        if codec != NONE:
+            headers[CODEC_HEADER] = codec
+            headers[SIZE_HEADER] = str(plain_size)
+        file_size = os.path.getsize(local_file_name)
+        self.__limiter.acquire_request(-(-file_size // self.__multipart_upload_size) + 2 if file_size >= self.__multipart_upload_size else 1)
+        oss2.resumable_upload(
+            self.__bucket, remote_object_name, local_file_name,
+            store=oss2.ResumableStore(root=config.temp_dir),
+            multipart_threshold=self.__multipart_upload_size,
+            part_size=self.__multipart_upload_size,
+            num_threads=4,
+            progress_callback=self.__limiter.progress_callback(),
+            headers=headers
+            )
+
+    def stream_upload_file(self, local_file_name: str, remote_object_name: str, storage_class='Standard', cache_control='no-store',
+                           num_threads: int = 4) -> str:
+        """单次读取上传，同一份数据块同时用于计算sha256、crc64和加密上传，磁盘只读取一次
+
+        上传开始时文件的sha256未知，因此sha256记录在sidecar object(见sha256_sidecar_name)的Header中
+
+        Args:
+            local_file_name (str): 本地文件路径
+            remote_object_name (str): 远程文件路径
+            storage_class (str, 可选): Object的存储类型，取值：Standard、IA、Archive和ColdArchive。默认值为Standard
+            cache_control (str, 可选)
+            num_threads (int, 可选): 同时上传的分片数，内存占用约为(num_threads + 1) * 分片大小
+
+        Returns:
+            str: 文件的sha256
+        """
+        if storage_class not in ["Standard", "IA", "Archive", "ColdArchive"]:
+            logger.warning("[stream_upload_file]上传文件%s时，storage_class错误" % local_file_name)
+            storage_class = "Standard"
+        file_size = os.path.getsize(local_file_name)
+        upload_context = oss2.models.MultipartUploadCryptoContext(data_size=file_size, part_size=self.__multipart_upload_size)
+        headers = {
+            "Cache-Control": cache_control,
+            "Content-Type": "application/octet-stream",
+            "x-oss-server-side-encryption": "KMS",
+            "x-oss-storage-class": storage_class
+            }
+        sha256 = hashlib.sha256()
+        parts = []
+        with open(local_file_name, 'rb') as fobj:
+            fadvise(fobj.fileno(), 'SEQUENTIAL')
+            upload_id = self.__init_stream_upload(remote_object_name, headers, upload_context)
+            completed = False
+            try:
+                with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                    futures = deque()
+                    part_number = 1
+                    while True:
+                        data = fobj.read(self.__multipart_upload_size)
+                        if not data:
+                            break
+                        sha256.update(data)
+                        futures.append(executor.submit(self.__upload_part, remote_object_name, upload_id, part_number, data, upload_context))
+                        part_number += 1
+                        del data
+                        if len(futures) >= num_threads:
+                            parts.append(futures.popleft().result())
+                    while futures:
+                        parts.append(futures.popleft().result())
+                fadvise(fobj.fileno(), 'DONTNEED')
+                self.__complete_stream_upload(remote_object_name, upload_id, parts)
+                completed = True
+            finally:
+                if not completed:  # 任何异常(包括中断)都中止分片上传，否则已上传的分片会一直计费
+                    logger.error("[stream_upload_file] 上传%s失败，中止分片上传" % local_file_name)
+                    try:
+                        self.__bucket.abort_multipart_upload(remote_object_name, upload_id)
+                    except oss2.exceptions.OssError:
+                        pass
+        file_sha256 = sha256.hexdigest()
+        self.__put_sha256_sidecar(remote_object_name, file_sha256, cache_control)
+        return file_sha256
+
+    @RetryPolicy.from_config("upload")
+    def __init_stream_upload(self, remote_object_name, headers, upload_context) -> str:
+        self.__limiter.acquire_request()
+        return self.__bucket.init_multipart_upload(remote_object_name, headers=headers, upload_context=upload_context).upload_id
+
+    @RetryPolicy.from_config("upload")
+    def __complete_stream_upload(self, remote_object_name, upload_id, parts):
+        # CryptoBucket.complete_multipart_upload会把任何错误变为TypeError(except exceptions)，无法按类型重试；完成分片上传不涉及加密，使用普通Bucket
+        self.__limiter.acquire_request()
+        self.__plain_bucket.complete_multipart_upload(remote_object_name, upload_id, parts)
+
+    @RetryPolicy.from_config("upload")
+    def __put_sha256_sidecar(self, remote_object_name, file_sha256, cache_control='no-store'):
+        self.__limiter.acquire_request()
+        self.__bucket.put_object(sha256_sidecar_name(remote_object_name), b'',
+                                 headers={"Cache-Control": cache_control, "x-oss-storage-class": "Standard", "x-oss-meta-sha256": file_sha256})
+
+    @RetryPolicy.from_config("upload")
+    def __upload_part(self, remote_object_name, upload_id, part_number, data, upload_context):
+        self.__limiter.acquire_request()
+        result = self.__bucket.upload_part(remote_object_name, upload_id, part_number, data,
+                                           progress_callback=self.__limiter.progress_callback(), upload_context=upload_context)
+        return oss2.models.PartInfo(part_number, result.etag, size=len(data), part_crc=result.crc)
+
     def download_and_decrypt_file(self, local_file_name: str, remote_object_name: str, version_id: str = None, verify_integrity: bool = False):
         """从OSS下载并解密文件
 
@@ -239,31 +460,15 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
             version_id (str, 可选)
             verify_integrity: 设置为True会在下载之后校验sha256
         """
-        retry_count = 0
-        if not version_id:
-            req_params = None
-        else:
-            req_params = {'versionId': version_id}
-
-        while True:
-            try:
-                retry_count += 1
-                req = self.__bucket.get_object_to_file(remote_object_name, local_file_name, params=req_params)
-                break
-            except (oss2.exceptions.ClientError, oss2.exceptions.RequestError, ConnectionResetError) as err:
-                if retry_count < config.Max_Retries:
-                    logger.error("[Download_File_Encrypted] error, retrying time %d" % retry_count)
-                    logger.error(err)
-                else:
-                    logger.exception("[Download_File_Encrypted] Error")
-                    raise oss2.exceptions.RequestError
-                sleep(square(retry_count) * 10)
-                while not check_connection_status():
-                    logger.error("无法连接网络，10秒后重试")
-                    sleep(10)
-            except oss2.exceptions.NoSuchKey:
-                logger.error("无法找到文件" + remote_object_name)
-                return 404
+        try:
+            req = self.__get_object_to_file(remote_object_name, local_file_name, None if not version_id else {'versionId': version_id})
+        except oss2.exceptions.NoSuchKey:
+            logger.error("无法找到文件" + remote_object_name)
+            return 404
+        codec = req.headers.get(CODEC_HEADER, NONE)
+        if codec != NONE:  # 下载的是压缩后的内容，解压后替换
+            decompress_file(codec, local_file_name, local_file_name + ".tmp")
+            os.replace(local_file_name + ".tmp", local_file_name)
         if verify_integrity:
             if 'x-oss-meta-sha256' not in req.headers:
                 logger.error('[download_and_decrypt_file] Object %s 的Header中不存在sha256，无法校验' % remote_object_name)
@@ -275,48 +480,383 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
                 raise
         return 200
 
-    @retry(retry=retry_if_exception_type(oss2.exceptions.RequestError), reraise=True, wait=wait_exponential(multiplier=1, min=2, max=60),
-           stop=stop_after_attempt(config.Max_Retries))
-    def delete_remote_files(self, delete_list: list):
+    @RetryPolicy.from_config("download")
+    def __get_object_to_file(self, remote_object_name, local_file_name, req_params):
+        self.__limiter.acquire_request()
+        return self.__crypto_read(lambda bucket: bucket.get_object_to_file(remote_object_name, local_file_name, params=req_params,
+                                                                           progress_callback=self.__limiter.progress_callback()))
+
+    def download_remote_file(self, remote_object_name: str, local_file_name: str, file_size: int, checkpoint_file: str = None,
+                             num_threads: int = 4, headers=None) -> str:
+        """下载并解密文件，直接写入local_file_name，下载的同时计算sha256
+
+        大于等于Multipart_Download_Size的文件按分片并行下载(Range GET)，各分片用pwrite写入对应位置，并按顺序计算sha256；
+        按顺序完成的分片位置记录在检查点中，中断后再次下载时从检查点继续，只需从本地文件重新计算已下载部分的sha256
+        压缩上传的Object下载后解压，返回解压后内容的sha256；分片下载时先写入local_file_name加压缩方式后缀的临时文件
+
+        Args:
+            remote_object_name (str): 远端文件名
+            local_file_name (str): 本地文件名，已存在时会被覆盖
+            file_size (int): 远端Object的大小(压缩的Object为压缩后的大小)，可由list_remote_files获得
+            checkpoint_file (str, 可选): 分片下载的检查点文件，None为不使用检查点
+            num_threads (int, 可选): 同时下载的分片数，内存占用约为(num_threads + 1) * 分片大小
+            headers (dict, 可选): 已由get_remote_file_headers获取的Header，分片下载时不再重复获取
+
+        Returns:
+            str: 下载内容的sha256
+        """
+        if file_size < config.Multipart_Download_Size:
+            return self.__download_whole(remote_object_name, local_file_name)
+        if headers is None:
+            headers = self.get_remote_file_headers(remote_object_name)
+        codec = headers.get(CODEC_HEADER, NONE) if headers != 404 else NONE
+        if codec != NONE:  # 压缩后的内容不能按分片解压
+            compressed_file_name = local_file_name + "." + codec
+            self.__download_parts(remote_object_name, compressed_file_name, file_size, checkpoint_file, num_threads)
+            sha256 = decompress_file(codec, compressed_file_name, local_file_name)
+            os.remove(compressed_file_name)
+            return sha256
+        return self.__download_parts(remote_object_name, local_file_name, file_size, checkpoint_file, num_threads)
+
+    def __download_parts(self, remote_object_name: str, local_file_name: str, file_size: int, checkpoint_file: str, num_threads: int) -> str:
+        """分片并行下载，见download_remote_file
+
+        Returns:
+            str: 下载内容的sha256
+        """
+        part_size = max(config.Multipart_Download_Part_Size // 16 * 16, 16)  # 分片起点与AES-CTR的块对齐，避免多读取再丢弃
+        checkpoint = {'size': file_size, 'part_size': part_size, 'offset': 0}
+        if checkpoint_file and os.path.exists(checkpoint_file) and os.path.exists(local_file_name):
+            with open(checkpoint_file, 'r') as fobj:
+                saved = json.load(fobj)
+            if saved['size'] == file_size and saved['part_size'] == part_size and os.path.getsize(local_file_name) >= saved['offset']:
+                checkpoint = saved
+        sha256 = hashlib.sha256()
+        fd = os.open(local_file_name, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            offset = 0
+            while offset < checkpoint['offset']:  # 已下载的部分从本地文件重新计算sha256
+                data = os.pread(fd, min(part_size, checkpoint['offset'] - offset), offset)
+                sha256.update(data)
+                offset += len(data)
+            if checkpoint['offset']:
+                logger.info("[download_remote_file] 从检查点继续下载%s，已完成%s" % (remote_object_name, bytes_to_str(checkpoint['offset'])))
+            os.ftruncate(fd, file_size)
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = deque()
+                for start in range(checkpoint['offset'], file_size, part_size):
+                    futures.append(executor.submit(self.__download_part, remote_object_name, fd, start, min(start + part_size, file_size) - 1))
+                    if len(futures) > num_threads:
+                        self.__commit_part(futures.popleft().result(), sha256, checkpoint, checkpoint_file)
+                while futures:
+                    self.__commit_part(futures.popleft().result(), sha256, checkpoint, checkpoint_file)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def __commit_part(data: bytes, sha256, checkpoint: dict, checkpoint_file: str):
+        """分片按顺序计入sha256并更新检查点"""
+        sha256.update(data)
+        checkpoint['offset'] += len(data)
+        if checkpoint_file:
+            with open(checkpoint_file + ".tmp", 'w') as fobj:
+                json.dump(checkpoint, fobj)
+            os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+    @RetryPolicy.from_config("download")
+    def __download_whole(self, remote_object_name: str, local_file_name: str) -> str:
+        sha256 = hashlib.sha256()
+        self.__limiter.acquire_request()
+        result = self.__crypto_read(lambda bucket: bucket.get_object(remote_object_name, progress_callback=self.__limiter.progress_callback()))
+        decompress = decompressor(result.headers.get(CODEC_HEADER))
+        with open(local_file_name, 'wb') as fobj:
+            for chunk in result:
+                chunk = decompress(chunk)
+                sha256.update(chunk)
+                fobj.write(chunk)
+        return sha256.hexdigest()
+
+    @RetryPolicy.from_config("upload")
+    def encrypt_and_upload_bytes(self, data: bytes, remote_object_name: str, file_sha256: str, storage_class='Standard', cache_control='no-store'):
+        """加密并上传内存中的数据，用于分块和清单等小Object
+
+        Args:
+            data (bytes)
+            remote_object_name (str): 远程文件路径
+            file_sha256 (str): data的sha256
+            storage_class (str, 可选)
+            cache_control (str, 可选)
+        """
+        self.__limiter.acquire_request()
+        self.__bucket.put_object(remote_object_name, data, progress_callback=self.__limiter.progress_callback(), headers={
+            "Cache-Control": cache_control,
+            "Content-Type": "application/octet-stream",
+            "x-oss-server-side-encryption": "KMS",
+            "x-oss-storage-class": storage_class,
+            "x-oss-meta-sha256": file_sha256
+            })
+
+    @RetryPolicy.from_config("download")
+    def download_and_decrypt_bytes(self, remote_object_name: str, byte_range: tuple = None) -> bytes:
+        """下载并解密一个小Object(或Object的一部分)至内存
+
+        Args:
+            remote_object_name (str)
+            byte_range (tuple, 可选): (起始位置, 结束位置)，均包含在内
+
+        Returns:
+            bytes
+        """
+        self.__limiter.acquire_request()
+        skip = 0
+        if byte_range:
+            # 起点与AES-CTR的块对齐后再丢弃多读取的部分，oss2带progress_callback时不支持未对齐的起点
+            skip = byte_range[0] % 16
+            byte_range = (byte_range[0] - skip, byte_range[1])
+        data = self.__crypto_read(
+            lambda bucket: bucket.get_object(remote_object_name, byte_range=byte_range, progress_callback=self.__limiter.progress_callback())).read()[skip:]
+        if byte_range and len(data) != byte_range[1] - byte_range[0] - skip + 1:
+            raise oss2.exceptions.RequestError(IOError("%d-%d只读取到%d字节" % (byte_range[0] + skip, byte_range[1], len(data))))
+        return data
+
+    @RetryPolicy.from_config("download")
+    def __download_part(self, remote_object_name: str, fd: int, start: int, end: int) -> bytes:
+        self.__limiter.acquire_request()
+        data = self.__crypto_read(
+            lambda bucket: bucket.get_object(remote_object_name, byte_range=(start, end), progress_callback=self.__limiter.progress_callback())).read()
+        if len(data) != end - start + 1:
+            raise oss2.exceptions.RequestError(IOError("分片%d-%d只读取到%d字节" % (start, end, len(data))))
+        os.pwrite(fd, data, start)
+        return data
+
+    def delete_remote_files(self, delete_list: list) -> list:
         """删除OSS中的文件
 
+        每1000个文件为一批并发删除，只重试响应中未列出的文件；Bucket开启了版本控制且Delete_Object_Versions为True时删除文件的所有历史版本，
+        历史版本按目录列举(每个目录一次，不包括子目录)
+
         Args:
             delete_list (list): 需要删除的文件列表，绝对对路径
+
+        Returns:
+            list: 多次重试后仍未能删除的文件
+        """
+        if not delete_list:
+            return []
+        try:
+            versioning = config.Delete_Object_Versions and self.__versioning_enabled()
+        except oss2.exceptions.OssError:
+            logger.exception("[delete_remote_files] 无法获取Bucket的版本控制状态")
+            return list(delete_list)
+        failed = []
+        if versioning:
+            targets = []
+            directories = {}
+            for remote_object in delete_list:
+                directories.setdefault(remote_object[:remote_object.rfind('/') + 1], set()).add(remote_object)
+            with ThreadPoolExecutor(max_workers=config.Delete_Workers) as executor:
+                for (directory, keys), versions in zip(directories.items(), executor.map(self.__try_list_object_versions, directories)):
+                    if versions is None:
+                        failed.extend(keys)
+                    else:
+                        targets.extend(version for version in versions if version[0] in keys)
+            delete_batch = self.__delete_versions_batch
+        else:
+            targets = list(delete_list)
+            delete_batch = self.__delete_objects_batch
+        with ThreadPoolExecutor(max_workers=config.Delete_Workers) as executor:
+            for remaining in executor.map(delete_batch, [targets[i:i + 1000] for i in range(0, len(targets), 1000)]):
+                failed.extend(remaining)
+        failed = list(dict.fromkeys(target if isinstance(target, str) else target[0] for target in failed))
+        if failed:
+            logger.error("[delete_remote_files] %d个文件删除失败" % len(failed))
+        return failed
+
+    @RetryPolicy.from_config("metadata")
+    def __versioning_enabled(self) -> bool:
+        if self.__versioning is None:
+            self.__limiter.acquire_request()
+            self.__versioning = self.__bucket.get_bucket_versioning().status in ('Enabled', 'Suspended')
+        return self.__versioning
+
+    def __try_list_object_versions(self, directory: str):
+        """见__list_object_versions，多次重试后仍失败时返回None"""
+        try:
+            return self.__list_object_versions(directory)
+        except oss2.exceptions.OssError:
+            logger.exception("[delete_remote_files] 无法列举%s中文件的历史版本" % directory)
+            return None
+
+    @RetryPolicy.from_config("metadata")
+    def __list_object_versions(self, directory: str) -> list:
+        """列举目录中(不包括子目录)所有Object的所有版本(包括删除标记)
+
+        Returns:
+            list: [(Object名称, versionid)]
+        """
+        versions = []
+        key_marker = versionid_marker = ''
+        while True:
+            self.__limiter.acquire_request()
+            result = self.__bucket.list_object_versions(prefix=directory, delimiter='/', key_marker=key_marker, versionid_marker=versionid_marker,
+                                                        max_keys=1000)
+            versions += [(info.key, info.versionid) for info in result.versions + result.delete_marker]
+            if not result.is_truncated:
+                return versions
+            key_marker, versionid_marker = result.next_key_marker, result.next_versionid_marker
+
+    def __delete_batch(self, targets: list, delete, deleted_of) -> list:
+        """删除一批文件，只重试响应中未列出的文件
+
+        Returns:
+            list: 多次重试后仍未能删除的文件
         """
-        for i in range(0, (len(delete_list) // 1000) + 1):
-            self.__bucket.batch_delete_objects(delete_list[i * 1000:(i * 1000) + 999])
+        targets = list(targets)
 
-    @retry(retry=retry_if_exception_type(oss2.exceptions.RequestError), reraise=True, wait=wait_exponential(multiplier=1, min=2, max=60),
-           stop=stop_after_attempt(config.Max_Retries))
-    def copy_remote_files(self, copy_list: dict, storage_class=oss2.BUCKET_STORAGE_CLASS_STANDARD):
-        """复制远程文件
+        def attempt():
+            self.__limiter.acquire_request()
+            deleted = deleted_of(delete(targets))
+            targets[:] = [target for target in targets if target not in deleted]
+            if targets:
+                raise oss2.exceptions.RequestError(IOError("%d个文件未能删除" % len(targets)))
+
+        try:
+            self.__delete_policy.call(attempt)
+        except oss2.exceptions.OssError as err:  # 包括重试预算耗尽后的限流、5xx和403
+            logger.warning("[delete_remote_files] %d个文件删除失败：%s" % (len(targets), err))
+        return targets
+
+    def __delete_objects_batch(self, keys: list) -> list:
+        return self.__delete_batch(keys, self.__bucket.batch_delete_objects, lambda result: set(result.deleted_keys))
+
+    def __delete_versions_batch(self, versions: list) -> list:
+        return self.__delete_batch(
+            versions,
+            lambda targets: self.__bucket.delete_object_versions(
+                oss2.models.BatchDeleteObjectVersionList([oss2.models.BatchDeleteObjectVersion(key, versionid) for key, versionid in targets])),
+            lambda result: {(version.key, version.versionid) for version in result.delete_versions})
+
+    def copy_remote_files(self, copy_list: dict, storage_class='Standard', src_sizes: dict = None, progress_callback=None) -> dict:
+        """并行复制远程文件，每个文件单独重试，已完成的复制记录在检查点中
 
         Args:
             copy_list (dits): {目标文件: 源文件}
             storage_class (str)
+            src_sizes (dict, 可选): {源文件: 大小}，用于判断是否使用分片复制
+            progress_callback (callable, 可选): 见CopyExecutor.run
+
+        Returns:
+            dict: 复制失败的{目标文件: 源文件}
         """
-        for dst_obj, src_obj in copy_list.items():
-            self.__bucket.copy_object(config.bucket_name, src_obj, dst_obj, headers={'x-oss-storage-class': storage_class})
+        from units.copy_executor import CopyExecutor
+        executor = CopyExecutor(self, max_workers=config.Copy_Workers, checkpoint_file=config.temp_dir + config.remote_base_dir[:-1] + "-copy-checkpoint.json")
+        return executor.run(copy_list, storage_class=storage_class, src_sizes=src_sizes, progress_callback=progress_callback)
+
+    def copy_remote_file(self, src_obj: str, dst_obj: str, storage_class='Standard', src_size: int = None):
+        """复制一个远程文件，大于等于Multipart_Copy_Size的文件使用分片复制，各分片并行复制
 
-    @retry(retry=retry_if_exception_type(oss2.exceptions.RequestError) | retry_if_exception_type(oss2.exceptions.ClientError), reraise=True,
-           wait=wait_exponential(multiplier=1, min=2, max=60), stop=stop_after_attempt(config.Max_Retries))
-    def verify_remote_file_integrity(self, remote_object) -> bool:
-        """校验远端文件哈希值，将文件下载、解密至内存中计算sha256并与oss header中的sha256比对
+        每个请求单独重试，分片复制时只重试失败的分片；整个复制不再重试，否则重试次数会相乘，失败也会被熔断器重复计数
+        单次读取上传的Object(大于等于Single_Pass_Upload_Size，Header中没有sha256)同时复制其sha256 sidecar
+
+        Args:
+            src_obj (str): 源文件
+            dst_obj (str): 目标文件
+            storage_class (str)
+            src_size (int, 可选): 源文件大小，不提供时自动获取
+        """
+        src_headers = None
+        if src_size is None or src_size >= min(config.Multipart_Copy_Size, config.Single_Pass_Upload_Size or config.Multipart_Copy_Size):
+            src_headers = self.__head_object(src_obj)
+        if src_headers is not None and int(src_headers['Content-Length']) >= config.Multipart_Copy_Size:
+            self.__multipart_copy(src_obj, dst_obj, storage_class, src_headers)
+        else:
+            self.__copy_object(src_obj, dst_obj, storage_class)
+        if src_headers is not None and 'x-oss-meta-sha256' not in src_headers:
+            self.__copy_sha256_sidecar(src_obj, dst_obj)
+
+    def __copy_sha256_sidecar(self, src_obj: str, dst_obj: str):
+        """目标文件没有sidecar时rebuild_sha256无法获取其sha256"""
+        try:
+            self.__copy_object(sha256_sidecar_name(src_obj), sha256_sidecar_name(dst_obj), 'Standard')
+        except oss2.exceptions.NoSuchKey:
+            logger.warning("[copy_remote_file] %s的Header和sidecar中都没有sha256" % src_obj)
+
+    @RetryPolicy.from_config("metadata")
+    def __head_object(self, remote_object: str):
+        self.__limiter.acquire_request()
+        return self.__bucket.head_object(remote_object).headers
+
+    @RetryPolicy.from_config("copy")
+    def __copy_object(self, src_obj: str, dst_obj: str, storage_class):
+        self.__limiter.acquire_request()
+        self.__bucket.copy_object(config.bucket_name, src_obj, dst_obj, headers={'x-oss-storage-class': storage_class})
+
+    def __multipart_copy(self, src_obj: str, dst_obj: str, storage_class, src_headers, num_threads: int = 4):
+        """分片复制，密文按字节原样复制，因此需要将源文件中客户端加密相关的x-oss-meta-*一并写入目标文件"""
+        src_size = int(src_headers['Content-Length'])
+        headers = {key: value for key, value in src_headers.items() if key.lower().startswith('x-oss-meta-')}
+        for key in ('Content-Type', 'Cache-Control', 'x-oss-server-side-encryption'):
+            if key in src_headers:
+                headers[key] = src_headers[key]
+        headers['x-oss-storage-class'] = storage_class
+        part_size = oss2.determine_part_size(src_size, preferred_size=config.Multipart_Copy_Part_Size)
+
+        upload_id = self.__init_multipart_copy(dst_obj, headers)
+        try:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = [executor.submit(self.__upload_part_copy, src_obj, (offset, min(offset + part_size, src_size) - 1), dst_obj, upload_id, part_number)
+                           for part_number, offset in enumerate(range(0, src_size, part_size), 1)]
+                parts = [future.result() for future in futures]
+            self.__complete_multipart_copy(dst_obj, upload_id, parts)
+        except oss2.exceptions.OssError:
+            logger.exception("[copy_remote_file] 分片复制%s时出错" % src_obj)
+            try:
+                self.__plain_bucket.abort_multipart_upload(dst_obj, upload_id)
+            except oss2.exceptions.OssError:
+                pass
+            raise
+
+    @RetryPolicy.from_config("copy")
+    def __init_multipart_copy(self, dst_obj, headers) -> str:
+        self.__limiter.acquire_request()
+        return self.__plain_bucket.init_multipart_upload(dst_obj, headers=headers).upload_id
+
+    @RetryPolicy.from_config("copy")
+    def __complete_multipart_copy(self, dst_obj, upload_id, parts):
+        self.__limiter.acquire_request()
+        self.__plain_bucket.complete_multipart_upload(dst_obj, upload_id, parts)
+
+    @RetryPolicy.from_config("copy")
+    def __upload_part_copy(self, src_obj, byte_range, dst_obj, upload_id, part_number):
+        self.__limiter.acquire_request()
+        result = self.__plain_bucket.upload_part_copy(config.bucket_name, src_obj, byte_range, dst_obj, upload_id, part_number)
+        return oss2.models.PartInfo(part_number, result.etag)
+
+    @RetryPolicy.from_config("download")
+    def verify_remote_file_integrity(self, remote_object, file_sha256: str = None) -> bool:
+        """校验远端文件哈希值，将文件流式下载、解密并计算sha256，与oss header中的sha256比对，不写入临时文件
 
         Args:
             remote_object (str): 待校验的文件
+            file_sha256 (str, 可选): 期望的sha256(如远端索引中的记录)，不提供时使用oss header中的sha256
         """
-        result = self.__bucket.get_object(remote_object)
+        self.__limiter.acquire_request()
+        result = self.__crypto_read(lambda bucket: bucket.get_object(remote_object))
+        decompress = decompressor(result.headers.get(CODEC_HEADER))
         sha256 = hashlib.sha256()
         for chunk in result:
-            sha256.update(chunk)
-        if sha256.hexdigest() == result.headers['x-oss-meta-sha256'].lower():
+            self.__limiter.acquire_bytes(len(chunk))
+            sha256.update(decompress(chunk))
+        if sha256.hexdigest() == (file_sha256 or result.headers['x-oss-meta-sha256']).lower():
             return True
         else:
             return False
 
-    @retry(retry=retry_if_exception_type(oss2.exceptions.RequestError) | retry_if_exception_type(oss2.exceptions.ClientError), reraise=True,
-           wait=wait_exponential(multiplier=1, min=2, max=60), stop=stop_after_attempt(config.Max_Retries))
+    @RetryPolicy.from_config("metadata")
     def get_remote_file_headers(self, remote_object: str, version_id: str = None):
         """获取一个远程文件的元信息
 
@@ -332,6 +872,7 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
         else:
             req_params = {'versionId': version_id}
 
+        self.__limiter.acquire_request()
         try:
             __object_header = self.__bucket.head_object(remote_object, params=req_params)
         except oss2.exceptions.NotFound:
@@ -340,8 +881,7 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
         else:
             return __object_header.headers
 
-    @retry(retry=retry_if_exception_type(oss2.exceptions.RequestError) | retry_if_exception_type(oss2.exceptions.ClientError), reraise=True,
-           wait=wait_exponential(multiplier=1, min=2, max=60), stop=stop_after_attempt(config.Max_Retries))
+    @RetryPolicy.from_config("metadata")
     def get_remote_file_size(self, remote_object: str, version_id: str = None) -> int:
         """获取一个远程Object的Content-Length
 
@@ -357,6 +897,7 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
         else:
             req_params = {'versionId': version_id}
 
+        self.__limiter.acquire_request()
         try:
             __object_header = self.__bucket.get_object_meta(remote_object, params=req_params)
         except oss2.exceptions.NoSuchKey:
@@ -365,8 +906,21 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
         else:
             return int(__object_header.headers['Content-Length'])
 
-    @retry(retry=retry_if_exception_type(oss2.exceptions.RequestError) | retry_if_exception_type(oss2.exceptions.ClientError), reraise=True,
-           wait=wait_exponential(multiplier=1, min=2, max=60), stop=stop_after_attempt(config.Max_Retries))
+    def list_remote_files(self, prefix: str):
+        """列举指定前缀下的Object
+
+        Args:
+            prefix (str)
+
+        Yields:
+            oss2.models.SimplifiedObjectInfo
+        """
+        for i, obj in enumerate(oss2.ObjectIteratorV2(self.__bucket, prefix=prefix, max_keys=1000, max_retries=config.Max_Retries)):
+            if i % 1000 == 0:  # 每次列举请求返回1000个Object
+                self.__limiter.acquire_request()
+            yield obj
+
+    @RetryPolicy.from_config("metadata")
     def restore_remote_file(self, remote_object: str, version_id: str = None, restore_configuration: int = None) -> int:
         """解冻一个Object
         api文档: https://help.aliyun.com/document_detail/52930.html
@@ -382,13 +936,15 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
         Returns:
             int: http响应码
         """
-        if restore_configuration:
-            restore_configuration = self.__restore_configuration_model[restore_configuration]
+        if restore_configuration is not None:  # 0为高优先级解冻，不能用真值判断
+            restore_configuration = oss2.models.RestoreConfiguration(
+                days=config.Restore_Days, job_parameters=oss2.models.RestoreJobParameters(self.__restore_configuration_model[restore_configuration]))
         if not version_id:
             req_params = None
         else:
             req_params = {'versionId': version_id}
 
+        self.__limiter.acquire_request()
         try:
             self.__bucket.restore_object(remote_object, input=restore_configuration, params=req_params)
         except oss2.exceptions.OperationNotSupported:
@@ -412,19 +968,19 @@ class OssOperation(object):  # TODO 使用@retry重写重试部分
 
         Returns: int
             200: 已完成解冻
+            404: Object不存在
             409: 正在解冻中
             410: 没有提交解冻或者解冻已超时
 
         """
         __headers = self.get_remote_file_headers(remote_object, version_id=version_id)
+        if type(__headers) == int:  # get_remote_file_headers在Object不存在时返回404
+            return __headers
         if 'x-oss-restore' in __headers:
             if __headers['x-oss-restore'] == 'ongoing-request="true"':
                 return 409
             else:
                 return 200
-        elif type(__headers) == int:
-            if __headers == 404:
-                return 404
         else:
             return 410
 
@@ -465,14 +1021,21 @@ def check_configs():
         logger.critical("临时目录(temp_dir)必须为带有后导/的绝对路径")
         raise ValueError("临时目录(temp_dir)必须为带有后导/的绝对路径")
 
+    if config.backup_exclude_style not in ["fnmatch", "gitignore"]:
+        logger.critical("backup_exclude_style取值错误，必须为fnmatch或gitignore")
+        raise ValueError("backup_exclude_style取值错误，必须为fnmatch或gitignore")
     for path in config.backup_exclude:
-        if path[0] == '/':
+        if path[0] == '/' and config.backup_exclude_style == "fnmatch":
             logger.critical("备份排除目录(backup_exclude_dirs)不可带有前导/")
             raise ValueError("备份排除目录(backup_exclude_dirs)不可带有前导/")
     for path in config.backup_dirs:
         if (path[0] == '/' or path[-1] != '/') and os.path.isabs(path):
             logger.critical("本地备份目录(backup_dirs)必须为带有后导/的相对路径")
             raise ValueError("本地备份目录(backup_dirs)必须为带有后导/的相对路径")
+    for path in config.backup_dirs:
+        if path.startswith((".chunks/", ".packs/")):
+            logger.critical("本地备份目录(backup_dirs)不可以.chunks/或.packs/开头，这两个路径用于分块和打包存储")
+            raise ValueError("本地备份目录(backup_dirs)不可以.chunks/或.packs/开头，这两个路径用于分块和打包存储")
     if config.remote_base_dir.startswith("sha256"):
         logger.critical("remote_base_dir不应以sha256开头，可能与哈希存储冲突")
         raise ValueError("remote_base_dir不应以sha256开头，可能与哈希存储冲突")
@@ -494,6 +1057,9 @@ def check_configs():
                                             oss2.BUCKET_STORAGE_CLASS_COLD_ARCHIVE]:
         logger.critical("default_storage_class取值错误，必须为Standard、IA、Archive或ColdArchive")
         raise ValueError("default_storage_class取值错误，必须为Standard、IA、Archive或ColdArchive")
+    if config.Chunk_Pack_Storage_Class not in [oss2.BUCKET_STORAGE_CLASS_STANDARD, oss2.BUCKET_STORAGE_CLASS_IA]:
+        logger.critical("Chunk_Pack_Storage_Class取值错误，必须为Standard或IA")
+        raise ValueError("Chunk_Pack_Storage_Class取值错误，必须为Standard或IA")
     if config.OssEndpoint.startswith("http"):
         logger.critical("OSS Endpoint请直接填写域名")
         raise ValueError("OSS Endpoint请直接填写域名")
@@ -1,66 +1,293 @@
 # -*- coding: utf-8 -*-
+import argparse
+import calendar
+import csv
+import gzip
 import json
+import os
 import time
+from collections import deque
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
 
 import oss2
 
 import config
-from oss_sync_libs import sct_push, OssOperation
+from oss_sync_libs import sct_push, OssOperation, oss_session, sha256_sidecar_name
+from units.chunk_store import ChunkStore
+from units.pack_store import PackStore
+from units.rate_limiter import RateLimiter
+from units.remote_index import PathIndex, RemoteIndex
+from units.retry_policy import RetryPolicy
+
+bucket = oss2.Bucket(oss2.Auth(config.OSSAccessKeyId, config.OSSAccessKeySecret), 'https://' + config.OssEndpoint, config.bucket_name,
+                     session=oss_session())
+limiter = RateLimiter.from_config()
+rebuild_file = 'sha256-rebuild.jsonl'  # 每行一条{"path": 文件路径, "sha256": sha256, "size": 大小, "etag": ETag, "last_modified": 修改时间}
+error_file = 'sha256-rebuild.errors'  # 每行一个无法获取sha256的Object
+checkpoint_file = 'sha256-rebuild.checkpoint'
+# 分块和打包存储的Object不是单个备份文件，这些文件无法从Object重建
+skip_prefixes = (config.remote_base_dir + ChunkStore.PREFIX, config.remote_base_dir + PackStore.PREFIX)
+
+
+@RetryPolicy.from_config("metadata")
+def head_sha256(obj):
+    """
+    Returns:
+        Object Header中的sha256，Header中没有sha256时为None，Object不存在时为False
+    """
+    limiter.acquire_request()
+    try:
+        return bucket.head_object(obj).headers.get('x-oss-meta-sha256')
+    except oss2.exceptions.NotFound:
+        return False
 
-bucket = oss2.Bucket(oss2.Auth(config.OSSAccessKeyId, config.OSSAccessKeySecret), 'https://' + config.OssEndpoint, config.bucket_name)
-rebuild_file = 'sha256-rebuild.json'
 
 def get_remote_sha256(obj):
-    global bucket
-    while True:
-        try:
-            object_meta = bucket.head_object(obj).headers
-            break
-        except:
-            print('retrying on file "%s"' % obj)
-            time.sleep(15)
-    if 'x-oss-meta-sha256' in object_meta:
-        return object_meta['x-oss-meta-sha256']
-    else:
+    """Object及其sidecar的HEAD分别重试，不嵌套重试"""
+    sha256 = head_sha256(obj)
+    if sha256 is None and not obj.startswith("index/"):  # 单次读取上传的Object，sha256记录在sidecar中
+        sha256 = head_sha256(sha256_sidecar_name(obj))
+    return sha256 or False
+
+
+async def async_head_sha256(client, obj):
+    """head_sha256的异步版本，AsyncOssClient的每个请求已按RetryPolicy重试"""
+    try:
+        return (await client.head_object(obj)).get('x-oss-meta-sha256')
+    except oss2.exceptions.NotFound:
         return False
 
 
+async def async_get_remote_sha256(client, obj):
+    """get_remote_sha256的异步版本，使用AsyncOssClient"""
+    sha256 = await async_head_sha256(client, obj)
+    if sha256 is None and not obj.startswith("index/"):
+        sha256 = await async_head_sha256(client, sha256_sidecar_name(obj))
+    return sha256 or False
+
+
+@RetryPolicy.from_config("metadata")
+def list_page(continuation_token: str):
+    limiter.acquire_request()
+    return bucket.list_objects_v2(prefix=config.remote_base_dir, continuation_token=continuation_token, max_keys=1000)
+
+
+def normalize_etag(etag: str) -> str:
+    return etag.strip('"').upper()
+
+
+def object_record(obj: str, sha256: str, size: int, etag: str, last_modified: int) -> str:
+    """rebuild_file中的一行，同时记录Object的大小、ETag和修改时间，供按清单重建时判断Object是否发生变化"""
+    return json.dumps({'path': obj[len(config.remote_base_dir):], 'sha256': sha256, 'size': int(size), 'etag': normalize_etag(etag),
+                       'last_modified': int(last_modified)}, ensure_ascii=False) + '\n'
+
+
+def load_checkpoint() -> dict:
+    """读取检查点，并截断检查点之后写入的不完整结果"""
+    checkpoint = {'continuation_token': '', 'rebuild_offset': 0, 'error_offset': 0, 'count': 0, 'errors': 0}
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r') as fobj:
+            checkpoint = json.load(fobj)
+        print("[rebuild-sha256]从检查点恢复，已完成 %d 条记录" % checkpoint['count'])
+    for file_name, offset in ((rebuild_file, checkpoint['rebuild_offset']), (error_file, checkpoint['error_offset'])):
+        with open(file_name, 'a') as fobj:
+            fobj.truncate(offset)
+    return checkpoint
+
+
+def save_checkpoint(checkpoint: dict):
+    with open(checkpoint_file + '.tmp', 'w') as fobj:
+        json.dump(checkpoint, fobj)
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+
+def rebuild(max_workers: int, max_pages: int = 8, submit=None) -> dict:
+    """列举与HEAD流水线执行：列举的同时由线程池并发获取sha256，每页结果按列举顺序写入rebuild_file并更新检查点
+
+    Args:
+        max_workers (int): 并发HEAD请求数
+        max_pages (int, 可选): 同时处理的列举页数，每页1000个Object
+        submit (callable, 可选): 以submit(Object)提交获取sha256的任务并返回concurrent.futures.Future，默认使用线程池
+
+    Returns:
+        dict: 检查点，包括记录总数和错误总数
+    """
+    checkpoint = load_checkpoint()
+    pages = deque()  # [(下一页的continuation_token, [(SimplifiedObjectInfo, future)])]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            open(rebuild_file, 'a', encoding='utf-8') as rebuild_fobj, open(error_file, 'a', encoding='utf-8') as error_fobj:
+        submit = submit or (lambda obj: executor.submit(get_remote_sha256, obj))
+
+        def commit_page():
+            next_token, futures = pages.popleft()
+            for info, future in futures:
+                try:
+                    sha256 = future.result()
+                except oss2.exceptions.OssError as err:
+                    print('[rebuild-sha256]无法获取"%s"的sha256：%s' % (info.key, err))
+                    sha256 = False
+                if sha256:
+                    rebuild_fobj.write(object_record(info.key, sha256, info.size, info.etag, info.last_modified))
+                    checkpoint['count'] += 1
+                else:
+                    error_fobj.write(info.key + '\n')
+                    checkpoint['errors'] += 1
+            rebuild_fobj.flush()
+            error_fobj.flush()
+            os.fsync(rebuild_fobj.fileno())
+            os.fsync(error_fobj.fileno())
+            checkpoint.update(continuation_token=next_token, rebuild_offset=rebuild_fobj.tell(), error_offset=error_fobj.tell())
+            save_checkpoint(checkpoint)
+
+        token = checkpoint['continuation_token']
+        while token is not None:
+            result = list_page(token)
+            token = result.next_continuation_token if result.is_truncated else None
+            pages.append((token, [(info, submit(info.key)) for info in result.object_list
+                                  if info.key[-1] != '/' and not info.key.startswith(skip_prefixes)]))  # 跳过文件夹、分块和打包存储
+            while len(pages) >= max_pages:
+                commit_page()
+        while pages:
+            commit_page()
+    return checkpoint
+
+
+def iter_inventory(manifest_file: str):
+    """读取OSS清单(manifest.json及其列出的CSV文件)，也可以直接传入单个CSV(.gz)文件
+
+    manifest.json中files的key为目标Bucket中的路径，需要先将CSV文件下载到manifest.json所在的目录
+
+    Yields:
+        dict: {'key', 'size', 'etag', 'last_modified'}，仅包含remote_base_dir下的Object
+    """
+    if manifest_file.endswith('.json'):
+        with open(manifest_file, 'r') as fobj:
+            manifest = json.load(fobj)
+        schema = [field.strip() for field in manifest['fileSchema'].split(',')]
+        csv_files = [os.path.join(os.path.dirname(manifest_file), os.path.basename(item['key'])) for item in manifest['files']]
+    else:
+        schema = ['Bucket', 'Key', 'Size', 'StorageClass', 'LastModifiedDate', 'ETag', 'IsMultipartUploaded', 'EncryptionStatus']
+        csv_files = [manifest_file]
+    for csv_file in csv_files:
+        with (gzip.open(csv_file, 'rt', encoding='utf-8', newline='') if csv_file.endswith('.gz') else
+              open(csv_file, 'r', encoding='utf-8', newline='')) as fobj:
+            for row in csv.reader(fobj):
+                item = dict(zip(schema, row))
+                key = unquote(item['Key'])
+                if not key.startswith(config.remote_base_dir) or key[-1] == '/' or key.startswith(skip_prefixes):
+                    continue
+                yield {'key': key, 'size': int(item['Size']), 'etag': item['ETag'],
+                       'last_modified': calendar.timegm(time.strptime(item['LastModifiedDate'][:19], "%Y-%m-%dT%H:%M:%S"))}
+
+
+def rebuild_from_inventory(manifest_file: str, max_workers: int, max_in_flight: int = 10000, submit=None) -> dict:
+    """按清单重建：清单中大小、ETag和修改时间都与上次重建结果一致的Object直接沿用上次的sha256，其余Object并发HEAD
+
+    Args:
+        manifest_file (str): 见iter_inventory
+        max_workers (int): 并发HEAD请求数
+        max_in_flight (int, 可选): 等待写入的Object数量上限
+        submit (callable, 可选): 见rebuild
+
+    Returns:
+        dict: 记录总数、错误总数和HEAD请求数
+    """
+    previous = {}
+    if os.path.exists(rebuild_file):
+        with open(rebuild_file, 'r', encoding='utf-8') as fobj:
+            for line in fobj:
+                record = json.loads(line)
+                if 'etag' in record:
+                    previous[config.remote_base_dir + record['path']] = (record['size'], record['etag'], record['last_modified'], record['sha256'])
+    result = {'count': 0, 'errors': 0, 'head_requests': 0}
+    in_flight = deque()  # [(清单条目, sha256或future)]，按清单顺序写入
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            open(rebuild_file + '.tmp', 'w', encoding='utf-8') as rebuild_fobj, open(error_file, 'w', encoding='utf-8') as error_fobj:
+        submit = submit or (lambda obj: executor.submit(get_remote_sha256, obj))
+
+        def write_one():
+            item, sha256 = in_flight.popleft()
+            if not isinstance(sha256, str):
+                try:
+                    sha256 = sha256.result()
+                except oss2.exceptions.OssError as err:
+                    print('[rebuild-sha256]无法获取"%s"的sha256：%s' % (item['key'], err))
+                    sha256 = False
+            if sha256:
+                rebuild_fobj.write(object_record(item['key'], sha256, item['size'], item['etag'], item['last_modified']))
+                result['count'] += 1
+            else:
+                error_fobj.write(item['key'] + '\n')
+                result['errors'] += 1
+
+        for item in iter_inventory(manifest_file):
+            known = previous.get(item['key'])
+            if known and known[:3] == (item['size'], normalize_etag(item['etag']), item['last_modified']):
+                in_flight.append((item, known[3]))
+            else:
+                in_flight.append((item, submit(item['key'])))
+                result['head_requests'] += 1
+            while len(in_flight) >= max_in_flight:
+                write_one()
+        while in_flight:
+            write_one()
+    os.replace(rebuild_file + '.tmp', rebuild_file)
+    return result
+
+
+def iter_rebuild_file():
+    with open(rebuild_file, 'r', encoding='utf-8') as fobj:
+        for line in fobj:
+            record = json.loads(line)
+            yield record['path'], record['sha256']
+
+
 def check_diff():
-    with open(rebuild_file, 'r') as FOBJ:
-        new_sha = json.load(FOBJ)
+    new_sha = {path for path, _ in iter_rebuild_file()}
     with open('sha256-old.json', 'r') as FOBJ:
         old_sha = json.load(FOBJ)
 
-    dif = new_sha.keys() - old_sha.keys()
+    dif = new_sha - old_sha.keys()
     with open('sha256.diff', 'w', encoding='utf-8') as FOBJ:
         for i in iter(dif):
             FOBJ.write(i + '\n')
 
 
 if __name__ == '__main__':
-    sha256_to_files = {}
-    err_files = []
+    parser = argparse.ArgumentParser(description="从OSS重建远端索引")
+    parser.add_argument('--inventory', help='OSS清单的manifest.json(或单个CSV文件)路径，提供时只对清单中与上次重建结果不一致的Object发送HEAD请求')
+    parser.add_argument('--use_async', action='store_true', help='使用异步客户端发送HEAD请求，所有请求复用Async_Max_Connections个连接(需要aiohttp)')
+    args = parser.parse_args()
+
     r_oss = OssOperation()
-    for obj in oss2.ObjectIteratorV2(bucket, prefix=config.remote_base_dir):
-        obj = obj.key
-        if obj[-1] == '/':  # 判断obj为文件夹。
-            continue
-        sha256 = get_remote_sha256(obj)
-        if not sha256:
-            err_files.append(obj)
+    submit = loop_thread = client = None
+    if args.use_async:
+        from units.async_oss import AsyncOssClient, EventLoopThread
+        loop_thread = EventLoopThread()
+        client = loop_thread.run(AsyncOssClient.from_config(limiter=limiter).open())
+
+        def submit(obj):
+            return loop_thread.submit(async_get_remote_sha256(client, obj))
+    try:
+        if args.inventory:
+            result = rebuild_from_inventory(args.inventory, config.Rebuild_Workers, submit=submit)
+            print("[rebuild-sha256]按清单重建，发送了 %d 个HEAD请求" % result['head_requests'])
         else:
-            sha256_to_files[obj[len(config.remote_base_dir):]] = sha256
-    with open(rebuild_file, 'w') as fobj:
-        json.dump(sha256_to_files, fobj)
-    r_oss.encrypt_and_upload_files(
-        rebuild_file,
-        "index/%s.json" % config.remote_base_dir[:-1],
-        compare_sha256_before_uploading=True,
-        storage_class='Standard'
-    )
-    if len(err_files) > 0:
-        print("[rebuild-sha256]重建完成，OSS中有 %d 个Object的Header中不存在sha256，分别是：" % len(err_files))
-        print(err_files)
+            result = rebuild(config.Rebuild_Workers, submit=submit)
+    finally:
+        if loop_thread:
+            loop_thread.run(client.close())
+            loop_thread.close()
+    sha256_to_files = PathIndex(iter_rebuild_file())
+    RemoteIndex(r_oss, config.remote_base_dir, config.temp_dir + config.remote_base_dir[:-1] + "-index/",
+                prefix_length=config.Index_Shard_Prefix_Length).save(sha256_to_files)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    if result['errors'] > 0:
+        print("[rebuild-sha256]重建完成，OSS中有 %d 个Object的Header中不存在sha256，已写入%s" % (result['errors'], error_file))
     print("[rebuild-sha256]记录总数 %d 条" % len(sha256_to_files))
     if config.SCT_Send_Key:
         sct_push("[rebuild-sha256]重建完成", "#### sha256.json已重建完成，请登录服务器检查")
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import argparse
+import logging
+import os
+import time
+
+from rich.progress import BarColumn, Progress, TextColumn, TimeElapsedColumn
+
+from oss_sync_libs import Colored, FileCount, OssOperation, bytes_to_str, sct_push, sha256_to_path
+from units.chunk_store import ChunkStore
+from units.download_executor import DownloadExecutor
+from units.index_journal import IndexJournal
+from units.pack_store import PackStore
+from units.remote_index import RemoteIndex
+
+try:
+    import config
+except ModuleNotFoundError:
+    raise Exception("无法找到config.py")
+
+logger = logging.getLogger("restore")
+
+
+def create_logger(no_file_logger: bool = False, names: tuple = ("restore", "download_executor")):
+    formatter = logging.Formatter(config.LogFormat)
+    handlers = [logging.StreamHandler()]
+    if not no_file_logger:
+        try:
+            handlers.append(logging.FileHandler(filename=config.LogFile, encoding='utf-8'))
+        except ValueError:
+            handlers.append(logging.FileHandler(filename=config.LogFile))
+    for name in names:
+        __logger = logging.getLogger(name)
+        __logger.setLevel(config.LogLevel)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            __logger.addHandler(handler)
+
+
+def load_index(oss, prefix: str = "") -> dict:
+    """读取远端索引，并应用尚未合并的索引日志段
+
+    Args:
+        prefix (str, 可选): 只保留以此开头的路径，其余条目在读取分片时即被丢弃
+
+    Returns:
+        dict: {路径: sha256}
+    """
+    index_cache_dir = config.temp_dir + config.remote_base_dir[:-1] + "-index/"
+    remote_index = RemoteIndex(oss, config.remote_base_dir, index_cache_dir, prefix_length=config.Index_Shard_Prefix_Length)
+    remote_index.load()
+    remote_files_sha256 = remote_index.load_paths(prefix)
+    # 使用单独的本地日志文件，只应用远端的日志段，不影响备份机上尚未上传的日志；恢复时不写入远端索引
+    journal = IndexJournal(oss, remote_index, index_cache_dir + "restore-journal.jsonl", compact_segments=float("inf"))
+    journal.replay(remote_files_sha256)
+    journal.close()
+    if prefix:  # 日志中的记录不限于prefix
+        for path in [path for path in remote_files_sha256 if not path.startswith(prefix)]:
+            del remote_files_sha256[path]
+    return remote_files_sha256
+
+
+def load_chunk_store(oss) -> ChunkStore:
+    """列举远端的分块存储，未使用分块上传时为空"""
+    chunk_store = ChunkStore(oss, config.remote_base_dir, config.temp_dir + config.remote_base_dir[:-1] + "-chunks/")
+    chunk_store.load()
+    return chunk_store
+
+
+def load_pack_store(oss) -> PackStore:
+    """列举远端的包并读取包内索引，未使用打包上传时为空"""
+    pack_store = PackStore(oss, config.remote_base_dir, config.temp_dir + config.remote_base_dir[:-1] + "-packs/")
+    pack_store.load()
+    return pack_store
+
+
+def build_download_list(oss, files_sha256, target_dir: str, prefix: str = "", chunk_store: ChunkStore = None,
+                        pack_store: PackStore = None) -> dict:
+    """列举远端文件获取大小，生成DownloadExecutor.run所需的下载列表
+
+    Args:
+        oss (OssOperation)
+        files_sha256 (Mapping): {路径: sha256}
+        target_dir (str): 恢复至的本地目录
+        prefix (str, 可选): 只恢复以此开头的路径
+        chunk_store (ChunkStore, 可选): 分块存储的文件以清单作为远程文件，大小从清单读取
+        pack_store (PackStore, 可选): 打包存储的文件以所在的包作为远程文件，大小从包内索引读取
+
+    Returns:
+        dict: {本地文件: (远程文件, sha256, 大小)}，压缩的Object为列举得到的压缩后的大小，DownloadExecutor从Header中读取原文件大小
+    """
+    remote_sizes = {obj.key: obj.size for obj in oss.list_remote_files(config.remote_base_dir)}
+    download_list = {}
+    missing = []
+    for path, sha256 in files_sha256.items():
+        if not path.startswith(prefix):
+            continue
+        if chunk_store and chunk_store.has_file(sha256):
+            download_list[os.path.join(target_dir, path)] = (chunk_store.manifest_object(sha256), sha256, chunk_store.file_size(sha256))
+            continue
+        if pack_store and pack_store.has_file(sha256):
+            pack_object, _, length = pack_store.location(sha256)
+            download_list[os.path.join(target_dir, path)] = (pack_object, sha256, length)
+            continue
+        remote_object = config.remote_base_dir + (sha256_to_path(sha256) if config.Encrypted_Filename_With_Sha256 else path)
+        if remote_object not in remote_sizes:
+            missing.append(path)
+            continue
+        download_list[os.path.join(target_dir, path)] = (remote_object, sha256, remote_sizes[remote_object])
+    if missing:
+        logger.warning("以下%d个文件在索引中存在但OSS中不存在，无法恢复：\n%s" % (len(missing), str(sorted(missing))))
+    return download_list
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="从OSS恢复备份到本地", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--target', default=None, help='恢复至的本地目录，默认为local_base_dir')
+    parser.add_argument('--prefix', default="", help='只恢复路径以此开头的文件，eg: personal/photos/')
+    parser.add_argument('--rsa_passphrase', help='RSA私钥密码')
+    parser.add_argument('--no_file_logger', action='store_true', help='不将日志写入文件')
+    args = parser.parse_args()
+
+    create_logger(args.no_file_logger, names=("restore", "download_executor", "chunk_store", "pack_store"))
+    color = Colored()
+    target_dir = args.target or config.local_base_dir
+    oss = OssOperation(rsa_passphrase=args.rsa_passphrase)
+
+    start_time = time.time()
+    chunk_store, pack_store = load_chunk_store(oss), load_pack_store(oss)
+    download_list = build_download_list(oss, load_index(oss, args.prefix), target_dir, args.prefix, chunk_store=chunk_store, pack_store=pack_store)
+    total_size = sum(file_size for _, _, file_size in download_list.values())
+    logger.info("需要恢复的文件总数：%s\n需要恢复的文件总大小：%s\n恢复至：%s" %
+                (color.red(len(download_list)), color.red(bytes_to_str(total_size)), color.red(target_dir)))
+
+    executor = DownloadExecutor(oss, config.temp_dir + config.remote_base_dir[:-1] + "-download-checkpoint/", max_workers=config.Download_Workers,
+                                max_large_downloads=config.Download_Large_Workers, large_file_size=config.Multipart_Download_Size, chunk_store=chunk_store, pack_store=pack_store)
+    with Progress("[progress.percentage]{task.percentage:>3.2f}%", BarColumn(), FileCount(), "•", "[progress.elapsed]已用时间", TimeElapsedColumn(),
+                  "•", "[progress.description]{task.description}", TextColumn("[bold blue]{task.fields[filename]}", justify="right")) as progress:
+        task = progress.add_task("[red]正在恢复文件", total=len(download_list), filename="")
+
+        def callback(local_file_name, succeeded, skipped):
+            progress.update(task, advance=1, filename=local_file_name)
+
+        failed = executor.run(download_list, progress_callback=callback)
+
+    total_time = time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
+    if failed:
+        logger.warning("以下文件恢复失败，再次运行将只下载失败和未完成的文件：\n" + str(sorted(failed)))
+    logger.info("\n恢复的文件总数：%s\n失败的文件总数：%s\n总耗时：%s" % (color.red(len(download_list) - len(failed)), color.red(len(failed)), total_time))
+    if config.SCT_Send_Key:
+        sct_push("[OSS-Sync]恢复完成", "#### 恢复的文件总数：%d 个  \n#### 失败的文件总数：%d 个  \n#### 总耗时：%s" %
+                 (len(download_list) - len(failed), len(failed), total_time))
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import argparse
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import oss2
+from rich.progress import BarColumn, Progress, TextColumn, TimeElapsedColumn
+
+from oss_sync_libs import Colored, FileCount, OssOperation, bytes_to_str, sct_push, sha256_to_path
+from restore import create_logger, load_chunk_store, load_index, load_pack_store
+from units.scrub_state import ScrubState
+
+try:
+    import config
+except ModuleNotFoundError:
+    raise Exception("无法找到config.py")
+
+logger = logging.getLogger("scrub")
+
+
+def indexed_objects(oss, files_sha256, chunk_store=None, pack_store=None) -> dict:
+    """列举远端文件获取大小，索引中存在但OSS中不存在的文件大小记为0，校验时会被判定为缺失
+
+    Args:
+        oss (OssOperation)
+        files_sha256 (Mapping): {路径: sha256}
+        chunk_store (ChunkStore, 可选): 分块存储的文件改为校验其引用的各个块
+        pack_store (PackStore, 可选): 打包存储的文件改为校验其所在的包
+
+    Returns:
+        dict: {Object: (sha256, 大小)}，以sha256作为文件名时多个路径对应同一个Object
+    """
+    remote_sizes = {obj.key: obj.size for obj in oss.list_remote_files(config.remote_base_dir)}
+    objects = {}
+    chunked, packed = set(), set()
+    for path, sha256 in files_sha256.items():
+        if chunk_store and chunk_store.has_file(sha256):
+            chunked.add(sha256)
+            continue
+        if pack_store and pack_store.has_file(sha256):
+            packed.add(sha256)
+            continue
+        remote_object = config.remote_base_dir + (sha256_to_path(sha256) if config.Encrypted_Filename_With_Sha256 else path)
+        objects[remote_object] = (sha256, remote_sizes.get(remote_object, 0))
+    if chunked:
+        for remote_object, sha256, size in chunk_store.iter_chunks(chunked):
+            objects[remote_object] = (sha256, size if remote_object in remote_sizes else 0)
+    if packed:
+        for remote_object, sha256 in pack_store.iter_packs(packed):
+            objects[remote_object] = (sha256, remote_sizes.get(remote_object, 0))
+    return objects
+
+
+def verify(oss, remote_object: str, sha256: str):
+    """校验一个Object
+
+    Returns:
+        bool: 是否校验通过，Object为归档类型且未解冻时返回None
+    """
+    try:
+        return oss.verify_remote_file_integrity(remote_object, file_sha256=sha256)
+    except oss2.exceptions.NoSuchKey:
+        return False
+    except oss2.exceptions.ServerError as err:
+        if err.code == 'InvalidObjectState':  # 归档/冷归档类型需要先解冻才能读取
+            return None
+        raise
+
+
+def scrub(oss, objects: dict, selected: list, state: ScrubState, max_workers: int, progress_callback=None) -> dict:
+    """并发流式校验selected中的Object，同时进行的校验数不超过max_workers的2倍，内存占用与文件大小无关
+
+    Args:
+        oss (OssOperation)
+        objects (dict): 见indexed_objects
+        selected (list): 本次需要校验的Object
+        state (ScrubState)
+        max_workers (int): 同时校验的Object数
+        progress_callback (callable, 可选): 每个Object完成时以progress_callback(Object)调用
+
+    Returns:
+        dict: {'corrupted': [校验不通过或缺失的Object], 'skipped': [未解冻的Object], 'errors': [网络错误的Object], 'bytes': 校验的总字节数}
+    """
+    result = {'corrupted': [], 'skipped': [], 'errors': [], 'bytes': 0}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrub") as executor:
+        futures = deque()
+
+        def collect():
+            remote_object, future = futures.popleft()
+            sha256, size = objects[remote_object]
+            try:
+                ok = future.result()
+            except oss2.exceptions.OssError as err:
+                logger.warning("[scrub] 无法校验%s：%s" % (remote_object, err))
+                result['errors'].append(remote_object)
+            else:
+                if ok is None:
+                    result['skipped'].append(remote_object)
+                else:
+                    if not ok:
+                        logger.error("[scrub] Object %s 校验不通过" % remote_object)
+                        result['corrupted'].append(remote_object)
+                    result['bytes'] += size
+                    state.record(remote_object, sha256, ok)
+            if progress_callback:
+                progress_callback(remote_object)
+
+        for remote_object in selected:
+            futures.append((remote_object, executor.submit(verify, oss, remote_object, objects[remote_object][0])))
+            if len(futures) >= max_workers * 2:
+                collect()
+        while futures:
+            collect()
+    return result
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="流式校验OSS中的文件，每次运行校验上次校验时间最早的一部分文件",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--percent', type=float, default=config.Scrub_Percent, help='本次校验的文件数占总数的百分比')
+    parser.add_argument('--bytes', type=int, default=config.Scrub_Byte_Budget, help='本次校验的文件总大小上限(B)，0为不限制')
+    parser.add_argument('--rsa_passphrase', help='RSA私钥密码')
+    parser.add_argument('--no_file_logger', action='store_true', help='不将日志写入文件')
+    args = parser.parse_args()
+
+    create_logger(args.no_file_logger, names=("scrub", "scrub_state", "chunk_store", "pack_store"))
+    color = Colored()
+    oss = OssOperation(rsa_passphrase=args.rsa_passphrase)
+
+    start_time = time.time()
+    objects = indexed_objects(oss, load_index(oss), chunk_store=load_chunk_store(oss), pack_store=load_pack_store(oss))
+    state = ScrubState(config.temp_dir + config.remote_base_dir[:-1] + "-scrub.db")
+    state.prune(objects)
+    selected = state.select(objects, fraction=args.percent / 100 if args.percent else None, byte_budget=args.bytes or None)
+    logger.info("Object总数：%s\n本次校验：%s个，共%s" %
+                (color.red(len(objects)), color.red(len(selected)), color.red(bytes_to_str(sum(objects[obj][1] for obj in selected)))))
+
+    with Progress("[progress.percentage]{task.percentage:>3.2f}%", BarColumn(), FileCount(), "•", "[progress.elapsed]已用时间", TimeElapsedColumn(),
+                  "•", "[progress.description]{task.description}", TextColumn("[bold blue]{task.fields[filename]}", justify="right")) as progress:
+        task = progress.add_task("[red]正在校验文件", total=len(selected), filename="")
+
+        def callback(remote_object):
+            progress.update(task, advance=1, filename=remote_object)
+
+        result = scrub(oss, objects, selected, state, config.Scrub_Workers, progress_callback=callback)
+    state.close()
+
+    total_time = time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
+    if result['skipped']:
+        logger.info("%d个归档/冷归档类型的Object未解冻，已跳过" % len(result['skipped']))
+    if result['errors']:
+        logger.warning("%d个Object由于网络错误无法校验，将在下次运行时优先校验" % len(result['errors']))
+    logger.info("\n校验的Object总数：%s\n校验的总大小：%s\n校验不通过：%s\n总耗时：%s" %
+                (color.red(len(selected) - len(result['skipped']) - len(result['errors'])), color.red(bytes_to_str(result['bytes'])),
+                 color.red(len(result['corrupted'])), total_time))
+    if result['corrupted']:
+        logger.error("以下Object校验不通过或不存在：\n" + str(sorted(result['corrupted'])))
+        if config.SCT_Send_Key:
+            sct_push("[OSS-Sync]完整性校验发现%d个损坏的文件" % len(result['corrupted']),
+                     "#### 以下Object校验不通过或不存在，请登录服务器检查：  \n" + "  \n".join(sorted(result['corrupted'])[:100]))
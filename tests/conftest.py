@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import os
+import sys
+import time
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# config.py不存在时使用config.pyexample.py
+if importlib.util.find_spec("config") is None:
+    _spec = importlib.util.spec_from_file_location("config", os.path.join(ROOT, "config.pyexample.py"))
+    sys.modules["config"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["config"])
+
+from oss_stub import OssStub, make_oss_operation  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path, monkeypatch):
+    """config.temp_dir指向每个测试独立的临时目录"""
+    import config
+
+    path = tmp_path / "oss-sync"
+    path.mkdir()
+    monkeypatch.setattr(config, "temp_dir", str(path) + os.sep)
+    return path
+
+
+@pytest.fixture
+def no_retry_delay(monkeypatch):
+    """RetryPolicy重试前不等待"""
+    from units import retry_policy
+
+    monkeypatch.setattr(retry_policy, "time", types.SimpleNamespace(monotonic=time.monotonic, sleep=lambda seconds: None))
+
+
+@pytest.fixture
+def oss_stub(monkeypatch):
+    import config
+
+    stub = OssStub().start()
+    monkeypatch.setattr(config, "bucket_name", stub.bucket_name)
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def oss(oss_stub):
+    """连接到oss_stub的OssOperation"""
+    return make_oss_operation(oss_stub)
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""测试使用的本地OSS替身
+
+在后台线程中运行的aiohttp服务器，按path style(Endpoint为IP时oss2和AsyncOssClient使用的格式)处理Object的PUT/复制/分片上传(包括列举分片)/GET/HEAD(支持Range)、
+列举、批量删除和解冻，以及版本控制的查询、列举和删除历史版本，并像OSS一样校验V1签名。归档/冷归档类型的Object在解冻完成前不能读取。每个请求的方法、Key、请求头和起止时间记录在log中，
+用于检查并发数和请求速率；fail()使匹配的请求返回错误，用于测试重试
+"""
+import asyncio
+import base64
+import email.utils
+import hashlib
+import hmac
+import re
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import unquote
+from xml.sax.saxutils import escape
+
+import oss2
+from aiohttp import web
+from Crypto.PublicKey import RSA
+
+from units.compression import Compressor
+from units.rate_limiter import RateLimiter
+from units.retry_policy import RetryPolicy
+
+ARCHIVE_CLASSES = ("Archive", "ColdArchive", "DeepColdArchive")
+SUBRESOURCES = oss2.auth.ProviderAuth._subresource_key_set
+
+Request = namedtuple('Request', ['method', 'key', 'query', 'headers', 'start', 'end'])
+StoredObject = namedtuple('StoredObject', ['data', 'headers', 'storage_class'])
+
+
+class OssStub(object):
+
+    def __init__(self, access_key_id: str = 'ak', access_key_secret: str = 'sk', bucket_name: str = 'bucket-x', delay: float = 0,
+                 restore_time: float = 0):
+        """
+        Args:
+            access_key_id (str, 可选)
+            access_key_secret (str, 可选)
+            bucket_name (str, 可选): 应符合Bucket命名规则，否则oss2拒绝发出请求
+            delay (float, 可选): 每个请求在返回前等待的时间(秒)
+            restore_time (float, 可选): 提交解冻后到解冻完成的时间(秒)
+        """
+        self.access_key_id = access_key_id
+        self.access_key_secret = access_key_secret
+        self.bucket_name = bucket_name
+        self.delay = delay
+        self.restore_time = restore_time
+        self.objects = {}  # {Key: StoredObject}
+        self.restores = {}  # {Key: 解冻完成的时间}
+        self.uploads = {}  # {UploadId: (Key, Header, 存储类型, {分片号: 数据})}
+        self.versioning = None  # Bucket的版本控制状态，eg: 'Enabled'
+        self.versions = {}  # {Key: [VersionId]}，只用于列举和删除历史版本，与objects相互独立
+        self.faults = []  # [[方法, Key, 查询参数, 状态码, 剩余次数]]
+        self.log = []
+        self.endpoint = None
+        self.__lock = threading.Lock()
+        self.__loop = None
+        self.__runner = None
+        self.__thread = None
+
+    def start(self):
+        """启动服务器，self.endpoint为其地址"""
+        self.__loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def serve():
+            app = web.Application(client_max_size=1024 ** 3)
+            app.router.add_route('*', '/{tail:.*}', self.__handle)
+            self.__runner = web.AppRunner(app)
+            await self.__runner.setup()
+            await web.TCPSite(self.__runner, '127.0.0.1', 0).start()
+            self.endpoint = 'http://127.0.0.1:%d' % self.__runner.addresses[0][1]
+            started.set()
+
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name="oss-stub", daemon=True)
+        self.__thread.start()
+        asyncio.run_coroutine_threadsafe(serve(), self.__loop)
+        started.wait(10)
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.__runner.cleanup(), self.__loop).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
+
+    def put(self, key: str, data: bytes, storage_class: str = "Standard", headers: dict = None):
+        """直接写入一个Object，不经过HTTP"""
+        self.objects[key] = StoredObject(data, dict(headers or {}), storage_class)
+
+    def fail(self, status: int, method: str = None, key: str = None, times: int = None, **query):
+        """之后匹配的请求返回status错误
+
+        Args:
+            status (int): 404为NoSuchKey，500为InternalError，503为ServiceUnavailable，其他为AccessDenied
+            method (str, 可选)
+            key (str, 可选)
+            times (int, 可选): 返回错误的次数，None为一直返回错误
+            **query: 请求中应包含的查询参数，eg: partNumber='2'；值为None时只要求包含该参数
+        """
+        with self.__lock:
+            self.faults.append([method, key, query, status, times])
+
+    def __fault(self, req: web.Request, key: str):
+        with self.__lock:
+            for fault in self.faults:
+                method, fault_key, query, status, times = fault
+                if (method in (None, req.method) and fault_key in (None, key) and all(name in req.query if value is None else req.query.get(name) == value for name, value in query.items())
+                        and times != 0):
+                    if times is not None:
+                        fault[4] -= 1
+                    return self.__error(status, {404: 'NoSuchKey', 500: 'InternalError', 503: 'ServiceUnavailable'}.get(status, 'AccessDenied'),
+                                        req.method != 'HEAD')
+        return None
+
+    def requests(self, method: str = None, prefix: str = '') -> list:
+        with self.__lock:
+            return [req for req in self.log if (method is None or req.method == method) and req.key.startswith(prefix)]
+
+    def max_concurrency(self, method: str = None, prefix: str = '') -> int:
+        """同时处理的请求数的最大值"""
+        events = []
+        for req in self.requests(method, prefix):
+            events += [(req.start, 1), (req.end, -1)]
+        current = peak = 0
+        for _, change in sorted(events):
+            current += change
+            peak = max(peak, current)
+        return peak
+
+    def string_to_sign(self, method: str, key: str, query, headers) -> str:
+        oss_headers = sorted((name.lower(), value) for name, value in headers.items() if name.lower().startswith('x-oss-'))
+        subresources = sorted((name, value) for name, value in query.items() if name in SUBRESOURCES)
+        resource = '/%s/%s' % (self.bucket_name, key)
+        if subresources:
+            resource += '?' + '&'.join(name + '=' + value if value else name for name, value in subresources)
+        return '\n'.join([method, headers.get('Content-MD5', ''), headers.get('Content-Type', ''), headers.get('Date', ''),
+                          ''.join('%s:%s\n' % header for header in oss_headers) + resource])
+
+    def __signature_matches(self, req: web.Request, key: str) -> bool:
+        digest = hmac.new(self.access_key_secret.encode(), self.string_to_sign(req.method, key, req.query, req.headers).encode(), hashlib.sha1)
+        return req.headers.get('Authorization') == 'OSS %s:%s' % (self.access_key_id, base64.b64encode(digest.digest()).decode())
+
+    @staticmethod
+    def __error(status: int, code: str, body: bool = True) -> web.Response:
+        xml = '<?xml version="1.0" encoding="UTF-8"?><Error><Code>%s</Code><Message>%s</Message><RequestId>stub</RequestId></Error>' % (code, code)
+        return web.Response(status=status, body=xml.encode() if body else None, headers={'x-oss-request-id': 'stub'})
+
+    def __restored(self, key: str) -> bool:
+        return key in self.restores and time.monotonic() >= self.restores[key]
+
+    async def __handle(self, req: web.Request) -> web.Response:
+        start = time.monotonic()
+        parts = req.path.split('/', 2)
+        key = parts[2] if len(parts) > 2 else ''
+        body = await req.read()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if not self.__signature_matches(req, key):
+            resp = self.__error(403, 'SignatureDoesNotMatch', req.method != 'HEAD')
+        else:
+            resp = self.__fault(req, key) or self.__dispatch(req, key, body)
+        with self.__lock:
+            self.log.append(Request(req.method, key, dict(req.query), dict(req.headers), start, time.monotonic()))
+        return resp
+
+    def __dispatch(self, req: web.Request, key: str, body: bytes) -> web.Response:
+        if 'uploads' in req.query or 'uploadId' in req.query:
+            return self.__multipart(req, key, body)
+        if req.method == 'PUT':
+            storage_class = req.headers.get('x-oss-storage-class', 'Standard')
+            if 'x-oss-copy-source' in req.headers:
+                src, error = self.__source(req)
+                if error:
+                    return error
+                self.objects[key] = StoredObject(src.data, src.headers, storage_class)
+            else:
+                meta = {name.lower(): value for name, value in req.headers.items() if name.lower().startswith('x-oss-meta-')}
+                self.put(key, body, storage_class, meta)
+            return web.Response(headers={'ETag': '"%s"' % hashlib.md5(self.objects[key].data).hexdigest().upper()})
+        if req.method == 'POST' and 'delete' in req.query and '<VersionId>' in body.decode():
+            deleted = ''
+            for name, version_id in re.findall('<Key>(.*?)</Key><VersionId>(.*?)</VersionId>', body.decode()):
+                if version_id in self.versions.get(name, []):
+                    self.versions[name].remove(version_id)
+                    deleted += '<Deleted><Key>%s</Key><VersionId>%s</VersionId></Deleted>' % (name, version_id)
+            return web.Response(body=('<DeleteResult>%s</DeleteResult>' % deleted).encode())
+        if req.method == 'POST' and 'delete' in req.query:
+            keys = [unquote(name) for name in re.findall('<Key>(.*?)</Key>', body.decode())]
+            for name in keys:
+                self.objects.pop(name, None)
+            deleted = ''.join('<Deleted><Key>%s</Key></Deleted>' % name for name in keys)
+            return web.Response(body=('<DeleteResult>%s</DeleteResult>' % deleted).encode())
+        if req.method == 'POST' and 'restore' in req.query:
+            if key not in self.objects:
+                return self.__error(404, 'NoSuchKey')
+            if self.objects[key].storage_class not in ARCHIVE_CLASSES:
+                return self.__error(400, 'OperationNotSupported')
+            if key in self.restores:
+                return web.Response() if self.__restored(key) else self.__error(409, 'RestoreAlreadyInProgress')
+            self.restores[key] = time.monotonic() + self.restore_time
+            return web.Response(status=202)
+        if req.method == 'GET' and not key and 'versioning' in req.query:
+            status = '<Status>%s</Status>' % self.versioning if self.versioning else ''
+            return web.Response(body=('<VersioningConfiguration>%s</VersioningConfiguration>' % status).encode())
+        if req.method == 'GET' and not key and 'versions' in req.query:
+            return self.__list_versions(req.query)
+        if req.method == 'GET' and not key:
+            return self.__list(req.query)
+        if req.method in ('GET', 'HEAD'):
+            if key not in self.objects:
+                return self.__error(404, 'NoSuchKey', req.method != 'HEAD')
+            obj = self.objects[key]
+            headers = dict(obj.headers, **{'x-oss-storage-class': obj.storage_class, 'Last-Modified': email.utils.formatdate(usegmt=True),
+                                           'ETag': '"%s"' % hashlib.md5(obj.data).hexdigest().upper()})
+            if obj.storage_class in ARCHIVE_CLASSES and key in self.restores:
+                headers['x-oss-restore'] = 'ongoing-request="false", expiry-date="Sun, 16 Apr 2034 08:12:33 GMT"' if self.__restored(key) \
+                    else 'ongoing-request="true"'
+            if req.method == 'GET' and obj.storage_class in ARCHIVE_CLASSES and not self.__restored(key):
+                return self.__error(403, 'InvalidObjectState')
+            data = obj.data
+            if 'Range' in req.headers:
+                first, last = req.headers['Range'][len('bytes='):].split('-')
+                first, last = int(first), min(int(last or len(data) - 1), len(data) - 1)
+                headers['Content-Range'] = 'bytes %d-%d/%d' % (first, last, len(data))
+                return web.Response(status=206, body=data[first:last + 1], headers=headers)
+            return web.Response(body=data, headers=headers)
+        return self.__error(405, 'MethodNotAllowed')
+
+    def __source(self, req: web.Request):
+        """复制请求的源数据，源文件不存在或未解冻时返回错误响应"""
+        source_key = unquote(req.headers['x-oss-copy-source'].split('/', 2)[2])
+        if source_key not in self.objects:
+            return None, self.__error(404, 'NoSuchKey')
+        src = self.objects[source_key]
+        if src.storage_class in ARCHIVE_CLASSES and not self.__restored(source_key):
+            return None, self.__error(403, 'InvalidObjectState')
+        return src, None
+
+    def __multipart(self, req: web.Request, key: str, body: bytes) -> web.Response:
+        if req.method == 'POST' and 'uploads' in req.query:
+            upload_id = hashlib.md5(('%s-%d' % (key, len(self.uploads))).encode()).hexdigest()
+            meta = {name.lower(): value for name, value in req.headers.items() if name.lower().startswith('x-oss-meta-')}
+            self.uploads[upload_id] = (key, meta, req.headers.get('x-oss-storage-class', 'Standard'), {})
+            return web.Response(body=('<InitiateMultipartUploadResult><Bucket>%s</Bucket><Key>%s</Key><UploadId>%s</UploadId>'
+                                      '</InitiateMultipartUploadResult>' % (self.bucket_name, escape(key), upload_id)).encode())
+        if req.query['uploadId'] not in self.uploads:
+            return self.__error(404, 'NoSuchUpload')
+        upload_key, meta, storage_class, parts = self.uploads[req.query['uploadId']]
+        if req.method == 'PUT':
+            data = body
+            if 'x-oss-copy-source' in req.headers:
+                src, error = self.__source(req)
+                if error:
+                    return error
+                first, last = (int(offset) for offset in req.headers['x-oss-copy-source-range'][len('bytes='):].split('-'))
+                data = src.data[first:last + 1]
+            parts[int(req.query['partNumber'])] = data
+            return web.Response(headers={'ETag': '"%s"' % hashlib.md5(data).hexdigest().upper()})
+        if req.method == 'POST':
+            numbers = [int(number) for number in re.findall('<PartNumber>(.*?)</PartNumber>', body.decode())]
+            if any(number not in parts for number in numbers):
+                return self.__error(400, 'InvalidPart')
+            self.put(upload_key, b''.join(parts[number] for number in numbers), storage_class, meta)
+            del self.uploads[req.query['uploadId']]
+            return web.Response(body=('<CompleteMultipartUploadResult><Key>%s</Key></CompleteMultipartUploadResult>' % escape(upload_key)).encode())
+        if req.method == 'GET':
+            marker = int(req.query.get('part-number-marker') or 0)
+            numbers = sorted(number for number in parts if number > marker)
+            max_parts = int(req.query.get('max-parts', 1000))
+            truncated = len(numbers) > max_parts
+            numbers = numbers[:max_parts]
+            xml = '<ListPartsResult><IsTruncated>%s</IsTruncated><NextPartNumberMarker>%d</NextPartNumberMarker>' % (
+                'true' if truncated else 'false', numbers[-1] if numbers else marker)
+            for number in numbers:
+                xml += '<Part><PartNumber>%d</PartNumber><LastModified>2024-01-01T00:00:00.000Z</LastModified><ETag>"%s"</ETag><Size>%d</Size></Part>' % (
+                    number, hashlib.md5(parts[number]).hexdigest().upper(), len(parts[number]))
+            return web.Response(body=(xml + '</ListPartsResult>').encode())
+        del self.uploads[req.query['uploadId']]
+        return web.Response(status=204)
+
+    def __list(self, query) -> web.Response:
+        """ListObjectsV2，不支持delimiter"""
+        keys = sorted(key for key in self.objects if key.startswith(query.get('prefix', '')) and key > query.get('continuation-token', ''))
+        max_keys = int(query.get('max-keys', 100))
+        truncated = len(keys) > max_keys
+        keys = keys[:max_keys]
+        xml = '<ListBucketResult><IsTruncated>%s</IsTruncated>' % ('true' if truncated else 'false')
+        if truncated:
+            xml += '<NextContinuationToken>%s</NextContinuationToken>' % escape(keys[-1])
+        for key in keys:
+            obj = self.objects[key]
+            xml += '<Contents><Key>%s</Key><LastModified>2024-01-01T00:00:00.000Z</LastModified><ETag>"%s"</ETag><Type>Normal</Type>' \
+                   '<Size>%d</Size><StorageClass>%s</StorageClass></Contents>' % (escape(key), hashlib.md5(obj.data).hexdigest().upper(),
+                                                                                  len(obj.data), obj.storage_class)
+        return web.Response(body=(xml + '</ListBucketResult>').encode())
+
+    def __list_versions(self, query) -> web.Response:
+        """ListObjectVersions，按Key分页(max-keys为Key的数量)，支持delimiter"""
+        prefix, delimiter = query.get('prefix', ''), query.get('delimiter', '')
+        keys, common_prefixes = [], set()
+        for key in sorted(self.versions):
+            if not key.startswith(prefix) or key <= query.get('key-marker', ''):
+                continue
+            if delimiter and delimiter in key[len(prefix):]:
+                common_prefixes.add(key[:key.index(delimiter, len(prefix)) + 1])
+            else:
+                keys.append(key)
+        max_keys = int(query.get('max-keys', 100))
+        truncated = len(keys) > max_keys
+        keys = keys[:max_keys]
+        xml = '<ListVersionsResult><Name>%s</Name><Prefix>%s</Prefix><KeyMarker>%s</KeyMarker><VersionIdMarker></VersionIdMarker>' \
+              '<MaxKeys>%d</MaxKeys><Delimiter>%s</Delimiter><IsTruncated>%s</IsTruncated>' % (
+                  self.bucket_name, escape(prefix), escape(query.get('key-marker', '')), max_keys, delimiter, 'true' if truncated else 'false')
+        if truncated:
+            xml += '<NextKeyMarker>%s</NextKeyMarker><NextVersionIdMarker></NextVersionIdMarker>' % escape(keys[-1])
+        for key in keys:
+            for version_id in self.versions[key]:
+                xml += '<Version><Key>%s</Key><VersionId>%s</VersionId><IsLatest>false</IsLatest><LastModified>2024-01-01T00:00:00.000Z' \
+                       '</LastModified><ETag>"0"</ETag><Type>Normal</Type><Size>0</Size><StorageClass>Standard</StorageClass><Owner><ID>0</ID><DisplayName>0</DisplayName></Owner>' \
+                       '</Version>' % (escape(key), version_id)
+        xml += ''.join('<CommonPrefixes><Prefix>%s</Prefix></CommonPrefixes>' % escape(name) for name in sorted(common_prefixes))
+        return web.Response(body=(xml + '</ListVersionsResult>').encode())
+
+
+def make_oss_operation(stub: OssStub, crypto_provider=None, limiter: RateLimiter = None, compressor: Compressor = None):
+    """创建连接到stub的OssOperation
+
+    OssOperation.__init__会读取密钥、检查Bucket和外网连接，这里直接设置其使用的属性
+
+    Args:
+        stub (OssStub): 已启动的OSS替身
+        crypto_provider (可选): 默认为新生成的RSA密钥对
+        limiter (RateLimiter, 可选): 默认不限速
+        compressor (Compressor, 可选): 默认不压缩
+    """
+    from oss_sync_libs import OssOperation
+
+    if crypto_provider is None:
+        key = RSA.generate(2048)
+        crypto_provider = oss2.crypto.RsaProvider({'private_key': key.export_key().decode(), 'public_key': key.publickey().export_key().decode()})
+    auth = oss2.Auth(stub.access_key_id, stub.access_key_secret)
+    oss = OssOperation.__new__(OssOperation)
+    oss._OssOperation__OssEndpoint = stub.endpoint
+    oss._OssOperation__bucket = oss2.CryptoBucket(auth, stub.endpoint, stub.bucket_name, crypto_provider=crypto_provider)
+    oss._OssOperation__fallback_bucket = None
+    oss._OssOperation__plain_bucket = oss2.Bucket(auth, stub.endpoint, stub.bucket_name)
+    oss._OssOperation__restore_configuration_model = [oss2.models.RESTORE_TIER_EXPEDITED, oss2.models.RESTORE_TIER_STANDARD,
+                                                      oss2.models.RESTORE_TIER_BULK]
+    oss._OssOperation__multipart_upload_size = 1024 * 1024 * 50
+    oss._OssOperation__limiter = limiter or RateLimiter()
+    oss._OssOperation__versioning = False
+    oss._OssOperation__delete_policy = RetryPolicy.from_config("delete")
+    oss._OssOperation__compressor = compressor or Compressor(level=0)
+    return oss
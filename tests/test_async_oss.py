@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import oss2
+import pytest
+
+from units.async_oss import AsyncOssClient, EventLoopThread
+
+SIGNED_HEADERS = ('content-md5', 'content-type', 'date')
+
+
+@pytest.fixture
+def client(oss_stub, monkeypatch):
+    """连接到oss_stub的AsyncOssClient，signed中记录签名时的请求头"""
+    signed = []
+    sign_request = oss2.Auth._sign_request
+
+    def record(auth, req, bucket_name, key):
+        sign_request(auth, req, bucket_name, key)
+        signed.append({name.lower(): value for name, value in req.headers.items() if value is not None})
+
+    monkeypatch.setattr(oss2.Auth, "_sign_request", record)
+    loop_thread = EventLoopThread()
+    client = loop_thread.run(AsyncOssClient(oss_stub.access_key_id, oss_stub.access_key_secret, oss_stub.endpoint, oss_stub.bucket_name,
+                                            max_retries=1).open())
+    client.run = loop_thread.run
+    client.signed = signed
+    yield client
+    loop_thread.run(client.close())
+    loop_thread.close()
+
+
+def assert_sent_as_signed(oss_stub, signed):
+    assert len(oss_stub.log) == len(signed)
+    for req, headers in zip(oss_stub.log, signed):
+        sent = {name.lower(): value for name, value in req.headers.items()}
+        for name, value in headers.items():
+            if name in SIGNED_HEADERS or name.startswith('x-oss-'):
+                assert sent.get(name) == value, (req.method, name)
+
+
+def test_object_requests_are_signed_as_sent(client, oss_stub):
+    data = bytes(range(256)) * 10
+    client.run(client.put_object("dir/a b", data, headers={'x-oss-meta-sha256': 'abc', 'x-oss-storage-class': 'IA'}))
+    assert oss_stub.objects["dir/a b"].data == data
+    assert oss_stub.objects["dir/a b"].storage_class == "IA"
+
+    assert client.run(client.head_object("dir/a b"))['x-oss-meta-sha256'] == 'abc'
+    assert client.run(client.get_object("dir/a b", byte_range=(100, 199))) == data[100:200]
+    client.run(client.copy_object("dir/a b", "dir/copy", headers={'x-oss-storage-class': 'Archive'}))
+    assert oss_stub.objects["dir/copy"].storage_class == "Archive"
+
+    oss_stub.restore_time = 60
+    assert client.run(client.restore_object("dir/copy")) == 202
+    with pytest.raises(oss2.exceptions.RestoreAlreadyInProgress):
+        client.run(client.restore_object("dir/copy"))
+
+    assert sorted(client.run(client.delete_objects(["dir/a b", "dir/copy"]))) == ["dir/a b", "dir/copy"]
+    assert not oss_stub.objects
+    assert all(req.method != 'POST' or req.headers.get('Content-Type') for req in oss_stub.log)
+    assert_sent_as_signed(oss_stub, client.signed)
+
+
+def test_errors_are_raised_as_oss2_exceptions(client, oss_stub):
+    with pytest.raises(oss2.exceptions.NoSuchKey):
+        client.run(client.get_object("missing"))
+    with pytest.raises(oss2.exceptions.NotFound):
+        client.run(client.head_object("missing"))
+    oss_stub.access_key_secret = "another secret"
+    with pytest.raises(oss2.exceptions.ServerError) as err:
+        client.run(client.put_object("a", b"data"))
+    assert err.value.code == "SignatureDoesNotMatch"
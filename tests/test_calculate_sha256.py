@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+
+import pytest
+
+import config
+from oss_sync_libs import calculate_local_file_sha256
+
+
+@pytest.mark.parametrize("buffer_size", [4096, config.Hash_Buffer_Size])
+@pytest.mark.parametrize("delta", [None, -1, 0, 1])
+def test_matches_hashlib_around_buffer_size(tmp_path, monkeypatch, buffer_size, delta):
+    monkeypatch.setattr(config, "Hash_Buffer_Size", buffer_size)
+    data = os.urandom(0 if delta is None else buffer_size + delta)
+    path = tmp_path / "file"
+    path.write_bytes(data)
+    assert calculate_local_file_sha256(str(path)) == hashlib.sha256(data).hexdigest()
+
+
+def test_missing_file(tmp_path):
+    assert calculate_local_file_sha256(str(tmp_path / "missing")) is False
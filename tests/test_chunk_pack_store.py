@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+
+import pytest
+
+from units.chunk_store import ChunkStore
+from units.chunker import Chunker
+from units.pack_store import PackStore
+
+
+def test_archive_storage_class_is_rejected(oss, tmp_path):
+    with pytest.raises(ValueError):
+        ChunkStore(oss, "nas-backup/", str(tmp_path / "chunks"), storage_class="Archive")
+    with pytest.raises(ValueError):
+        PackStore(oss, "nas-backup/", str(tmp_path / "packs"), storage_class="ColdArchive")
+
+
+def test_chunked_file_is_readable_without_restore(oss, oss_stub, tmp_path):
+    data = os.urandom(300000)
+    (tmp_path / "file").write_bytes(data)
+    file_sha256 = hashlib.sha256(data).hexdigest()
+    store = ChunkStore(oss, "nas-backup/", str(tmp_path / "chunks"), chunker=Chunker(4096, 16384, 65536), storage_class="IA")
+    store.load()
+    store.upload_file(str(tmp_path / "file"), file_sha256)
+
+    chunks = [obj for key, obj in oss_stub.objects.items() if key.startswith("nas-backup/.chunks/data/")]
+    assert chunks and all(obj.storage_class == "IA" for obj in chunks)
+    restored = ChunkStore(oss, "nas-backup/", str(tmp_path / "other-chunks"))
+    restored.load()
+    assert restored.restore_file(file_sha256, str(tmp_path / "restored")) == file_sha256
+    assert (tmp_path / "restored").read_bytes() == data
+
+
+def test_packed_files_are_readable_without_restore(oss, oss_stub, tmp_path):
+    files = {}
+    for i in range(5):
+        data = os.urandom(1000 + i)
+        (tmp_path / str(i)).write_bytes(data)
+        files[str(i)] = hashlib.sha256(data).hexdigest()
+    store = PackStore(oss, "nas-backup/", str(tmp_path / "packs"), pack_size=3000, storage_class="IA")
+    store.load()
+    for name, file_sha256 in files.items():
+        store.add(str(tmp_path / name), file_sha256)
+    assert all(error is None for _, error in store.join())
+    store.shutdown()
+
+    packs = [obj for key, obj in oss_stub.objects.items() if key.startswith("nas-backup/.packs/data/")]
+    assert len(packs) == 2 and all(obj.storage_class == "IA" for obj in packs)
+    restored = PackStore(oss, "nas-backup/", str(tmp_path / "other-packs"))
+    restored.load()
+    for name, file_sha256 in files.items():
+        assert restored.restore_file(file_sha256, str(tmp_path / "restored")) == file_sha256
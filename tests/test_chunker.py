@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+
+import pytest
+
+from units.chunker import Chunker
+
+
+@pytest.fixture
+def chunker():
+    return Chunker(4096, 16384, 65536)
+
+
+def cut_all(chunker: Chunker, data: bytes) -> list:
+    chunks, start = [], 0
+    while start < len(data):
+        end = chunker.cut(data, start)
+        chunks.append((start, data[start:end]))
+        start = end
+    return chunks
+
+
+@pytest.mark.parametrize("size", [0, 1, 4096, 65536, 65537, 1024 * 1024 + 3])
+def test_chunks_match_cutting_whole_file(chunker, tmp_path, size):
+    data = random.Random(size).randbytes(size)
+    (tmp_path / "file").write_bytes(data)
+
+    assert list(chunker.chunks(str(tmp_path / "file"))) == cut_all(chunker, data)
+
+
+def test_insertion_only_changes_nearby_chunks(chunker, tmp_path):
+    data = random.Random(1).randbytes(1024 * 1024)
+    (tmp_path / "a").write_bytes(data)
+    (tmp_path / "b").write_bytes(data[:500000] + b"inserted" + data[500000:])
+
+    before = {chunk for _, chunk in chunker.chunks(str(tmp_path / "a"))}
+    after = [chunk for _, chunk in chunker.chunks(str(tmp_path / "b"))]
+    assert len([chunk for chunk in after if chunk not in before]) <= 2
+
+
+def test_file_truncated_while_chunking(chunker, tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(os.urandom(1024 * 1024))
+    chunks = chunker.chunks(str(path))
+    first_offset, first = next(chunks)
+    os.truncate(path, 100000)
+    rest = list(chunks)
+
+    assert first_offset == 0
+    assert sum(len(chunk) for chunk in [first] + [chunk for _, chunk in rest]) <= 1024 * 1024
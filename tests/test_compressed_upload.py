@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+
+import oss2
+import pytest
+
+from oss_stub import make_oss_operation
+from units.compression import Compressor
+
+
+@pytest.fixture
+def oss(oss_stub):
+    """压缩上传，分片大小为oss2允许的最小值"""
+    oss = make_oss_operation(oss_stub, compressor=Compressor(level=3))
+    oss._OssOperation__multipart_upload_size = oss2.defaults.min_part_size
+    return oss
+
+
+@pytest.fixture
+def local_file(tmp_path):
+    """压缩后约为一半大小，分为多个分片"""
+    path = tmp_path / "file"
+    path.write_bytes(bytes(b'abcdefghijklmnop'[byte & 15] for byte in os.urandom(12 * oss2.defaults.min_part_size)))
+    return path
+
+
+def leftovers(temp_dir) -> list:
+    """config.temp_dir中残留的压缩文件和断点续传记录"""
+    return [name for name in os.listdir(temp_dir) if name.endswith(".zstd")] + os.listdir(temp_dir / oss2.resumable._UPLOAD_TEMP_DIR)
+
+
+def test_interrupted_compressed_upload_resumes(oss, oss_stub, local_file, temp_dir, no_retry_delay):
+    oss_stub.fail(500, "PUT", "remote/file", times=5, partNumber="3")
+    with pytest.raises(oss2.exceptions.ServerError):
+        oss.encrypt_and_upload_files(str(local_file), "remote/file")
+    assert len(leftovers(temp_dir)) == 2
+
+    # 再次运行时使用同一个压缩文件，从已上传的分片继续
+    oss.encrypt_and_upload_files(str(local_file), "remote/file")
+    assert len(oss_stub.requests("POST", "remote/file")) == 2  # 初始化和完成分片上传各一次
+    assert len([req for req in oss_stub.requests("PUT", "remote/file") if req.query["partNumber"] == "1"]) == 1
+    assert leftovers(temp_dir) == []
+    assert oss.verify_remote_file_integrity("remote/file", hashlib.sha256(local_file.read_bytes()).hexdigest())
+
+
+def test_permanently_failed_compressed_upload_is_cleaned_up(oss, oss_stub, local_file, temp_dir, no_retry_delay):
+    oss_stub.fail(403, "PUT", "remote/file", partNumber="3")
+    with pytest.raises(oss2.exceptions.AccessDenied):
+        oss.encrypt_and_upload_files(str(local_file), "remote/file")
+
+    assert len([req for req in oss_stub.requests("PUT", "remote/file") if req.query["partNumber"] == "3"]) == 1
+    assert leftovers(temp_dir) == []
+    assert oss_stub.uploads == {}
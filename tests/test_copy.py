@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+
+import config
+import oss2
+import pytest
+
+from oss_sync_libs import sha256_sidecar_name
+
+
+@pytest.fixture
+def multipart_copy(monkeypatch):
+    monkeypatch.setattr(config, "Multipart_Copy_Size", 1000)
+    monkeypatch.setattr(config, "Multipart_Copy_Part_Size", oss2.defaults.min_part_size)
+
+
+PART_SIZE = oss2.defaults.min_part_size
+SOURCE_SIZE = PART_SIZE * 6 + 100  # 分片复制时为7个分片
+
+
+def upload(oss, tmp_path, remote_object_name: str, data: bytes):
+    local = tmp_path / os.path.basename(remote_object_name)
+    local.write_bytes(data)
+    oss.encrypt_and_upload_files(str(local), remote_object_name)
+
+
+def download(oss, tmp_path, remote_object_name: str) -> bytes:
+    local = tmp_path / "downloaded"
+    assert oss.download_and_decrypt_file(str(local), remote_object_name, verify_integrity=True) == 200
+    return local.read_bytes()
+
+
+def test_copy_single_request(oss, oss_stub, tmp_path):
+    data = os.urandom(500)
+    upload(oss, tmp_path, "src", data)
+    oss.copy_remote_file("src", "dst", "IA", src_size=500)
+
+    assert oss_stub.objects["dst"].storage_class == "IA"
+    assert download(oss, tmp_path, "dst") == data
+
+
+def test_multipart_copy_keeps_encryption_headers(oss, oss_stub, tmp_path, multipart_copy):
+    data = os.urandom(SOURCE_SIZE)
+    upload(oss, tmp_path, "src", data)
+    oss.copy_remote_file("src", "dst")
+
+    assert len([req for req in oss_stub.requests("PUT", "dst") if "partNumber" in req.query]) == 7
+    assert download(oss, tmp_path, "dst") == data
+
+
+def test_failed_part_is_retried_alone(oss, oss_stub, tmp_path, multipart_copy, no_retry_delay):
+    upload(oss, tmp_path, "src", os.urandom(SOURCE_SIZE))
+    oss_stub.fail(500, "PUT", "dst", times=2, partNumber="3")
+    oss.copy_remote_file("src", "dst")
+
+    part_requests = [req.query["partNumber"] for req in oss_stub.requests("PUT", "dst")]
+    assert part_requests.count("3") == 3
+    assert all(part_requests.count(str(number)) == 1 for number in (1, 2, 4, 5, 6, 7))
+    assert len(oss_stub.requests("POST", "dst")) == 2  # 初始化和完成各一次
+
+
+def test_retries_are_not_multiplied(oss, oss_stub, tmp_path, multipart_copy, no_retry_delay):
+    upload(oss, tmp_path, "src", os.urandom(SOURCE_SIZE))
+    oss_stub.fail(500, "PUT", "dst", partNumber="3")
+    with pytest.raises(oss2.exceptions.ServerError):
+        oss.copy_remote_file("src", "dst", src_size=SOURCE_SIZE)
+
+    part_requests = [req.query["partNumber"] for req in oss_stub.requests("PUT", "dst")]
+    assert part_requests.count("3") == config.Max_Retries
+    assert len([req for req in oss_stub.requests("POST", "dst") if "uploads" in req.query]) == 1
+    assert not oss_stub.uploads  # 已中止分片上传
+
+
+def test_missing_source_is_not_retried(oss, oss_stub, no_retry_delay):
+    with pytest.raises(oss2.exceptions.NotFound):
+        oss.copy_remote_file("missing", "dst")
+    assert len(oss_stub.requests("HEAD", "missing")) == 1
+
+
+@pytest.mark.parametrize("multipart", [False, True])
+def test_sha256_sidecar_is_copied(oss, oss_stub, tmp_path, monkeypatch, multipart):
+    monkeypatch.setattr(config, "Single_Pass_Upload_Size", 1000)
+    if multipart:
+        monkeypatch.setattr(config, "Multipart_Copy_Size", 1000)
+        monkeypatch.setattr(config, "Multipart_Copy_Part_Size", PART_SIZE)
+    oss._OssOperation__multipart_upload_size = PART_SIZE
+    data = os.urandom(SOURCE_SIZE)
+    (tmp_path / "src").write_bytes(data)
+    file_sha256 = oss.stream_upload_file(str(tmp_path / "src"), "src")
+    oss.copy_remote_file("src", "dst", "IA", src_size=SOURCE_SIZE)
+
+    assert oss_stub.objects[sha256_sidecar_name("dst")].headers["x-oss-meta-sha256"] == file_sha256
+    assert oss_stub.objects[sha256_sidecar_name("dst")].storage_class == "Standard"
+    assert oss.verify_remote_file_integrity("dst", file_sha256)
+
+
+def test_objects_with_sha256_header_have_no_sidecar(oss, oss_stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "Single_Pass_Upload_Size", 1000)
+    upload(oss, tmp_path, "src", os.urandom(500))
+    oss.copy_remote_file("src", "small", "IA", src_size=500)
+    upload(oss, tmp_path, "src", os.urandom(5000))
+    oss.copy_remote_file("src", "large", "IA", src_size=5000)
+
+    assert not any(key.startswith(sha256_sidecar_name("")) for key in oss_stub.objects)
+    assert [req.key for req in oss_stub.requests("HEAD")] == ["src"]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import config
+
+
+def put_files(oss_stub, keys):
+    for key in keys:
+        oss_stub.put(key, b"data")
+
+
+def test_failed_batches_are_returned(oss, oss_stub, monkeypatch, no_retry_delay):
+    monkeypatch.setattr(config, "Delete_Workers", 1)
+    keys = ["nas-backup/%04d" % i for i in range(2500)]
+    put_files(oss_stub, keys)
+    oss_stub.fail(503, "POST", times=1)
+    oss_stub.fail(403, "POST", times=1)
+
+    # 第一批先返回503，重试时返回403，不再重试；之后的批次不受影响
+    failed = oss.delete_remote_files(keys)
+    assert failed == keys[:1000]
+    assert sorted(oss_stub.objects) == sorted(failed)
+
+
+def test_versions_are_listed_once_per_directory(oss, oss_stub, monkeypatch):
+    monkeypatch.setattr(config, "Delete_Object_Versions", True)
+    oss_stub.versioning = "Enabled"
+    oss._OssOperation__versioning = None
+    for i in range(300):
+        oss_stub.versions["nas-backup/a/%03d" % i] = ["v1", "v2"]
+        oss_stub.versions["nas-backup/b/%03d" % i] = ["v1"]
+    oss_stub.versions["nas-backup/a/sub/kept"] = ["v1"]
+    oss_stub.versions["nas-backup/a/000-kept"] = ["v1"]
+    delete_list = ["nas-backup/a/%03d" % i for i in range(300)] + ["nas-backup/b/%03d" % i for i in range(0, 300, 2)]
+
+    assert oss.delete_remote_files(delete_list) == []
+    assert all(not oss_stub.versions[key] for key in delete_list)
+    assert sum(len(versions) for versions in oss_stub.versions.values()) == 150 + 2
+    listings = [req for req in oss_stub.requests("GET") if "versions" in req.query]
+    assert sorted(req.query["prefix"] for req in listings) == ["nas-backup/a/", "nas-backup/b/"]
+
+
+def test_versioning_check_is_retried(oss, oss_stub, monkeypatch, no_retry_delay):
+    monkeypatch.setattr(config, "Delete_Object_Versions", True)
+    oss_stub.versioning = "Enabled"
+    oss._OssOperation__versioning = None
+    oss_stub.versions["nas-backup/a"] = ["v1"]
+    oss_stub.fail(500, "GET", "", times=2, versioning="")
+
+    assert oss.delete_remote_files(["nas-backup/a"]) == []
+    assert oss_stub.versions["nas-backup/a"] == []
+
+    oss._OssOperation__versioning = None
+    oss_stub.fail(403, "GET", "", versioning="")
+    assert oss.delete_remote_files(["nas-backup/b"]) == ["nas-backup/b"]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from units.diff_engine import COPY, SKIP, UPLOAD, DiffEngine
+
+REMOTE = {"a.txt": "aa", "b.txt": "bb", "old.txt": "cc"}
+
+
+def make_engine(remote=REMOTE, by_sha256=False) -> DiffEngine:
+    return DiffEngine(remote, {sha256: path for path, sha256 in remote.items()}, by_sha256=by_sha256)
+
+
+def test_classify():
+    engine = make_engine()
+    assert engine.classify("a.txt", "aa") == (SKIP, None)
+    assert engine.classify("a.txt", "a2") == (UPLOAD, None)
+    assert engine.classify("new.txt", "dd") == (UPLOAD, None)
+    assert engine.classify("copy-of-b.txt", "bb") == (COPY, "b.txt")
+    assert engine.classify("a.txt", "bb") == (COPY, "b.txt")
+
+
+def test_stale_copies():
+    copy_list = {"copy-of-b.txt": "b.txt", "copy-of-a.txt": "a.txt", "copy-of-gone.txt": "gone.txt"}
+    # b.txt在本地已被修改，复制得到的将是新内容；a.txt未改变；gone.txt本地已不存在，远端内容不会改变
+    local = {"b.txt": "b2", "copy-of-b.txt": "bb", "a.txt": "aa", "copy-of-a.txt": "aa", "copy-of-gone.txt": "ee"}
+    assert DiffEngine.stale_copies(copy_list, local) == ["copy-of-b.txt"]
+
+
+def test_deletions():
+    assert make_engine().deletions({"a.txt": "aa", "b.txt": "b2"}) == ["old.txt"]
+    # 使用sha256作为文件名时按内容判断，被重命名的文件不删除
+    assert make_engine(by_sha256=True).deletions({"renamed.txt": "aa", "b.txt": "b2"}) == ["bb", "cc"]
+
+
+def test_diff():
+    local = {"a.txt": "aa", "b.txt": "b2", "copy-of-b.txt": "bb", "copy-of-a.txt": "aa", "new.txt": "dd"}
+    plan = make_engine().diff(local)
+    assert plan.skip == {"a.txt"}
+    assert plan.copy == {"copy-of-a.txt": "a.txt"}
+    assert plan.upload == {"b.txt": "b2", "copy-of-b.txt": "bb", "new.txt": "dd"}
+    assert plan.delete == ["old.txt"]
+
+
+def test_encrypted_filename_mode_uploads_each_duplicate():
+    engine = make_engine(by_sha256=True)
+    assert engine.classify("renamed.txt", "aa") == (SKIP, None)
+    # 远端不存在的sha256不会复制，两个内容相同的新文件都会上传到同一个以sha256命名的Object
+    assert engine.classify("new1.txt", "dd") == (UPLOAD, None)
+    assert engine.classify("new2.txt", "dd") == (UPLOAD, None)
+
+    plan = engine.diff({"new1.txt": "dd", "new2.txt": "dd", "a.txt": "aa"})
+    assert plan.upload == {"new1.txt": "dd", "new2.txt": "dd"}
+    assert plan.copy == {}
+    assert plan.skip == {"a.txt"}
+    assert plan.delete == ["bb", "cc"]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+
+import config
+from oss_stub import make_oss_operation
+from units.compression import CODEC_HEADER, SIZE_HEADER, ZSTD, Compressor
+from units.download_executor import DownloadExecutor
+
+TEXT = b''.join(b'%d INSERT INTO t VALUES (%d, "abc def");\n' % (i, i * 7919 % 100003) for i in range(20000))
+
+
+def upload(oss, tmp_path, files: dict) -> dict:
+    """上传files并返回DownloadExecutor.run所需的下载列表，大小与restore.build_download_list相同，来自列举结果"""
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+        oss.encrypt_and_upload_files(str(tmp_path / name), "remote/" + name)
+    sizes = {obj.key: obj.size for obj in oss.list_remote_files("remote/")}
+    return {str(tmp_path / "restored" / name): ("remote/" + name, hashlib.sha256(data).hexdigest(), sizes["remote/" + name])
+            for name, data in files.items()}
+
+
+def test_compressed_objects_record_plain_size(oss_stub, tmp_path):
+    oss = make_oss_operation(oss_stub, compressor=Compressor(level=3))
+    download_list = upload(oss, tmp_path, {"text": TEXT})
+
+    headers = oss_stub.objects["remote/text"].headers
+    assert headers[CODEC_HEADER] == ZSTD and headers[SIZE_HEADER] == str(len(TEXT))
+    assert download_list[str(tmp_path / "restored" / "text")][2] < len(TEXT) // 4
+
+
+def test_existing_compressed_files_are_skipped(oss_stub, tmp_path):
+    oss = make_oss_operation(oss_stub, compressor=Compressor(level=3))
+    download_list = upload(oss, tmp_path, {"text": TEXT, "random": os.urandom(100000)})
+    executor = DownloadExecutor(oss, str(tmp_path / "checkpoints"))
+
+    assert executor.run(download_list) == {}
+    assert (tmp_path / "restored" / "text").read_bytes() == TEXT
+    gets = len(oss_stub.requests("GET", "remote/"))
+    skipped = []
+    assert executor.run(download_list, progress_callback=lambda name, ok, is_skipped: skipped.append(is_skipped)) == {}
+    assert skipped == [True, True]
+    assert len(oss_stub.requests("GET", "remote/")) == gets
+
+
+def test_compressed_files_are_large_by_plain_size(oss_stub, tmp_path, monkeypatch):
+    oss = make_oss_operation(oss_stub, compressor=Compressor(level=3))
+    files = {"text%d" % i: TEXT + b'%d' % i for i in range(3)}
+    download_list = upload(oss, tmp_path, files)
+    oss_stub.delay = 0.1
+    # 压缩后小于large_file_size，解压后大于等于large_file_size
+    monkeypatch.setattr(config, "Multipart_Download_Size", len(TEXT))
+    monkeypatch.setattr(config, "Multipart_Download_Part_Size", 64 * 1024)
+    assert DownloadExecutor(oss, str(tmp_path / "checkpoints"), max_large_downloads=1, large_file_size=len(TEXT)).run(download_list) == {}
+
+    assert oss_stub.max_concurrency("GET", "remote/") == 1
+    for name, data in files.items():
+        assert (tmp_path / "restored" / name).read_bytes() == data
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import os
+import types
+
+import oss2
+import pytest
+
+from oss_stub import make_oss_operation
+from units import envelope_encryption
+from units.envelope_encryption import EnvelopeCryptoProvider
+
+
+class FakeKms(object):
+    """本地的KMS替身，接口与KmsDataKeys相同，分别统计生成和解密数据密钥的次数"""
+
+    def __init__(self):
+        self.generated = 0
+        self.decrypted = 0
+        self.__keys = {}
+
+    def generate_data_key(self) -> tuple:
+        self.generated += 1
+        data_key, ciphertext_blob = os.urandom(32), base64.b64encode(os.urandom(48)).decode()
+        self.__keys[ciphertext_blob] = data_key
+        return data_key, ciphertext_blob
+
+    def decrypt(self, ciphertext_blob: str) -> bytes:
+        self.decrypted += 1
+        return self.__keys[ciphertext_blob]
+
+
+def encrypt(provider, data: bytes):
+    material = provider.create_content_material()
+    return material, material.cipher.encrypt(data)
+
+
+def decrypt(provider, material, encrypted: bytes) -> bytes:
+    cipher = oss2.utils.AESCTRCipher()
+    cipher.initialize(provider.decrypt_encrypted_key(material.encrypted_key), provider.decrypt_encrypted_iv(material.encrypted_iv))
+    return cipher.decrypt(encrypted)
+
+
+def test_data_key_is_reused_up_to_max_uses():
+    kms = FakeKms()
+    provider = EnvelopeCryptoProvider(kms, max_uses=3)
+    materials = [provider.create_content_material() for _ in range(7)]
+
+    assert kms.generated == 3
+    blobs = [material.encrypted_key[EnvelopeCryptoProvider.SALT_SIZE:] for material in materials]
+    assert [blobs.index(blob) for blob in blobs] == [0, 0, 0, 3, 3, 3, 6]
+    # 同一数据密钥的每个Object使用不同的salt和内容密钥
+    assert len({material.encrypted_key for material in materials}) == 7
+
+
+def test_data_key_expires_after_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(envelope_encryption, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    kms = FakeKms()
+    provider = EnvelopeCryptoProvider(kms, max_age=60)
+
+    provider.get_key()
+    now[0] += 59
+    provider.get_key()
+    assert kms.generated == 1
+    now[0] += 1
+    provider.get_key()
+    assert kms.generated == 2
+
+
+def test_decryption_calls_kms_once_per_data_key():
+    kms = FakeKms()
+    data = [os.urandom(100 + i) for i in range(7)]
+    provider = EnvelopeCryptoProvider(kms, max_uses=3)
+    encrypted = [encrypt(provider, item) for item in data]
+
+    # 新的Provider(eg: 另一次运行的restore)没有缓存，每个数据密钥只解密一次
+    reader = EnvelopeCryptoProvider(kms)
+    assert [decrypt(reader, material, item) for material, item in encrypted] == data
+    assert kms.decrypted == 3
+    assert [decrypt(reader, material, item) for material, item in encrypted] == data
+    assert kms.decrypted == 3
+
+    # 缓存只保留cache_size个数据密钥
+    reader = EnvelopeCryptoProvider(kms, cache_size=1)
+    for _ in range(2):
+        assert [decrypt(reader, material, item) for material, item in encrypted[:1] + encrypted[-1:]] == [data[0], data[-1]]
+    assert kms.decrypted == 3 + 4
+
+
+def test_tampered_iv_is_rejected():
+    provider = EnvelopeCryptoProvider(FakeKms())
+    material, _ = encrypt(provider, b"data")
+    encrypted_iv = bytearray(material.encrypted_iv)
+    encrypted_iv[-20] ^= 1
+    provider.decrypt_encrypted_key(material.encrypted_key)
+    with pytest.raises(oss2.exceptions.ClientError):
+        provider.decrypt_encrypted_iv(bytes(encrypted_iv))
+
+
+def test_objects_round_trip_through_oss(oss_stub, tmp_path):
+    kms = FakeKms()
+    data = os.urandom(300000)
+    (tmp_path / "file").write_bytes(data)
+    file_sha256 = hashlib.sha256(data).hexdigest()
+    uploader = make_oss_operation(oss_stub, crypto_provider=EnvelopeCryptoProvider(kms, max_uses=2))
+    uploader.encrypt_and_upload_files(str(tmp_path / "file"), "remote/file", file_sha256=file_sha256)
+    uploader.encrypt_and_upload_bytes(data[:1000], "remote/small", hashlib.sha256(data[:1000]).hexdigest())
+    assert oss_stub.objects["remote/file"].data != data
+    assert oss_stub.objects["remote/file"].headers["x-oss-meta-client-side-encryption-wrap-alg"] == envelope_encryption.ENVELOPE_WRAP_ALGORITHM
+
+    # 解密 -> 重新加密(新的数据密钥) -> 解密，均由新的Provider完成
+    reader = make_oss_operation(oss_stub, crypto_provider=EnvelopeCryptoProvider(kms))
+    reader.download_and_decrypt_file(str(tmp_path / "decrypted"), "remote/file", verify_integrity=True)
+    assert (tmp_path / "decrypted").read_bytes() == data
+    assert reader.download_and_decrypt_bytes("remote/small") == data[:1000]
+    assert reader.download_and_decrypt_bytes("remote/file", byte_range=(12345, 23456)) == data[12345:23457]
+    assert kms.decrypted == 1
+
+    reader.encrypt_and_upload_files(str(tmp_path / "decrypted"), "remote/again", file_sha256=file_sha256)
+    assert kms.generated == 2
+    other = make_oss_operation(oss_stub, crypto_provider=EnvelopeCryptoProvider(kms))
+    assert other.download_remote_file("remote/again", str(tmp_path / "again"), len(data)) == file_sha256
+    assert (tmp_path / "again").read_bytes() == data
+
+
+def test_rsa_objects_are_read_through_fallback(oss_stub, tmp_path):
+    rsa = make_oss_operation(oss_stub)
+    rsa.encrypt_and_upload_bytes(b"encrypted with rsa", "remote/rsa", hashlib.sha256(b"encrypted with rsa").hexdigest())
+    envelope = make_oss_operation(oss_stub, crypto_provider=EnvelopeCryptoProvider(FakeKms()))
+    with pytest.raises(oss2.exceptions.InconsistentError):
+        envelope.download_and_decrypt_bytes("remote/rsa")
+
+    envelope._OssOperation__fallback_bucket = rsa._OssOperation__bucket
+    assert envelope.download_and_decrypt_bytes("remote/rsa") == b"encrypted with rsa"
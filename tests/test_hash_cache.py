@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import types
+
+import pytest
+
+from units import hash_cache
+from units.hash_cache import HashCache
+
+
+def stat(size=100, mtime_ns=1000, ino=7, ctime_ns=2000):
+    return types.SimpleNamespace(st_size=size, st_mtime_ns=mtime_ns, st_ino=ino, st_ctime_ns=ctime_ns)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HashCache(str(tmp_path / "cache" / "hash.db"))
+    yield cache
+    cache.close()
+
+
+def test_hit_requires_identical_metadata(cache):
+    cache.set("/data/a", stat(), "aa" * 32)
+    assert cache.get("/data/a", stat()) == "aa" * 32
+    assert cache.get("/data/b", stat()) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize("changed", [{"size": 101}, {"mtime_ns": 1001}, {"ino": 8}, {"ctime_ns": 2001}])
+def test_any_metadata_change_is_a_miss(cache, changed):
+    cache.set("/data/a", stat(), "aa" * 32)
+    assert cache.get("/data/a", stat(**changed)) is None
+    assert cache.misses == 1
+
+
+def test_reads_stat_when_not_given(cache, tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(b"data")
+    cache.set(str(path), path.stat(), "aa" * 32)
+    assert cache.get(str(path)) == "aa" * 32
+    path.write_bytes(b"changed")
+    assert cache.get(str(path)) is None
+
+
+def test_entries_expire(monkeypatch, tmp_path):
+    cache = HashCache(str(tmp_path / "expiring.db"), rehash_older_than=60)
+    now = [1000.0]
+    monkeypatch.setattr(hash_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    cache.set("/data/a", stat(), "aa" * 32)
+    now[0] += 60
+    assert cache.get("/data/a", stat()) == "aa" * 32
+    now[0] += 1
+    assert cache.get("/data/a", stat()) is None
+    cache.close()
+
+
+def test_entries_persist_after_close(tmp_path):
+    cache = HashCache(str(tmp_path / "hash.db"), commit_interval=1000)
+    cache.set("/data/a", stat(), "aa" * 32)
+    cache.close()
+    reopened = HashCache(str(tmp_path / "hash.db"))
+    assert reopened.get("/data/a", stat()) == "aa" * 32
+    reopened.close()
+
+
+def test_prune_drops_vanished_paths(cache):
+    for name in "abc":
+        cache.set("/data/" + name, stat(), name * 64)
+    assert cache.prune(iter(["/data/a", "/data/c", "/data/new"])) == 1
+    assert cache.get("/data/a", stat()) == "a" * 64
+    assert cache.get("/data/b", stat()) is None
+    assert cache.get("/data/c", stat()) == "c" * 64
+
+
+def test_get_by_inode_finds_moved_files(cache):
+    cache.set("/data/old-name", stat(), "aa" * 32)
+    # 重命名会改变ctime，仍应找到原条目
+    assert cache.get_by_inode(stat(ctime_ns=3000)) == "aa" * 32
+    assert cache.get_by_inode(stat(ino=8)) is None
+    assert cache.get_by_inode(stat(size=101)) is None
+    assert cache.get_by_inode(stat(mtime_ns=1001)) is None
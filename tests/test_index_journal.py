@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+from units.index_journal import IndexJournal
+from units.remote_index import PathIndex, RemoteIndex
+
+
+def sha256_of(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def new_journal(oss, tmp_path, name="cache"):
+    """返回(已replay的IndexJournal, 索引, RemoteIndex)，每个日志段2条记录"""
+    (tmp_path / name).mkdir(exist_ok=True)
+    remote_index = RemoteIndex(oss, "nas-backup/", str(tmp_path / name) + "/", prefix_length=1)
+    remote_index.load()
+    state = PathIndex()
+    journal = IndexJournal(oss, remote_index, str(tmp_path / "journal.jsonl"), segment_records=2, segment_interval=3600, fsync_interval=0)
+    journal.replay(state)
+    return journal, state, remote_index
+
+
+def wait(journal: IndexJournal):
+    """等待后台的日志段上传完成"""
+    journal._IndexJournal__executor.submit(lambda: None).result()
+
+
+def add_files(journal: IndexJournal, names) -> dict:
+    files = {name: sha256_of(name) for name in names}
+    for path, sha256 in files.items():
+        journal.add(path, sha256)
+    wait(journal)
+    return files
+
+
+def segments(oss_stub) -> list:
+    return sorted(key.rsplit("/", 1)[-1] for key in oss_stub.objects if "/journal/" in key)
+
+
+def test_segments_after_a_failed_segment_wait_for_it(oss, oss_stub, tmp_path):
+    journal, _, remote_index = new_journal(oss, tmp_path)
+    oss_stub.fail(403, "PUT", remote_index.segment_object(1, 2))
+    files = add_files(journal, ["a", "b"])
+    files.update(add_files(journal, ["c", "d"]))
+    assert segments(oss_stub) == []
+
+    # 运行中断：记录1-2只在本地日志中，3-4不能先于它们出现在远端，否则replay时会跳过1-2
+    replayed, state, _ = new_journal(oss, tmp_path, "other-cache")
+    assert dict(state) == files
+    oss_stub.faults.clear()
+    replayed.close()
+    assert segments(oss_stub) == [remote_index.segment_object(1, 4).rsplit("/", 1)[-1]]
+    assert (tmp_path / "journal.jsonl").read_text() == ""
+
+
+def test_failed_segment_is_retried_unchanged(oss, oss_stub, tmp_path, no_retry_delay):
+    journal, _, remote_index = new_journal(oss, tmp_path)
+    oss_stub.fail(503, "PUT", remote_index.segment_object(1, 2), times=5)
+    files = add_files(journal, ["a", "b"])
+    files.update(add_files(journal, ["c", "d"]))
+    journal.close()
+
+    assert segments(oss_stub) == sorted(remote_index.segment_object(first, last).rsplit("/", 1)[-1] for first, last in ((1, 2), (3, 4)))
+    assert (tmp_path / "journal.jsonl").read_text() == ""
+    _, state, _ = new_journal(oss, tmp_path, "other-cache")
+    assert dict(state) == files
+
+
+def test_local_journal_is_kept_when_upload_fails(oss, oss_stub, tmp_path):
+    journal, _, remote_index = new_journal(oss, tmp_path)
+    oss_stub.fail(403, "PUT")
+    files = add_files(journal, ["a", "b", "c"])
+    journal.close(compact=True)
+
+    assert segments(oss_stub) == []
+    assert len((tmp_path / "journal.jsonl").read_text().splitlines()) == 3
+    oss_stub.faults.clear()
+    _, state, _ = new_journal(oss, tmp_path, "other-cache")
+    assert dict(state) == files
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from units import parallel_hash
+from units.hash_cache import HashCache
+from units.parallel_hash import HashPool
+from units.scanner import FileRecord
+
+
+def test_concurrent_reads_are_bounded_per_device(monkeypatch):
+    lock = threading.Lock()
+    running = defaultdict(int)
+    peak = defaultdict(int)
+    total_peak = [0]
+
+    def fake_sha256(path):
+        device = int(path.split("/")[1])
+        with lock:
+            running[device] += 1
+            peak[device] = max(peak[device], running[device])
+            total_peak[0] = max(total_peak[0], sum(running.values()))
+        time.sleep(0.02)
+        with lock:
+            running[device] -= 1
+        return path
+
+    monkeypatch.setattr(parallel_hash, "calculate_local_file_sha256", fake_sha256)
+    records = [FileRecord("/%d/f%d" % (device, i), 10, 0, i, 0, device) for i in range(10) for device in range(3)]
+    results = list(HashPool(max_workers=8, per_device=2).imap_unordered(records))
+
+    assert sorted(path for path, _, _ in results) == sorted(record.path for record in records)
+    assert all(sha256 == path for path, sha256, _ in results)
+    assert max(peak.values()) == 2
+    assert total_peak[0] > 2
+
+
+def test_every_input_is_yielded(tmp_path):
+    paths = []
+    for i in range(50):
+        path = tmp_path / ("f%d" % i)
+        path.write_bytes(b"x" * i)
+        paths.append(str(path))
+    cache = HashCache(str(tmp_path / "hash.db"))
+    cache.set(paths[0], FileRecord.from_stat(paths[0], (tmp_path / "f0").stat()), "cached")
+    missing = str(tmp_path / "missing")
+    results = {path: sha256 for path, sha256, _ in
+               HashPool(max_workers=3, per_device=1, max_pending=4).imap_unordered(paths + [missing], cache=cache)}
+
+    assert results.pop(missing) is False
+    assert results.pop(paths[0]) == "cached"
+    assert results == {path: hashlib.sha256(b"x" * i).hexdigest() for i, path in enumerate(paths) if i}
+    # 计算得到的sha256写入缓存
+    assert cache.get(paths[1]) == hashlib.sha256(b"x").hexdigest()
+    cache.close()
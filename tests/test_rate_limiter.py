@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import types
+
+import pytest
+
+from units import rate_limiter
+from units.rate_limiter import RateLimiter, TokenBucket
+
+
+class FakeClock(object):
+    """代替rate_limiter中的time模块，sleep只推进时钟"""
+
+    def __init__(self, hour: int = 12, minute: int = 0):
+        self.now = 1000.0
+        self.hour, self.minute = hour, minute
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def localtime(self):
+        return types.SimpleNamespace(tm_hour=self.hour, tm_min=self.minute)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def elapsed(clock, fn, times: int = 1) -> float:
+    start = clock.now
+    for _ in range(times):
+        fn()
+    return clock.now - start
+
+
+def test_tokens_refill_at_rate(clock):
+    bucket = TokenBucket(10)
+    # 桶初始为空，第一个请求几乎不等待，之后每个请求等待0.1秒
+    assert elapsed(clock, bucket.acquire, 50) == pytest.approx(4.9, abs=0.05)
+
+
+def test_burst_is_capped_by_capacity(clock):
+    bucket = TokenBucket(10)
+    clock.now += 100
+    assert elapsed(clock, bucket.acquire, 10) == 0
+    assert elapsed(clock, bucket.acquire, 20) == pytest.approx(1.9, abs=0.05)
+
+
+def test_large_acquire_is_paid_back_by_later_requests(clock):
+    bucket = TokenBucket(10)
+    clock.now += 1
+    assert elapsed(clock, lambda: bucket.acquire(25)) == 0
+    assert elapsed(clock, bucket.acquire) == pytest.approx(1.5, abs=0.01)
+
+
+def test_zero_rate_is_unlimited(clock):
+    assert elapsed(clock, TokenBucket(0).acquire, 1000) == 0
+
+
+def test_time_windows(clock):
+    limiter = RateLimiter(0, windows=[("01:00", "02:00", 5, 0), ("23:00", "01:00", 2, 0)])
+    assert elapsed(clock, limiter.acquire_request, 100) == 0  # 12:00使用默认速率，不限制
+
+    clock.hour, clock.minute = 0, 30  # 跨越零点的时间段
+    clock.now += 30
+    assert elapsed(clock, limiter.acquire_request, 10) == pytest.approx(4.5, abs=0.05)
+
+    clock.hour, clock.minute = 1, 0
+    clock.now += 30  # 上一时间段积累的2个令牌沿用到新的时间段
+    assert elapsed(clock, limiter.acquire_request, 10) == pytest.approx(1.4, abs=0.05)
+
+
+def test_windows_are_rechecked_every_30_seconds(clock):
+    limiter = RateLimiter(0, windows=[("13:00", "14:00", 10, 0)])
+    clock.hour = 13
+    clock.now += 29
+    assert elapsed(clock, limiter.acquire_request, 100) == 0
+    clock.now += 1
+    assert elapsed(clock, limiter.acquire_request, 10) == pytest.approx(0.9, abs=0.05)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import importlib
+import json
+import os
+
+import oss2
+import pytest
+
+import config
+from oss_sync_libs import sha256_sidecar_name
+from units.chunk_store import ChunkStore
+from units.pack_store import PackStore
+from units.rate_limiter import RateLimiter
+
+INVENTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "inventory", "manifest.json")
+
+
+@pytest.fixture
+def rebuild(oss_stub, tmp_path, monkeypatch):
+    """连接到oss_stub的rebuild_sha256模块，输出文件写入tmp_path"""
+    monkeypatch.setattr(config, "OssEndpoint", config.OssEndpoint or "oss-cn-hangzhou.aliyuncs.com")
+    monkeypatch.setattr(config, "remote_base_dir", "nas-backup/")
+    module = importlib.import_module("rebuild_sha256")
+    monkeypatch.setattr(module, "skip_prefixes", ("nas-backup/" + ChunkStore.PREFIX, "nas-backup/" + PackStore.PREFIX))
+    auth = oss2.Auth(oss_stub.access_key_id, oss_stub.access_key_secret)
+    monkeypatch.setattr(module, "bucket", oss2.Bucket(auth, oss_stub.endpoint, oss_stub.bucket_name))
+    monkeypatch.setattr(module, "limiter", RateLimiter())
+    monkeypatch.chdir(tmp_path)
+    return module
+
+
+def test_sidecar_fallback_is_not_retried_twice(rebuild, oss_stub, no_retry_delay):
+    oss_stub.put("remote/file", b"data")
+    oss_stub.put(sha256_sidecar_name("remote/file"), b"", headers={"x-oss-meta-sha256": "ab" * 32})
+    oss_stub.put("remote/other", b"data", headers={"x-oss-meta-sha256": "cd" * 32})
+    assert rebuild.get_remote_sha256("remote/file") == "ab" * 32
+    assert rebuild.get_remote_sha256("remote/missing") is False
+
+    oss_stub.log.clear()
+    oss_stub.fail(500, "HEAD", sha256_sidecar_name("remote/file"))
+    with pytest.raises(oss2.exceptions.ServerError):
+        rebuild.get_remote_sha256("remote/file")
+    assert len(oss_stub.requests("HEAD", "remote/file")) == 1
+    assert len(oss_stub.requests("HEAD", sha256_sidecar_name("remote/file"))) == config.Max_Retries
+    assert rebuild.get_remote_sha256("remote/other") == "cd" * 32
+
+
+def read_records(rebuild) -> dict:
+    with open(rebuild.rebuild_file, "r", encoding="utf-8") as fobj:
+        return {record["path"]: record for record in map(json.loads, fobj)}
+
+
+def test_inventory_only_heads_new_and_changed_objects(rebuild, oss_stub):
+    january = 1704067200  # 2024-01-01T00:00:00Z
+    with open(rebuild.rebuild_file, "w", encoding="utf-8") as fobj:
+        fobj.write(rebuild.object_record("nas-backup/unchanged.txt", "00" * 32, 10, '"0123456789abcdef0123456789abcdef"', january))
+        fobj.write(rebuild.object_record("nas-backup/size-changed.txt", "01" * 32, 20, "11111111111111111111111111111111", january))
+        fobj.write(rebuild.object_record("nas-backup/etag-changed.txt", "02" * 32, 10, "22222222222222222222222222222222", january))
+        fobj.write(rebuild.object_record("nas-backup/mtime-changed.txt", "03" * 32, 10, "33333333333333333333333333333333", january))
+        fobj.write(rebuild.object_record("nas-backup/deleted.txt", "04" * 32, 10, "77777777777777777777777777777777", january))
+    changed = {"size-changed.txt": "11", "etag-changed.txt": "12", "mtime-changed.txt": "13", "dir/new file.txt": "14"}
+    for path, sha256 in changed.items():
+        oss_stub.put("nas-backup/" + path, b"data", headers={"x-oss-meta-sha256": sha256 * 32})
+
+    result = rebuild.rebuild_from_inventory(INVENTORY, max_workers=4)
+    assert result == {"count": 5, "errors": 0, "head_requests": 4}
+    assert sorted(req.key for req in oss_stub.requests("HEAD")) == sorted("nas-backup/" + path for path in changed)
+    records = read_records(rebuild)
+    assert {path: record["sha256"] for path, record in records.items()} == dict(
+        {path: sha256 * 32 for path, sha256 in changed.items()}, **{"unchanged.txt": "00" * 32})
+    assert records["size-changed.txt"]["size"] == 21
+    assert records["etag-changed.txt"]["etag"] == "22222222222222222222222222222223"
+    assert records["mtime-changed.txt"]["last_modified"] == 1706776200  # 2024-02-01T08:30:00Z
+    assert records["dir/new file.txt"]["etag"] == "44444444444444444444444444444444-2"
+
+    oss_stub.log.clear()
+    assert rebuild.rebuild_from_inventory(INVENTORY, max_workers=4) == {"count": 5, "errors": 0, "head_requests": 0}
+    assert oss_stub.requests("HEAD") == []
+    assert read_records(rebuild) == records
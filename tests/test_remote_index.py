@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+
+from units.remote_index import RemoteIndex
+
+
+def sha256_of(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+FILES = {"photos/%03d.jpg" % i: sha256_of("photo%d" % i) for i in range(50)}
+FILES.update({"docs/%03d.txt" % i: sha256_of("doc%d" % i) for i in range(50)})
+
+
+def new_index(oss, tmp_path, name="cache") -> RemoteIndex:
+    return RemoteIndex(oss, "nas-backup/", str(tmp_path / name) + "/", prefix_length=1, max_workers=4)
+
+
+def test_save_and_load_round_trip(oss, oss_stub, tmp_path):
+    index = new_index(oss, tmp_path)
+    assert not index.load()
+    assert index.save(FILES) == 16
+
+    reloaded = new_index(oss, tmp_path, "other-cache")
+    assert reloaded.load()
+    assert dict(reloaded.load_paths()) == FILES
+    assert dict(reloaded.load_paths("docs/")) == {path: sha256 for path, sha256 in FILES.items() if path.startswith("docs/")}
+
+
+def test_only_changed_shards_are_uploaded(oss, oss_stub, tmp_path):
+    index = new_index(oss, tmp_path)
+    index.load()
+    index.save(FILES)
+    changed = dict(FILES, **{"docs/new.txt": "f" * 64})
+
+    assert index.save(changed) == 1
+    shards = [key for key in oss_stub.objects if "/shards/" in key]
+    assert len(shards) == 16
+    assert sum(1 for key in shards if key.split("/")[-1].startswith("f-")) == 1
+
+
+def test_find_by_sha256_reads_one_shard(oss, oss_stub, tmp_path):
+    new_index(oss, tmp_path).save(FILES)
+    index = new_index(oss, tmp_path, "other-cache")
+    index.load()
+    before = len(oss_stub.requests("GET"))
+
+    assert index.find_by_sha256(FILES["docs/007.txt"]) == "docs/007.txt"
+    assert index.find_by_sha256("0" * 64) is None
+    downloaded = [req.key for req in oss_stub.requests("GET")[before:]]
+    assert all("/shards/" in key for key in downloaded)
+    assert len(set(downloaded)) <= 2
+
+
+def test_legacy_json_is_migrated(oss, oss_stub, tmp_path):
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text(json.dumps(FILES))
+    oss.encrypt_and_upload_files(str(legacy), "index/nas-backup.json")
+    index = new_index(oss, tmp_path)
+    assert index.load()
+    paths = index.load_paths()
+    assert dict(paths) == FILES
+
+    index.save(paths)
+    assert "index/nas-backup/manifest.json" in oss_stub.objects
+    migrated = new_index(oss, tmp_path, "other-cache")
+    assert migrated.load()
+    assert dict(migrated.load_paths()) == FILES
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from units.restore_orchestrator import RestoreOrchestrator
+
+
+@pytest.fixture
+def orchestrator(oss, tmp_path, monkeypatch):
+    monkeypatch.setattr(RestoreOrchestrator, "INITIAL_DELAY", {None: 0})
+    return RestoreOrchestrator(oss, str(tmp_path / "restore.db"), max_workers=4, copy_workers=4, min_poll_interval=0.05, max_poll_interval=0.2)
+
+
+def test_check_restore_status(oss, oss_stub):
+    oss_stub.restore_time = 60
+    oss_stub.put("ongoing", b"data", "Archive")
+    oss_stub.put("restored", b"data", "Archive")
+    oss_stub.put("frozen", b"data", "Archive")
+    oss_stub.restores["restored"] = 0
+    assert oss.restore_remote_file("ongoing") == 200
+
+    assert oss.check_restore_status("ongoing") == 409
+    assert oss.check_restore_status("restored") == 200
+    assert oss.check_restore_status("frozen") == 410
+    assert oss.check_restore_status("missing") == 404
+
+
+def test_missing_source_fails_only_its_copies(orchestrator, oss_stub, tmp_path):
+    oss_stub.restore_time = 0.2
+    oss_stub.put("src/a", b"a" * 100, "Archive")
+    oss_stub.put("src/b", b"b" * 100, "Standard")
+    oss_stub.put("src/gone", b"gone", "Archive")
+    copy_list = {"dst/a1": "src/a", "dst/a2": "src/a", "dst/b": "src/b", "dst/gone": "src/gone"}
+    progress = []
+    oss_stub.fail(404, "HEAD", "src/gone")  # 提交解冻之后被删除的源文件
+    failed = orchestrator.run(copy_list, storage_class="Archive", src_sizes={"src/a": 100, "src/b": 100, "src/gone": 4},
+                              progress_callback=lambda dst_obj, ok: progress.append((dst_obj, ok)))
+
+    assert failed == {"dst/gone": "src/gone"}
+    assert oss_stub.objects["dst/a1"].data == oss_stub.objects["dst/a2"].data == b"a" * 100
+    assert oss_stub.objects["dst/b"].storage_class == "Archive"
+    assert sorted(progress) == [("dst/a1", True), ("dst/a2", True), ("dst/b", True), ("dst/gone", False)]
+    assert (tmp_path / "restore.db").exists()  # 有失败的复制时保留状态，下次运行时重试
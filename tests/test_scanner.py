@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from units.scanner import FileRecord, walk_files, walk_roots
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "root"
+    for name in ("a.txt", "b.log", "dir/c.txt", "dir/sub/d.txt", "dir/sub/e.log", "skip/f.txt", "other/skip/g.txt", "empty/.keep"):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(name.encode())
+    (root / "empty" / ".keep").unlink()
+    os.symlink(str(root / "a.txt"), str(root / "link.txt"))
+    os.symlink(str(root / "dir"), str(root / "link-dir"))
+    os.symlink(str(root / "missing"), str(root / "dangling"))
+    return str(root)
+
+
+def os_walk_files(root, is_excluded=None, is_dir_excluded=None):
+    """以os.walk得到的预期结果"""
+    files = set()
+    for directory, dirs, names in os.walk(root):
+        dirs[:] = [name for name in dirs if not (is_dir_excluded and is_dir_excluded(os.path.join(directory, name)))]
+        for name in names:
+            path = os.path.join(directory, name)
+            if not os.path.islink(path) and not (is_excluded and is_excluded(path)):
+                files.add(path)
+    return files
+
+
+def is_log(path):
+    return path.endswith(".log")
+
+
+def is_skip_dir(path):
+    return os.path.basename(path) == "skip"
+
+
+@pytest.mark.parametrize("is_excluded, is_dir_excluded", [(None, None), (is_log, None), (None, is_skip_dir), (is_log, is_skip_dir)])
+def test_matches_os_walk(tree, is_excluded, is_dir_excluded):
+    records = list(walk_files(tree, is_excluded, is_dir_excluded))
+    assert len(records) == len({record.path for record in records})
+    assert {record.path for record in records} == os_walk_files(tree, is_excluded, is_dir_excluded)
+    for record in records:
+        assert record == FileRecord.from_stat(record.path, os.lstat(record.path))
+
+
+def test_symlinks_are_skipped(tree):
+    paths = {os.path.relpath(record.path, tree) for record in walk_files(tree)}
+    assert paths == {"a.txt", "b.log", os.path.join("dir", "c.txt"), os.path.join("dir", "sub", "d.txt"), os.path.join("dir", "sub", "e.log"),
+                     os.path.join("skip", "f.txt"), os.path.join("other", "skip", "g.txt")}
+
+
+def test_unreadable_root_is_skipped(tmp_path):
+    assert list(walk_files(str(tmp_path / "missing"))) == []
+
+
+def test_walk_roots_matches_os_walk(tree):
+    roots = [os.path.join(tree, "dir"), os.path.join(tree, "other"), os.path.join(tree, "skip")]
+    paths = [record.path for record in walk_roots(roots, is_log, max_queued=2)]
+    assert len(paths) == len(set(paths))
+    assert set(paths) == set().union(*(os_walk_files(root, is_log) for root in roots))
+    assert [record.path for record in walk_roots(roots[:1])] == [record.path for record in walk_files(roots[0])]
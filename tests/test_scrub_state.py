@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import types
+
+import pytest
+
+from units import scrub_state
+from units.scrub_state import ScrubState
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scrub_state, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def state(tmp_path, clock):
+    state = ScrubState(str(tmp_path / "scrub" / "state.db"))
+    yield state
+    state.close()
+
+
+def test_least_recently_verified_objects_come_first(state, clock):
+    objects = {name: (name * 64, 10) for name in "abcdef"}
+    for name in "dbca":
+        clock[0] += 1
+        state.record(name, objects[name][0], ok=True)
+    clock[0] += 1
+    state.record("e", objects["e"][0], ok=False)  # 校验未通过
+    objects["a"] = ("0" * 64, 10)  # sha256发生变化
+    # 从未校验过、校验未通过和sha256变化的Object最先，按objects中的顺序；其余按上次校验时间从早到晚
+    assert state.select(objects) == ["a", "e", "f", "d", "b", "c"]
+
+
+def test_selection_rotates_through_all_objects(state, clock):
+    objects = {"obj%d" % i: ("%064d" % i, 10) for i in range(10)}
+    seen = []
+    for _ in range(4):
+        selected = state.select(objects, fraction=0.3)
+        assert len(selected) == 3
+        for obj in selected:
+            clock[0] += 1
+            state.record(obj, objects[obj][0], ok=True)
+        seen.extend(selected)
+    assert set(seen) == set(objects)
+    assert seen[:10] == list(objects)
+
+
+def test_fraction(state):
+    objects = {"obj%d" % i: ("%064d" % i, 10) for i in range(10)}
+    assert len(state.select(objects, fraction=0.5)) == 5
+    assert len(state.select(objects, fraction=1)) == 10
+    assert state.select(objects, fraction=0.01) == ["obj0"]  # 至少选取一个
+    assert state.select({}, fraction=0.5) == []
+
+
+def test_byte_budget(state):
+    objects = {"a": ("a" * 64, 40), "b": ("b" * 64, 50), "c": ("c" * 64, 20)}
+    assert state.select(objects, byte_budget=90) == ["a", "b"]
+    assert state.select(objects, byte_budget=89) == ["a"]
+    assert state.select(objects, byte_budget=10) == ["a"]  # 至少选取一个
+    assert state.select(objects, byte_budget=1000) == ["a", "b", "c"]
+    assert state.select(objects, fraction=0.5, byte_budget=1000) == ["a"]
+    assert state.select(objects, fraction=1, byte_budget=90) == ["a", "b"]
+
+
+def test_state_persists_and_prunes(tmp_path, clock):
+    state = ScrubState(str(tmp_path / "state.db"))
+    state.record("a", "a" * 64, ok=True)
+    state.record("b", "b" * 64, ok=True)
+    state.close()
+
+    state = ScrubState(str(tmp_path / "state.db"))
+    objects = {"a": ("a" * 64, 10), "b": ("b" * 64, 10), "c": ("c" * 64, 10)}
+    assert state.select(objects) == ["c", "a", "b"]
+    state.prune({"b"})
+    assert state.select(objects) == ["a", "c", "b"]
+    state.close()
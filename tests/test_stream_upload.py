@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+
+import oss2
+import pytest
+
+from oss_sync_libs import sha256_sidecar_name
+
+
+@pytest.fixture
+def local_file(oss, tmp_path):
+    """5个分片的文件"""
+    oss._OssOperation__multipart_upload_size = oss2.defaults.min_part_size
+    path = tmp_path / "file"
+    path.write_bytes(os.urandom(5 * oss2.defaults.min_part_size - 100))
+    return path
+
+
+def test_transient_errors_are_retried(oss, oss_stub, local_file, no_retry_delay):
+    oss_stub.fail(500, "POST", "remote/file", times=1, uploads="")
+    oss_stub.fail(503, "PUT", "remote/file", times=1, partNumber="2")
+    oss_stub.fail(500, "POST", "remote/file", times=1, uploadId=None)
+    oss_stub.fail(500, "PUT", sha256_sidecar_name("remote/file"), times=1)
+
+    file_sha256 = oss.stream_upload_file(str(local_file), "remote/file")
+    assert file_sha256 == hashlib.sha256(local_file.read_bytes()).hexdigest()
+    assert oss_stub.objects[sha256_sidecar_name("remote/file")].headers["x-oss-meta-sha256"] == file_sha256
+    assert oss.verify_remote_file_integrity("remote/file", file_sha256)
+    assert oss_stub.uploads == {}
+
+
+@pytest.mark.parametrize("status", [403, 500])
+def test_failed_upload_is_aborted(oss, oss_stub, local_file, no_retry_delay, status):
+    oss_stub.fail(status, "PUT", "remote/file", partNumber="3")
+    with pytest.raises(oss2.exceptions.ServerError):
+        oss.stream_upload_file(str(local_file), "remote/file")
+
+    assert oss_stub.uploads == {}
+    assert "remote/file" not in oss_stub.objects
+    assert sha256_sidecar_name("remote/file") not in oss_stub.objects
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import time
+
+import oss2
+
+from oss_stub import make_oss_operation
+from units.rate_limiter import RateLimiter
+from units.upload_scheduler import UploadScheduler
+
+
+def make_files(tmp_path, sizes: dict) -> dict:
+    files = {}
+    for name, size in sizes.items():
+        path = tmp_path / name
+        path.write_bytes(name.encode().ljust(size, b'.'))
+        files[name] = str(path)
+    return files
+
+
+def upload_all(scheduler: UploadScheduler, files: dict) -> dict:
+    for name, path in files.items():
+        scheduler.submit(path, "remote/" + name)
+    results = {result.remote_object_name: result for result in scheduler.join()}
+    scheduler.shutdown()
+    return results
+
+
+def test_uploads_files_and_reports_per_file_errors(oss, oss_stub, tmp_path):
+    files = make_files(tmp_path, {"a": 10, "b": 2000, "c": 1})
+    files["missing"] = str(tmp_path / "missing")
+    results = upload_all(UploadScheduler(oss, max_workers=4), files)
+
+    assert set(results) == {"remote/a", "remote/b", "remote/c", "remote/missing"}
+    assert isinstance(results["remote/missing"].error, FileNotFoundError)
+    for name in ("a", "b", "c"):
+        assert results["remote/" + name].error is None
+        assert oss_stub.objects["remote/" + name].headers["x-oss-meta-sha256"] == hashlib.sha256((tmp_path / name).read_bytes()).hexdigest()
+    oss.download_and_decrypt_file(str(tmp_path / "b.out"), "remote/b", verify_integrity=True)
+    assert (tmp_path / "b.out").read_bytes() == (tmp_path / "b").read_bytes()
+
+
+def test_concurrency_is_capped_by_max_workers(oss, oss_stub, tmp_path):
+    oss_stub.delay = 0.1
+    upload_all(UploadScheduler(oss, max_workers=3, max_queued=4), make_files(tmp_path, {"f%d" % i: 100 for i in range(12)}))
+
+    assert len(oss_stub.requests("PUT")) == 12
+    assert oss_stub.max_concurrency("PUT") == 3
+
+
+def test_large_uploads_are_capped_separately(oss, oss_stub, tmp_path):
+    oss_stub.delay = 0.1
+    sizes = {"large%d" % i: 4096 for i in range(4)}
+    sizes.update({"small%d" % i: 10 for i in range(8)})
+    upload_all(UploadScheduler(oss, max_workers=6, max_large_uploads=1, large_file_size=4096), make_files(tmp_path, sizes))
+
+    assert oss_stub.max_concurrency("PUT", "remote/large") == 1
+    assert oss_stub.max_concurrency("PUT", "remote/small") > 1
+
+
+def test_small_uploads_are_not_blocked_by_queued_large_uploads(oss, oss_stub, tmp_path):
+    oss_stub.delay = 0.1
+    sizes = {"large%d" % i: 4096 for i in range(6)}
+    sizes.update({"small%d" % i: 10 for i in range(4)})
+    upload_all(UploadScheduler(oss, max_workers=2, max_large_uploads=1, large_file_size=4096), make_files(tmp_path, sizes))
+
+    small_end = max(req.end for req in oss_stub.requests("PUT", "remote/small"))
+    large_start = max(req.start for req in oss_stub.requests("PUT", "remote/large"))
+    assert small_end < large_start
+    assert oss_stub.max_concurrency("PUT", "remote/small") == 2
+
+def test_single_worker_uploads_in_submission_order(oss, oss_stub, tmp_path):
+    names = ["f%02d" % i for i in range(10)]
+    upload_all(UploadScheduler(oss, max_workers=1), make_files(tmp_path, {name: 10 for name in names}))
+
+    assert [req.key for req in oss_stub.requests("PUT")] == ["remote/" + name for name in names]
+
+
+def test_requests_are_rate_limited(oss_stub, tmp_path):
+    oss = make_oss_operation(oss_stub, limiter=RateLimiter(requests_per_second=20))
+    upload_all(UploadScheduler(oss, max_workers=8), make_files(tmp_path, {"f%d" % i: 10 for i in range(40)}))
+
+    starts = sorted(req.start for req in oss_stub.requests("PUT"))
+    assert len(starts) == 40
+    # 令牌桶最多积累1秒(20个)的令牌，其余20个请求每秒20个，至少需要约1秒
+    assert starts[-1] - starts[0] >= 0.8
+
+
+def test_permanent_errors_are_reported_without_retrying(oss, oss_stub, tmp_path):
+    oss_stub.access_key_secret = "another secret"
+    start = time.monotonic()
+    results = upload_all(UploadScheduler(oss, max_workers=2), make_files(tmp_path, {"a": 10}))
+
+    assert isinstance(results["remote/a"].error, oss2.exceptions.ServerError)
+    assert results["remote/a"].error.code == "SignatureDoesNotMatch"
+    assert len(oss_stub.requests("PUT")) == 1
+    assert time.monotonic() - start < 5
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import quote, unquote
+
+import oss2
+from oss2 import utils, xml_utils
+from oss2.api import _UrlMaker
+from oss2.http import CaseInsensitiveDict, Request
+from oss2.models import RestoreConfiguration, RestoreJobParameters
+
+from units.retry_policy import CircuitBreaker, RetryPolicy
+
+try:
+    import aiohttp
+except ModuleNotFoundError:
+    aiohttp = None
+
+
+class _Response(object):
+    """供oss2.exceptions.make_exception使用的最小响应对象"""
+
+    def __init__(self, status: int, headers, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.__body = body
+
+    def read(self, amt=None):
+        return self.__body if amt is None else self.__body[:amt]
+
+
+class AsyncOssClient(object):
+    """基于aiohttp的异步OSS客户端
+
+    所有请求共用一个带连接池的ClientSession，连接保持keep-alive并限制每个主机的连接数，大量元数据请求(HEAD/COPY/DELETE/解冻)
+    可以在少量连接上高并发执行，而不需要每个请求占用一个线程。请求签名和错误解析复用oss2(Auth._sign_request、make_exception)，
+    抛出的异常与oss2相同，网络错误、服务端错误和限流按RetryPolicy重试。
+
+    GET/PUT直接传输Object的原始内容，不进行客户端加密；需要加解密的内容仍应使用OssOperation。
+    必须在事件循环中使用：async with AsyncOssClient(...) as client
+    """
+
+    def __init__(self, access_key_id: str, access_key_secret: str, endpoint: str, bucket_name: str, max_connections: int = 32,
+                 keepalive_timeout: float = 60, connect_timeout: float = 10, read_timeout: float = 120, limiter=None, max_retries: int = 5,
+                 breaker: CircuitBreaker = None):
+        """
+        Args:
+            access_key_id (str)
+            access_key_secret (str)
+            endpoint (str): 带协议的Endpoint，eg: https://oss-cn-hangzhou.aliyuncs.com；为IP时使用path style，可指向本地的测试服务器
+            bucket_name (str)
+            max_connections (int, 可选): 与OSS之间的最大连接数
+            keepalive_timeout (float, 可选): 空闲连接保持的时间(秒)
+            connect_timeout (float, 可选): 连接超时(秒)
+            read_timeout (float, 可选): 读取超时(秒)
+            limiter (RateLimiter, 可选): 请求速率限制，令牌不足时在线程池中等待，不阻塞事件循环
+            max_retries (int, 可选): 网络错误时的最大尝试次数
+            breaker (CircuitBreaker, 可选): 与其他请求共用的熔断器
+        """
+        if aiohttp is None:
+            raise ModuleNotFoundError("AsyncOssClient需要aiohttp，请执行pip install aiohttp")
+        self.__auth = oss2.Auth(access_key_id, access_key_secret)
+        self.__make_url = _UrlMaker(endpoint, False, False)
+        self.__bucket_name = bucket_name
+        self.__max_connections = max(1, max_connections)
+        self.__keepalive_timeout = keepalive_timeout
+        self.__timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.__limiter = limiter
+        self.__session = None
+        # 与OssOperation相同的重试策略，最大尝试次数按实例设置
+        self.__call = RetryPolicy("async_oss", max_retries, breaker=breaker)(self.__request)
+
+    @classmethod
+    def from_config(cls, limiter=None):
+        import config
+        return cls(config.OSSAccessKeyId, config.OSSAccessKeySecret, 'https://' + config.OssEndpoint, config.bucket_name,
+                   max_connections=config.Async_Max_Connections, limiter=limiter, max_retries=config.Max_Retries,
+                   breaker=CircuitBreaker.shared())
+
+    async def open(self):
+        if self.__session is None:
+            connector = aiohttp.TCPConnector(limit=self.__max_connections, limit_per_host=self.__max_connections,
+                                             keepalive_timeout=self.__keepalive_timeout, ttl_dns_cache=300)
+            # 与oss2相同，不请求也不自动解压压缩的响应体
+            self.__session = aiohttp.ClientSession(connector=connector, timeout=self.__timeout, auto_decompress=False,
+                                                   skip_auto_headers=('Accept-Encoding',), trust_env=True)
+        return self
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def __request(self, method: str, key: str = None, params: dict = None, headers=None, data: bytes = None):
+        """发送一个签名后的请求
+
+        Returns:
+            tuple: (状态码, 响应头, 响应体)
+        """
+        if self.__limiter is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.__limiter.acquire_request)
+        url = self.__make_url(self.__bucket_name, key or '')
+        headers = CaseInsensitiveDict(headers)
+        if method in aiohttp.ClientRequest.POST_METHODS and 'Content-Type' not in headers:
+            # aiohttp会为PUT/POST(即使没有请求体)补上Content-Type: application/octet-stream，签名时必须包含实际发送的值
+            headers['Content-Type'] = 'application/octet-stream'
+        request = Request(method, url, data=data, params=params, headers=headers)
+        self.__auth._sign_request(request, self.__bucket_name, key or '')
+        request_headers = {name: value for name, value in request.headers.items() if value is not None}
+        try:
+            async with self.__session.request(method, url, params=request.params, headers=request_headers, data=data) as resp:
+                body = await resp.read()
+                status, resp_headers = resp.status, CaseInsensitiveDict(resp.headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            raise oss2.exceptions.RequestError(err)
+        if status // 100 != 2:
+            raise oss2.exceptions.make_exception(_Response(status, resp_headers, body))
+        return status, resp_headers, body
+
+    async def head_object(self, key: str) -> CaseInsensitiveDict:
+        """
+        Returns:
+            CaseInsensitiveDict: 响应头，包括x-oss-meta-*
+        """
+        _, headers, _ = await self.__call('HEAD', key)
+        return headers
+
+    async def get_object(self, key: str, byte_range: tuple = None) -> bytes:
+        """读取Object的原始内容
+
+        Args:
+            key (str)
+            byte_range (tuple, 可选): (起始位置, 结束位置)，均包含在内
+        """
+        headers = {'Range': 'bytes=%d-%d' % byte_range} if byte_range else None
+        _, _, body = await self.__call('GET', key, headers=headers)
+        return body
+
+    async def put_object(self, key: str, data: bytes, headers: dict = None) -> CaseInsensitiveDict:
+        _, resp_headers, _ = await self.__call('PUT', key, headers=headers, data=data)
+        return resp_headers
+
+    async def copy_object(self, source_key: str, target_key: str, headers: dict = None) -> CaseInsensitiveDict:
+        """在同一Bucket内复制Object，headers中可以指定x-oss-storage-class和x-oss-metadata-directive"""
+        headers = CaseInsensitiveDict(headers)
+        headers['x-oss-copy-source'] = '/' + self.__bucket_name + '/' + quote(source_key, '')
+        _, resp_headers, _ = await self.__call('PUT', target_key, headers=headers)
+        return resp_headers
+
+    async def delete_objects(self, keys: list) -> list:
+        """批量删除，每次最多1000个
+
+        Returns:
+            list: 响应中列出的已删除的Object
+        """
+        data = xml_utils.to_batch_delete_objects_request(keys, False)
+        _, _, body = await self.__call('POST', params={'delete': '', 'encoding-type': 'url'}, headers={'Content-MD5': utils.content_md5(data)},
+                                       data=data)
+        return [unquote(node.text) for node in ElementTree.fromstring(body).iter('Key')]
+
+    async def restore_object(self, key: str, days: int = 1, tier: str = None) -> int:
+        """解冻归档/冷归档类型的Object
+
+        Args:
+            key (str)
+            days (int, 可选): 解冻后保持解冻状态的天数
+            tier (str, 可选): 冷归档类型的解冻优先级，见oss2.models.RESTORE_TIER_*
+
+        Returns:
+            int: 首次提交时为202，已解冻时为200；解冻中时抛出RestoreAlreadyInProgress
+        """
+        data = xml_utils.to_put_restore_config(RestoreConfiguration(days=days, job_parameters=RestoreJobParameters(tier) if tier else None))
+        status, _, _ = await self.__call('POST', key, params={'restore': ''}, data=data)
+        return status
+
+
+class EventLoopThread(object):
+    """在后台线程中运行事件循环，供同步代码提交协程
+
+    submit返回concurrent.futures.Future，可以直接替代ThreadPoolExecutor.submit的结果
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.loop.run_forever, name="event-loop", daemon=True)
+        self.__thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """提交协程并等待结果"""
+        return self.submit(coro).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.__thread.join()
+        self.loop.close()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from oss_sync_libs import sha256_to_path
+
+logger = logging.getLogger("chunk_store")
+
+
+class ChunkStore(object):
+    """大文件的分块存储
+
+    文件按内容定义分块(见Chunker)，每个块以其sha256为文件名存储在remote_base_dir/.chunks/data/下，只上传远端不存在的块；
+    文件的清单({"size": 文件大小, "chunks": [[块sha256, 块大小], ...]})以文件的sha256为文件名存储在remote_base_dir/.chunks/manifest/下。
+    远端索引仍然记录{路径: 文件sha256}，文件的sha256存在清单时即为分块存储，恢复时按清单拼接各块。
+    不再被任何清单引用的块在collect_garbage中删除。
+    """
+
+    PREFIX = ".chunks/"
+
+    def __init__(self, oss, remote_base_dir: str, cache_dir: str, chunker=None, storage_class: str = 'Standard', num_threads: int = 4):
+        """
+        Args:
+            oss (OssOperation)
+            remote_base_dir (str)
+            cache_dir (str): 清单的本地缓存目录，清单以sha256命名，内容不会改变
+            chunker (Chunker, 可选): 只在上传时需要
+            storage_class (str, 可选): 块的存储类型，只能为Standard或IA：恢复和校验时直接读取块，不会先解冻；清单始终为Standard
+            num_threads (int, 可选): 每个文件同时上传或下载的块数，内存占用约为(num_threads + 1) * 最大块大小
+        """
+        if storage_class not in ('Standard', 'IA'):
+            raise ValueError("块的存储类型只能为Standard或IA，不能为%s" % storage_class)
+        self.__oss = oss
+        self.__remote_base_dir = remote_base_dir
+        self.__cache_dir = cache_dir
+        self.__chunker = chunker
+        self.__storage_class = storage_class
+        self.__num_threads = max(1, num_threads)
+        self.__lock = threading.Lock()
+        self.__chunks = set()  # 远端已存在的块的sha256
+        self.__manifests = set()  # 远端已存在清单的文件sha256
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def chunk_object(self, chunk_sha256: str) -> str:
+        return self.__remote_base_dir + self.PREFIX + "data/" + sha256_to_path(chunk_sha256)
+
+    def manifest_object(self, file_sha256: str) -> str:
+        return self.__remote_base_dir + self.PREFIX + "manifest/" + sha256_to_path(file_sha256)
+
+    def __list_sha256(self, prefix: str) -> set:
+        prefix = self.__remote_base_dir + self.PREFIX + prefix
+        return {obj.key[len(prefix):].replace("/", "") for obj in self.__oss.list_remote_files(prefix)}
+
+    def load(self):
+        """列举远端已存在的块和清单"""
+        self.__chunks = self.__list_sha256("data/")
+        self.__manifests = self.__list_sha256("manifest/")
+        logger.info("[ChunkStore] 远端共有%d个分块存储的文件，%d个块" % (len(self.__manifests), len(self.__chunks)))
+
+    def has_file(self, file_sha256: str) -> bool:
+        """sha256为file_sha256的文件是否已分块存储"""
+        return file_sha256 in self.__manifests
+
+    def read_manifest(self, file_sha256: str) -> dict:
+        """读取清单，优先使用本地缓存"""
+        cache_file = os.path.join(self.__cache_dir, file_sha256 + ".json")
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as fobj:
+                return json.load(fobj)
+        data = self.__oss.download_and_decrypt_bytes(self.manifest_object(file_sha256))
+        manifest = json.loads(data)
+        self.__save_manifest_cache(file_sha256, data)
+        return manifest
+
+    def __save_manifest_cache(self, file_sha256: str, data: bytes):
+        cache_file = os.path.join(self.__cache_dir, file_sha256 + ".json")
+        with open(cache_file + ".tmp", 'wb') as fobj:
+            fobj.write(data)
+        os.replace(cache_file + ".tmp", cache_file)
+
+    def __upload_chunk(self, chunk_sha256: str, data: bytes):
+        self.__oss.encrypt_and_upload_bytes(data, self.chunk_object(chunk_sha256), chunk_sha256, storage_class=self.__storage_class)
+        with self.__lock:
+            self.__chunks.add(chunk_sha256)
+
+    def upload_file(self, local_file_name: str, file_sha256: str) -> int:
+        """分块上传一个文件，只上传远端不存在的块，最后上传清单
+
+        Args:
+            local_file_name (str)
+            file_sha256 (str): 文件的sha256，分块的同时会重新计算并校验
+
+        Returns:
+            int: 实际上传的块的总大小
+        """
+        sha256 = hashlib.sha256()
+        chunks = []
+        uploaded = 0
+        with ThreadPoolExecutor(max_workers=self.__num_threads) as executor:
+            futures = deque()
+            for offset, data in self.__chunker.chunks(local_file_name):
+                sha256.update(data)
+                chunk_sha256 = hashlib.sha256(data).hexdigest()
+                chunks.append([chunk_sha256, len(data)])
+                with self.__lock:
+                    exists = chunk_sha256 in self.__chunks
+                if not exists:
+                    futures.append(executor.submit(self.__upload_chunk, chunk_sha256, data))
+                    uploaded += len(data)
+                del data
+                if len(futures) >= self.__num_threads:
+                    futures.popleft().result()
+            while futures:
+                futures.popleft().result()
+        if sha256.hexdigest() != file_sha256:
+            raise ValueError("文件%s在计算sha256之后被修改" % local_file_name)
+
+        data = json.dumps({'size': sum(length for _, length in chunks), 'chunks': chunks}, separators=(',', ':')).encode('utf-8')
+        self.__oss.encrypt_and_upload_bytes(data, self.manifest_object(file_sha256), hashlib.sha256(data).hexdigest())
+        self.__save_manifest_cache(file_sha256, data)
+        with self.__lock:
+            self.__manifests.add(file_sha256)
+        logger.debug("[ChunkStore] %s共%d个块，上传了%d字节" % (local_file_name, len(chunks), uploaded))
+        return uploaded
+
+    def restore_file(self, file_sha256: str, local_file_name: str) -> str:
+        """按清单下载各块并写入local_file_name，下载的同时计算sha256
+
+        Returns:
+            str: 拼接后文件的sha256
+        """
+        manifest = self.read_manifest(file_sha256)
+        sha256 = hashlib.sha256()
+        fd = os.open(local_file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            with ThreadPoolExecutor(max_workers=self.__num_threads) as executor:
+                futures = deque()
+                offset = 0
+                for chunk_sha256, length in manifest['chunks']:
+                    futures.append(executor.submit(self.__download_chunk, chunk_sha256, length, fd, offset))
+                    offset += length
+                    if len(futures) > self.__num_threads:
+                        sha256.update(futures.popleft().result())
+                while futures:
+                    sha256.update(futures.popleft().result())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return sha256.hexdigest()
+
+    def __download_chunk(self, chunk_sha256: str, length: int, fd: int, offset: int) -> bytes:
+        data = self.__oss.download_and_decrypt_bytes(self.chunk_object(chunk_sha256))
+        if len(data) != length or hashlib.sha256(data).hexdigest() != chunk_sha256:
+            raise ValueError("块%s校验不通过" % chunk_sha256)
+        os.pwrite(fd, data, offset)
+        return data
+
+    def file_size(self, file_sha256: str) -> int:
+        return self.read_manifest(file_sha256)['size']
+
+    def iter_chunks(self, file_sha256_list):
+        """逐个返回file_sha256_list中的文件引用的块(不重复)
+
+        Yields:
+            tuple: (块Object, 块sha256, 块大小)
+        """
+        seen = set()
+        for file_sha256 in file_sha256_list:
+            for chunk_sha256, length in self.read_manifest(file_sha256)['chunks']:
+                if chunk_sha256 not in seen:
+                    seen.add(chunk_sha256)
+                    yield self.chunk_object(chunk_sha256), chunk_sha256, length
+
+    def collect_garbage(self, live_sha256) -> tuple:
+        """删除不在live_sha256中的文件的清单，以及不再被任何清单引用的块
+
+        Args:
+            live_sha256 (Container): 仍需保留的文件的sha256
+
+        Returns:
+            tuple: (删除的清单数, 删除的块数)
+        """
+        stale_manifests = [file_sha256 for file_sha256 in self.__manifests if file_sha256 not in live_sha256]
+        live_chunks = {chunk_sha256 for _, chunk_sha256, _ in self.iter_chunks(self.__manifests - set(stale_manifests))}
+        stale_chunks = [chunk_sha256 for chunk_sha256 in self.__chunks if chunk_sha256 not in live_chunks]
+        if not stale_manifests and not stale_chunks:
+            return 0, 0
+        # 先删除清单再删除块，中断时不会留下引用了已删除块的清单
+        failed = set(self.__oss.delete_remote_files([self.manifest_object(file_sha256) for file_sha256 in stale_manifests]))
+        for file_sha256 in stale_manifests:
+            if self.manifest_object(file_sha256) not in failed:
+                self.__manifests.discard(file_sha256)
+                cache_file = os.path.join(self.__cache_dir, file_sha256 + ".json")
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
+        failed = set(self.__oss.delete_remote_files([self.chunk_object(chunk_sha256) for chunk_sha256 in stale_chunks]))
+        self.__chunks.difference_update(chunk_sha256 for chunk_sha256 in stale_chunks if self.chunk_object(chunk_sha256) not in failed)
+        logger.info("[ChunkStore] 删除了%d个清单和%d个不再被引用的块" % (len(stale_manifests), len(stale_chunks)))
+        return len(stale_manifests), len(stale_chunks)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import re
+import zlib
+
+
+class Chunker(object):
+    """内容定义分块(Content-Defined Chunking)
+
+    切分规则与FastCDC相同：跳过前min_size字节；到avg_size之前使用较难满足的条件，之后使用较易满足的条件(归一化分块)，使块大小集中在avg_size附近；
+    到max_size时强制切分。切分点只取决于其之前WINDOW_SIZE个字节的内容，文件中间插入或删除数据后，后续的切分点会重新对齐，未修改部分的块保持不变。
+
+    逐字节计算滚动哈希在Python中只有约5MB/s，因此分两步判断切分点：先用预编译的正则表达式在C层面找出候选位置
+    (之前CANDIDATE_LENGTH个字节依次属于随机选取的字节集合，约每2^CANDIDATE_LENGTH个字节出现一次)，再对候选位置之前的WINDOW_SIZE个字节计算crc32，低若干位全为0时切分。
+    """
+
+    WINDOW_SIZE = 48
+    CANDIDATE_LENGTH = 8
+
+    def __init__(self, min_size: int, avg_size: int, max_size: int, seed: str = "oss-sync-chunker"):
+        """
+        Args:
+            min_size (int): 最小块大小(B)，不小于WINDOW_SIZE
+            avg_size (int): 期望的平均块大小(B)
+            max_size (int): 最大块大小(B)
+            seed (str, 可选): 生成字节集合的随机种子，修改后所有文件的切分点都会改变
+        """
+        if not self.WINDOW_SIZE <= min_size < avg_size <= max_size:
+            raise ValueError("块大小需满足 %d <= min_size < avg_size <= max_size" % self.WINDOW_SIZE)
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        rng = random.Random(seed)
+        # 每个字节集合包含每对相邻字节值(2k, 2k+1)中的一个，文本等字节分布不均匀的数据中候选位置的密度也接近2^-CANDIDATE_LENGTH
+        self.__candidate = re.compile(b'(?=' + b''.join(
+            b'[' + b''.join(re.escape(bytes([pair + rng.randrange(2)])) for pair in range(0, 256, 2)) + b']'
+            for _ in range(self.CANDIDATE_LENGTH)) + b')')
+        bits = max(3, (avg_size - min_size).bit_length() - 1 - self.CANDIDATE_LENGTH)
+        self.__strict_mask = (1 << (bits + 2)) - 1  # avg_size之前多满足2位
+        self.__loose_mask = (1 << (bits - 2)) - 1  # avg_size之后少满足2位
+
+    def cut(self, data, start: int = 0, end: int = None) -> int:
+        """返回从start开始的第一个块的结束位置
+
+        Args:
+            data (bytes-like): 数据
+            start (int, 可选)
+            end (int, 可选): 数据结束位置，默认为len(data)
+        """
+        end = len(data) if end is None else end
+        if end - start <= self.min_size:
+            return end
+        normal = start + min(self.avg_size, end - start)
+        limit = start + min(self.max_size, end - start)
+        for match in self.__candidate.finditer(data, start + self.min_size - self.CANDIDATE_LENGTH + 1, limit):
+            position = match.start() + self.CANDIDATE_LENGTH
+            if not zlib.crc32(data[position - self.WINDOW_SIZE:position]) & (self.__strict_mask if position <= normal else self.__loose_mask):
+                return position
+        return limit
+
+    def chunks(self, file_name: str):
+        """对文件分块
+
+        使用固定大小的缓冲区顺序读取(readinto)，缓冲区中未切分的数据不少于max_size字节时才切分，切分点与一次读入整个文件时相同；
+        不使用mmap，文件在读取期间被截断时只会提前读到文件末尾，而不会因访问已不存在的页而收到SIGBUS
+
+        Yields:
+            tuple: (偏移, 块数据)
+        """
+        buffer = bytearray(self.max_size * 2)
+        view = memoryview(buffer)
+        with open(file_name, 'rb', buffering=0) as fobj:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fobj.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            offset = 0  # buffer[0]在文件中的偏移
+            start = filled = 0
+            eof = False
+            while True:
+                while not eof and filled - start < self.max_size:
+                    if start:  # 将未切分的数据移至缓冲区开头
+                        view[:filled - start] = view[start:filled]
+                        offset += start
+                        filled -= start
+                        start = 0
+                    size = fobj.readinto(view[filled:])
+                    if not size:
+                        eof = True
+                    filled += size
+                if start >= filled:
+                    return
+                end = self.cut(buffer, start, filled)
+                yield offset + start, bytes(view[start:end])
+                start = end
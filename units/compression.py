@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+CODEC_HEADER = 'x-oss-meta-codec'  # Object内容的压缩方式，不存在时为未压缩
+SIZE_HEADER = 'x-oss-meta-size'  # 压缩的Object解压后的大小(B)，列举得到的是压缩后的大小
+NONE, ZSTD = 'none', 'zstd'
+BUFFER_SIZE = 1024 * 1024
+
+
+class Compressor(object):
+    """上传前的可选压缩
+
+    zstd不可用(未安装zstandard)或level为0时不压缩。文件先抽样试压缩(开头、中间、结尾各sample_size字节)，
+    压缩后大于原大小的max_ratio倍时(图片、视频、压缩包等已压缩的格式)不压缩，只需读取很少的数据即可跳过这些文件
+    """
+
+    def __init__(self, level: int = 3, max_ratio: float = 0.9, min_size: int = 4096, sample_size: int = 64 * 1024):
+        """
+        Args:
+            level (int, 可选): zstd压缩级别(1~22)，0为不压缩
+            max_ratio (float, 可选): 抽样压缩后的大小超过原大小的此比例时不压缩
+            min_size (int, 可选): 小于此大小(B)的文件不压缩
+            sample_size (int, 可选): 每处抽样的大小(B)
+        """
+        self.level = level if zstandard is not None else 0
+        self.__max_ratio = max_ratio
+        self.__min_size = min_size
+        self.__sample_size = sample_size
+
+    @classmethod
+    def from_config(cls):
+        import config
+        return cls(config.Compression_Level, config.Compression_Max_Ratio)
+
+    def choose(self, local_file_name: str) -> str:
+        """
+        Returns:
+            str: local_file_name应使用的压缩方式，NONE或ZSTD
+        """
+        if not self.level:
+            return NONE
+        file_size = os.path.getsize(local_file_name)
+        if file_size < self.__min_size:
+            return NONE
+        with open(local_file_name, 'rb') as fobj:
+            if file_size <= self.__sample_size * 3:
+                sample = fobj.read()
+            else:
+                sample = b''
+                for offset in (0, (file_size - self.__sample_size) // 2, file_size - self.__sample_size):
+                    fobj.seek(offset)
+                    sample += fobj.read(self.__sample_size)
+        compressed_size = len(zstandard.ZstdCompressor(level=self.level).compress(sample))
+        return ZSTD if compressed_size <= len(sample) * self.__max_ratio else NONE
+
+    def compress_file(self, local_file_name: str, compressed_file_name: str) -> int:
+        """流式压缩local_file_name，写入compressed_file_name
+
+        Returns:
+            int: 压缩后的大小(B)
+        """
+        with open(local_file_name, 'rb') as src, open(compressed_file_name, 'wb') as dst:
+            _, written = zstandard.ZstdCompressor(level=self.level).copy_stream(src, dst, read_size=BUFFER_SIZE, write_size=BUFFER_SIZE)
+        return written
+
+
+def decompressor(codec: str):
+    """按顺序解压数据块的函数，codec为None或NONE时原样返回
+
+    Args:
+        codec (str): Object的CODEC_HEADER
+
+    Returns:
+        callable: decompress(压缩的数据块) -> 解压后的数据
+    """
+    if not codec or codec == NONE:
+        return lambda chunk: chunk
+    if codec != ZSTD:
+        raise ValueError("不支持的压缩方式：%s" % codec)
+    if zstandard is None:
+        raise ModuleNotFoundError("Object使用zstd压缩，需要pip install zstandard")
+    return zstandard.ZstdDecompressor().decompressobj().decompress
+
+
+def decompress_file(codec: str, compressed_file_name: str, local_file_name: str) -> str:
+    """流式解压compressed_file_name，写入local_file_name
+
+    Returns:
+        str: 解压后内容的sha256
+    """
+    decompress = decompressor(codec)
+    sha256 = hashlib.sha256()
+    with open(compressed_file_name, 'rb') as src, open(local_file_name, 'wb') as dst:
+        while True:
+            chunk = src.read(BUFFER_SIZE)
+            if not chunk:
+                break
+            data = decompress(chunk)
+            sha256.update(data)
+            dst.write(data)
+    return sha256.hexdigest()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import oss2
+
+logger = logging.getLogger("copy_executor")
+
+
+class CopyExecutor(object):
+    """并行复制远程文件
+
+    每个Object单独重试(见OssOperation.copy_remote_file)，一个Object失败不会导致整个列表从头开始；
+    已完成的复制定期写入检查点文件，中断后再次运行时跳过检查点中源文件相同的目标文件。
+    """
+
+    def __init__(self, oss, max_workers: int = 16, checkpoint_file: str = None, checkpoint_interval: int = 100):
+        """
+        Args:
+            oss (OssOperation)
+            max_workers (int, 可选): 同时复制的Object数量
+            checkpoint_file (str, 可选): 检查点文件路径，None为不使用检查点
+            checkpoint_interval (int, 可选): 每完成多少个复制写入一次检查点
+        """
+        self.__oss = oss
+        self.__max_workers = max(1, max_workers)
+        self.__checkpoint_file = checkpoint_file
+        self.__checkpoint_interval = checkpoint_interval
+
+    def __load_checkpoint(self) -> dict:
+        if not self.__checkpoint_file or not os.path.exists(self.__checkpoint_file):
+            return {}
+        try:
+            with open(self.__checkpoint_file, 'r') as fobj:
+                return json.load(fobj)
+        except ValueError:
+            logger.warning("[CopyExecutor] 检查点文件%s已损坏，将重新复制全部文件" % self.__checkpoint_file)
+            return {}
+
+    def __save_checkpoint(self, done: dict):
+        if not self.__checkpoint_file:
+            return
+        with open(self.__checkpoint_file + ".tmp", 'w') as fobj:
+            json.dump(done, fobj, separators=(',', ':'))
+        os.replace(self.__checkpoint_file + ".tmp", self.__checkpoint_file)
+
+    def run(self, copy_list: dict, storage_class: str = oss2.BUCKET_STORAGE_CLASS_STANDARD, src_sizes: dict = None, progress_callback=None) -> dict:
+        """复制copy_list中的所有文件
+
+        Args:
+            copy_list (dict): {目标文件: 源文件}
+            storage_class (str, 可选)
+            src_sizes (dict, 可选): {源文件: 大小}，用于判断是否使用分片复制，未提供的源文件会先获取其大小
+            progress_callback (callable, 可选): 每个复制完成(包括失败)时以progress_callback(目标文件, 是否成功)调用
+
+        Returns:
+            dict: 复制失败的{目标文件: 源文件}
+        """
+        src_sizes = src_sizes or {}
+        checkpoint = self.__load_checkpoint()
+        done = {dst_obj: src_obj for dst_obj, src_obj in checkpoint.items() if copy_list.get(dst_obj) == src_obj}
+        if done:
+            logger.info("[CopyExecutor] 从检查点恢复，跳过%d个已复制的文件" % len(done))
+            if progress_callback:
+                for dst_obj in done:
+                    progress_callback(dst_obj, True)
+
+        failed = {}
+        with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix="copy") as executor:
+            futures = {executor.submit(self.__oss.copy_remote_file, src_obj, dst_obj, storage_class, src_sizes.get(src_obj)): dst_obj
+                       for dst_obj, src_obj in copy_list.items() if dst_obj not in done}
+            for completed, future in enumerate(as_completed(futures), 1):
+                dst_obj = futures[future]
+                try:
+                    future.result()
+                except oss2.exceptions.OssError as err:
+                    logger.error("[CopyExecutor] 无法复制文件%s <-- %s: %s" % (dst_obj, copy_list[dst_obj], err))
+                    failed[dst_obj] = copy_list[dst_obj]
+                else:
+                    done[dst_obj] = copy_list[dst_obj]
+                if progress_callback:
+                    progress_callback(dst_obj, dst_obj not in failed)
+                if completed % self.__checkpoint_interval == 0:
+                    self.__save_checkpoint(done)
+
+        if failed:
+            self.__save_checkpoint(done)
+        elif self.__checkpoint_file and os.path.exists(self.__checkpoint_file):
+            os.remove(self.__checkpoint_file)
+        return failed
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+SKIP, COPY, UPLOAD = "skip", "copy", "upload"
+
+SyncPlan = namedtuple('SyncPlan', ['upload', 'copy', 'delete', 'skip'])
+SyncPlan.__doc__ = """本地快照与远端索引的差异
+
+upload (dict): {路径: sha256}
+copy (dict): {目标路径: 源路径}
+delete (list): 需要删除的远端索引键，按文件名备份时为路径，使用sha256作为文件名时为sha256
+skip (set): 远端已是最新的路径
+"""
+
+
+class DiffEngine(object):
+    """根据本地快照和远端索引生成上传/复制/删除/跳过的计划，所有判断都使用哈希表查找，整体为O(n)"""
+
+    def __init__(self, remote_files_sha256, sha256_to_remote_file, by_sha256: bool = False):
+        """
+        Args:
+            remote_files_sha256 (Mapping): {远端路径: sha256}
+            sha256_to_remote_file (Mapping): {sha256: 远端路径}
+            by_sha256 (bool, 可选): 远端文件是否以sha256作为文件名(Encrypted_Filename_With_Sha256)
+        """
+        self.__remote = remote_files_sha256
+        self.__by_sha256 = sha256_to_remote_file
+        self.__encrypted_filename = by_sha256
+
+    def classify(self, path: str, sha256: str):
+        """判断单个文件的处理方式，可以在计算sha256的同时逐个调用
+
+        Returns:
+            tuple: (SKIP | COPY | UPLOAD, 复制的源路径或None)
+        """
+        if self.__encrypted_filename:
+            return (SKIP, None) if sha256 in self.__by_sha256 else (UPLOAD, None)
+        if self.__remote.get(path) == sha256:
+            return SKIP, None
+        source = self.__by_sha256.get(sha256)
+        if source is not None:
+            return COPY, source
+        return UPLOAD, None
+
+    @staticmethod
+    def stale_copies(copy_list: dict, local_files_sha256) -> list:
+        """找出源文件本身也会被覆盖的复制任务
+
+        复制在上传完成后进行，如果源路径在本地已被修改，复制得到的将是新内容，这些任务需要改为上传
+
+        Args:
+            copy_list (dict): {目标路径: 源路径}
+            local_files_sha256 (Mapping): {路径: sha256}
+
+        Returns:
+            list: 需要改为上传的目标路径
+        """
+        return [dst for dst, src in copy_list.items()
+                if src in local_files_sha256 and local_files_sha256[src] != local_files_sha256.get(dst)]
+
+    def deletions(self, local_files_sha256) -> list:
+        """远端存在而本地已不存在的文件
+
+        Returns:
+            list: 按文件名备份时为远端路径，使用sha256作为文件名时为sha256
+        """
+        if self.__encrypted_filename:
+            local_sha256 = set(local_files_sha256.values())
+            return [sha256 for sha256 in self.__by_sha256 if sha256 not in local_sha256]
+        return [path for path in self.__remote if path not in local_files_sha256]
+
+    def diff(self, local_files_sha256) -> SyncPlan:
+        """一次性比较完整的本地快照
+
+        Args:
+            local_files_sha256 (Mapping): {路径: sha256}
+        """
+        plan = SyncPlan({}, {}, [], set())
+        for path, sha256 in local_files_sha256.items():
+            action, source = self.classify(path, sha256)
+            if action == SKIP:
+                plan.skip.add(path)
+            elif action == COPY:
+                plan.copy[path] = source
+            else:
+                plan.upload[path] = sha256
+        for path in self.stale_copies(plan.copy, local_files_sha256):
+            del plan.copy[path]
+            plan.upload[path] = local_files_sha256[path]
+        plan.delete.extend(self.deletions(local_files_sha256))
+        return plan
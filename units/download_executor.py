@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import oss2
+
+from oss_sync_libs import calculate_local_file_sha256
+from units.compression import CODEC_HEADER, NONE, SIZE_HEADER
+
+logger = logging.getLogger("download_executor")
+
+
+class DownloadExecutor(object):
+    """并发下载远程文件并校验sha256
+
+    小文件的耗时主要在请求延迟上，因此同时下载大量小文件；大文件本身会以多线程分片下载(见OssOperation.download_remote_file)，所以单独限制同时下载的大文件数量。
+    每个分片下载的文件有独立的检查点，中断后再次运行时，已存在且sha256正确的文件直接跳过，未完成的大文件从检查点继续。
+    压缩上传的Object在列举结果中是压缩后的大小，跳过检查和大文件的判断使用Header中记录的原文件大小。
+    分块存储的文件(见ChunkStore)按清单下载各块并拼接，打包存储的文件(见PackStore)从包中分段下载，都没有检查点。
+    """
+
+    def __init__(self, oss, checkpoint_dir: str, max_workers: int = 16, max_large_downloads: int = 2, large_file_size: int = 1024 * 1024 * 64,
+                 chunk_store=None, pack_store=None):
+        """
+        Args:
+            oss (OssOperation)
+            checkpoint_dir (str): 分片下载检查点的保存目录
+            max_workers (int, 可选): 同时下载的文件数
+            max_large_downloads (int, 可选): 同时下载的大文件数
+            large_file_size (int, 可选): 大于等于此大小的文件视为大文件(B)，应与分片下载阈值一致
+            chunk_store (ChunkStore, 可选): sha256存在清单的文件通过ChunkStore.restore_file恢复
+            pack_store (PackStore, 可选): 打包存储的文件通过PackStore.restore_file恢复
+        """
+        self.__oss = oss
+        self.__chunk_store = chunk_store
+        self.__pack_store = pack_store
+        self.__checkpoint_dir = checkpoint_dir
+        self.__max_workers = max(1, max_workers)
+        self.__large_file_size = large_file_size
+        self.__large_slots = threading.BoundedSemaphore(max(1, max_large_downloads))
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def __checkpoint_file(self, local_file_name: str) -> str:
+        return os.path.join(self.__checkpoint_dir, hashlib.md5(local_file_name.encode('utf-8')).hexdigest() + ".json")
+
+    def __download(self, local_file_name: str, remote_object_name: str, file_sha256: str, file_size: int) -> bool:
+        """下载一个文件
+
+        Args:
+            file_size (int): 远程文件的大小，压缩的Object为压缩后的大小
+
+        Returns:
+            bool: 是否跳过了下载(本地文件已存在且sha256一致)
+        """
+        checkpoint_file = self.__checkpoint_file(local_file_name)
+        headers = None
+        plain_size = file_size
+        if self.__chunk_store and self.__chunk_store.has_file(file_sha256):
+            restore = self.__chunk_store.restore_file
+        elif self.__pack_store and self.__pack_store.has_file(file_sha256):
+            restore = self.__pack_store.restore_file
+        else:
+            restore = None
+            headers = self.__oss.get_remote_file_headers(remote_object_name)
+            if headers == 404:
+                raise ValueError("远程文件%s不存在" % remote_object_name)
+            if headers.get(CODEC_HEADER, NONE) != NONE:
+                # 未记录原文件大小的压缩Object(旧版本上传)只按sha256判断是否跳过
+                plain_size = int(headers[SIZE_HEADER]) if SIZE_HEADER in headers else None
+        if (not os.path.exists(checkpoint_file) and os.path.isfile(local_file_name)
+                and plain_size in (None, os.path.getsize(local_file_name)) and calculate_local_file_sha256(local_file_name) == file_sha256):
+            return True
+        os.makedirs(os.path.dirname(local_file_name) or '.', exist_ok=True)
+        large = max(file_size, plain_size or 0) >= self.__large_file_size
+        if large:
+            self.__large_slots.acquire()
+        try:
+            if restore:
+                sha256 = restore(file_sha256, local_file_name)
+            else:
+                sha256 = self.__oss.download_remote_file(remote_object_name, local_file_name, file_size, checkpoint_file=checkpoint_file,
+                                                         headers=headers)
+        finally:
+            if large:
+                self.__large_slots.release()
+        if sha256 != file_sha256:
+            os.remove(local_file_name)
+            raise ValueError("文件%s的sha256(%s)与索引中的记录(%s)不一致" % (remote_object_name, sha256, file_sha256))
+        return False
+
+    def run(self, download_list: dict, progress_callback=None) -> dict:
+        """下载download_list中的所有文件
+
+        Args:
+            download_list (dict): {本地文件: (远程文件, sha256, 大小)}
+            progress_callback (callable, 可选): 每个文件完成(包括失败)时以progress_callback(本地文件, 是否成功, 是否跳过)调用
+
+        Returns:
+            dict: 下载失败的{本地文件: 远程文件}
+        """
+        failed = {}
+        skipped = 0
+        with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix="download") as executor:
+            futures = {executor.submit(self.__download, local_file_name, remote_object_name, file_sha256, file_size): local_file_name
+                       for local_file_name, (remote_object_name, file_sha256, file_size) in download_list.items()}
+            for future in as_completed(futures):
+                local_file_name = futures[future]
+                is_skipped = False
+                try:
+                    is_skipped = future.result()
+                except (oss2.exceptions.OssError, OSError, ValueError) as err:
+                    logger.error("[DownloadExecutor] 无法下载文件%s --> %s: %s" % (download_list[local_file_name][0], local_file_name, err))
+                    failed[local_file_name] = download_list[local_file_name][0]
+                skipped += is_skipped
+                if progress_callback:
+                    progress_callback(local_file_name, local_file_name not in failed, is_skipped)
+        if skipped:
+            logger.info("[DownloadExecutor] 跳过%d个已存在且sha256一致的文件" % skipped)
+        return failed
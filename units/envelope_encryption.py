@@ -1,20 +1,41 @@
-import sys
-import json
-from Crypto.Cipher import AES
+import base64
+import copy
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
 
-from alibabacloud_kms20160120.client import Client as KmsClient
-from alibabacloud_tea_openapi import models as OpenApiModels
-from alibabacloud_kms20160120 import models as KmsModels
+from Crypto.Cipher import AES
+from oss2 import utils
+from oss2.crypto import BaseCryptoProvider
+from oss2.exceptions import ClientError
+from oss2.models import ContentCryptoMaterial
 
 import config
 
+ENVELOPE_WRAP_ALGORITHM = 'KMS/ALICLOUD/DERIVED'
+
+_client = None
+_client_lock = threading.Lock()
+
 
-api_config = OpenApiModels.Config(
-    access_key_id=config.OSSAccessKeyId,
-    access_key_secret=config.OSSAccessKeySecret,
-    endpoint='kms.%s.aliyuncs.com' % (config.KMSRegion)
-)
-client = KmsClient(api_config)
+def kms_client():
+    """进程内共用的KMS客户端，首次调用时才导入KMS SDK并创建，导入本模块不会发起任何连接"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from alibabacloud_kms20160120.client import Client as KmsClient
+            from alibabacloud_tea_openapi import models as OpenApiModels
+
+            api_config = OpenApiModels.Config(
+                access_key_id=config.OSSAccessKeyId,
+                access_key_secret=config.OSSAccessKeySecret,
+                endpoint='kms.%s.aliyuncs.com' % (config.KMSRegion)
+            )
+            _client = KmsClient(api_config)
+        return _client
 
 
 def GenerateDataKey():
@@ -30,11 +51,13 @@ def GenerateDataKey():
         KeyVersionId (str):密钥版本ID
         RequestId (str):请求ID
     """
+    from alibabacloud_kms20160120 import models as KmsModels
+
     generate_data_key_request = KmsModels.GenerateDataKeyRequest(
         key_id=config.CMKID,
         key_spec='AES_256'
     )    
-    return(client.generate_data_key(generate_data_key_request).to_map())
+    return(kms_client().generate_data_key(generate_data_key_request).to_map())
 
 
 def DecryptDataKey(Ciphertext):
@@ -51,10 +74,141 @@ def DecryptDataKey(Ciphertext):
         KeyVersionId (str)
         RequestId (str)
     """
+    from alibabacloud_kms20160120 import models as KmsModels
+
     decrypt_request=KmsModels.DecryptRequest(
         ciphertext_blob=str(Ciphertext)
     )
-    return(client.decrypt(decrypt_request).to_map())
+    return(kms_client().decrypt(decrypt_request).to_map())
+
+class KmsDataKeys(object):
+    """EnvelopeCryptoProvider使用的KMS接口，封装GenerateDataKey和DecryptDataKey
+
+    测试或离线环境中可以替换为实现了相同两个方法的本地对象
+    """
+
+    def generate_data_key(self) -> tuple:
+        """
+        Returns:
+            tuple: (数据密钥明文, 数据密钥密文CiphertextBlob)
+        """
+        result = GenerateDataKey()
+        return base64.b64decode(result['Plaintext']), result['CiphertextBlob']
+
+    def decrypt(self, ciphertext_blob: str) -> bytes:
+        """
+        Returns:
+            bytes: 数据密钥明文
+        """
+        return base64.b64decode(DecryptDataKey(ciphertext_blob)['Plaintext'])
+
+
+class EnvelopeCryptoProvider(BaseCryptoProvider):
+    """缓存KMS数据密钥的信封加密
+
+    oss2.crypto.RsaProvider每个Object都需要一次RSA运算，AliKMSProvider每个Object都需要调用KMS生成数据密钥。
+    本Provider的一个数据密钥最多用于max_uses个Object或max_age秒；每个Object随机生成salt，由数据密钥经HMAC-SHA256派生出独立的内容密钥，
+    内容仍然使用oss2的AES-256-CTR加密(支持分片上传和分段下载)，IV使用内容密钥以AES-GCM加密并校验。
+    Object的元数据中保存salt和KMS返回的数据密钥密文，解密时数据密钥明文按密文缓存，同一数据密钥加密的Object只需调用一次KMS。
+    """
+
+    SALT_SIZE = 16
+    KEY_ID_SIZE = 8
+    NONCE_SIZE = 12
+
+    def __init__(self, kms=None, max_uses: int = 10000, max_age: float = 3600, cache_size: int = 1024):
+        """
+        Args:
+            kms (KmsDataKeys, 可选): 生成和解密数据密钥，默认使用config中的KMSRegion和CMKID
+            max_uses (int, 可选): 一个数据密钥最多加密的Object数
+            max_age (float, 可选): 一个数据密钥的最长使用时间(秒)
+            cache_size (int, 可选): 缓存的数据密钥明文数量，用于解密
+        """
+        super(EnvelopeCryptoProvider, self).__init__(cipher=utils.AESCTRCipher())
+        self.wrap_alg = ENVELOPE_WRAP_ALGORITHM
+        self.__kms = kms or KmsDataKeys()
+        self.__max_uses = max(1, max_uses)
+        self.__max_age = max_age
+        self.__cache_size = max(1, cache_size)
+        self.__lock = threading.Lock()
+        self.__current = None  # (数据密钥明文, 数据密钥密文, 生成时间)
+        self.__uses = 0
+        self.__plain_keys = OrderedDict()  # {key_id: 数据密钥明文}
+
+    @classmethod
+    def key_id(cls, ciphertext_blob: bytes) -> bytes:
+        return hashlib.sha256(ciphertext_blob).digest()[:cls.KEY_ID_SIZE]
+
+    @staticmethod
+    def __derive(data_key: bytes, salt: bytes) -> bytes:
+        return hmac.new(data_key, b'content-key' + salt, hashlib.sha256).digest()
+
+    def __cache(self, key_id: bytes, data_key: bytes):
+        with self.__lock:
+            self.__plain_keys[key_id] = data_key
+            self.__plain_keys.move_to_end(key_id)
+            while len(self.__plain_keys) > self.__cache_size:
+                self.__plain_keys.popitem(last=False)
+
+    def get_key(self) -> tuple:
+        """当前的数据密钥，已加密max_uses个Object或超过max_age秒时从KMS获取新的数据密钥
+
+        Returns:
+            tuple: (数据密钥明文, 数据密钥密文)
+        """
+        with self.__lock:
+            if self.__current is None or self.__uses >= self.__max_uses or time.monotonic() - self.__current[2] >= self.__max_age:
+                data_key, ciphertext_blob = self.__kms.generate_data_key()
+                self.__current = (data_key, ciphertext_blob.encode('utf-8'), time.monotonic())
+                self.__uses = 0
+            self.__uses += 1
+            data_key, ciphertext_blob, _ = self.__current
+        self.__cache(self.key_id(ciphertext_blob), data_key)
+        return data_key, ciphertext_blob
+
+    def create_content_material(self):
+        data_key, ciphertext_blob = self.get_key()
+        salt = os.urandom(self.SALT_SIZE)
+        content_key = self.__derive(data_key, salt)
+        plain_iv = self.get_iv()
+        nonce = os.urandom(self.NONCE_SIZE)
+        encrypted_iv, tag = AES.new(content_key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(plain_iv)
+
+        cipher = copy.copy(self.cipher)
+        cipher.initialize(content_key, plain_iv)
+        return ContentCryptoMaterial(cipher, self.wrap_alg, salt + ciphertext_blob,
+                                     self.key_id(ciphertext_blob) + salt + nonce + encrypted_iv + tag, self.mat_desc)
+
+    def decrypt_encrypted_key(self, encrypted_key: bytes) -> bytes:
+        salt, ciphertext_blob = encrypted_key[:self.SALT_SIZE], encrypted_key[self.SALT_SIZE:]
+        key_id = self.key_id(ciphertext_blob)
+        with self.__lock:
+            data_key = self.__plain_keys.get(key_id)
+        if data_key is None:
+            try:
+                data_key = self.__kms.decrypt(ciphertext_blob.decode('utf-8'))
+            except Exception as err:
+                raise ClientError("无法解密数据密钥：%s" % err)
+        self.__cache(key_id, data_key)
+        return self.__derive(data_key, salt)
+
+    def decrypt_encrypted_iv(self, encrypted_iv: bytes) -> bytes:
+        """oss2总是先调用decrypt_encrypted_key，此时数据密钥明文已在缓存中"""
+        key_id, encrypted_iv = encrypted_iv[:self.KEY_ID_SIZE], encrypted_iv[self.KEY_ID_SIZE:]
+        salt, encrypted_iv = encrypted_iv[:self.SALT_SIZE], encrypted_iv[self.SALT_SIZE:]
+        nonce, encrypted_iv, tag = encrypted_iv[:self.NONCE_SIZE], encrypted_iv[self.NONCE_SIZE:-16], encrypted_iv[-16:]
+        with self.__lock:
+            data_key = self.__plain_keys.get(key_id)
+        if data_key is None:
+            raise ClientError("数据密钥不在缓存中")
+        try:
+            return AES.new(self.__derive(data_key, salt), AES.MODE_GCM, nonce=nonce).decrypt_and_verify(encrypted_iv, tag)
+        except ValueError:
+            raise ClientError("IV校验失败，Object的加密元数据已损坏")
+
+    def reset_encryption_materials(self, encryption_materials):
+        return self
+
 
 if __name__ == '__main__':
     print(GenerateDataKey())
\ No newline at end of file
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import re
+from fnmatch import translate
+
+
+class ExcludeMatcher(object):
+    """将排除列表一次性编译为合并的正则表达式
+
+    style="fnmatch": 与fnmatchcase相同的语义，模式匹配相对于local_base_dir的完整路径，*可以匹配/
+    style="gitignore": gitignore语义，支持锚定(包含/的模式)、**、以/结尾的仅目录模式以及!取反，后出现的模式优先
+    """
+
+    def __init__(self, patterns: list, style: str = "fnmatch"):
+        """
+        Args:
+            patterns (list): 排除模式列表
+            style (str, 可选): fnmatch或gitignore
+        """
+        if style not in ("fnmatch", "gitignore"):
+            raise ValueError("未知的排除模式语法：%s" % style)
+        self.__style = style
+        if style == "fnmatch":
+            # 只含一个通配符*的常见模式(前缀/*、*后缀、*片段*)改用字符串前后缀和子串查找，其余模式合并为一个正则
+            prefixes, suffixes, substrings, others = [], [], [], []
+            for pattern in patterns:
+                body = pattern.strip('*')
+                if any(char in body for char in '*?['):
+                    others.append(pattern)
+                elif pattern == '*' * len(pattern):
+                    prefixes.append('')
+                elif pattern.startswith('*') and pattern.endswith('*'):
+                    substrings.append(body)
+                elif pattern.endswith('*'):
+                    prefixes.append(body)
+                elif pattern.startswith('*'):
+                    suffixes.append(body)
+                else:
+                    others.append(pattern)
+            self.__prefixes = tuple(prefixes)
+            self.__suffixes = tuple(suffixes)
+            self.__substrings = re.compile('|'.join(re.escape(s) for s in substrings)) if substrings else None
+            self.__file_rules = [(False, self.__combine([self.__translate(p) for p in others]))]
+            # 以*结尾的模式如果能匹配"目录/"，则必然能匹配该目录下的任何路径，可以用于剪枝
+            self.__dir_rules = [(False, self.__combine([self.__translate(p) for p in others if p.endswith('*')]))]
+        else:
+            file_rules, dir_rules = [], []
+            for pattern in patterns:
+                parsed = self.__parse_gitignore(pattern)
+                if parsed is None:
+                    continue
+                negate, body, dir_only = parsed
+                # 匹配某个目录的模式同时排除该目录下的所有文件；仅目录模式只能通过上级目录匹配到文件
+                file_rules.append((negate, body + (r'/.*' if dir_only else r'(?:/.*)?') + r'\Z'))
+                dir_rules.append((negate, body + r'(?:/.*)?\Z'))
+            self.__file_rules = self.__group(file_rules)
+            self.__dir_rules = self.__group(dir_rules)
+
+    @staticmethod
+    def __translate(pattern: str) -> str:
+        """将fnmatch模式转换为正则
+
+        fnmatch.translate为了避免回溯爆炸使用了前瞻+反向引用，匹配速度较慢；通配符较少且不含[]的模式直接转换为.*即可
+        """
+        if '[' in pattern or pattern.count('*') > 3:
+            return translate(pattern)
+        return re.escape(pattern).replace(r'\*', '.*').replace(r'\?', '.') + r'\Z'
+
+    @staticmethod
+    def __combine(regex_list):
+        if not regex_list:
+            return None
+        # fnmatch.translate生成的正则可能包含命名组(g0, g1...)，合并前为每个模式的组名加上序号避免重名
+        regex_list = [re.sub(r'\(\?P([<=])g(\d+)', r'(?P\1p%d_g\2' % index, regex) for index, regex in enumerate(regex_list)]
+        return re.compile('|'.join('(?:%s)' % regex for regex in regex_list), re.S)
+
+    @classmethod
+    def __group(cls, rules):
+        """将连续的同向(排除/取反)模式合并为一个正则，匹配时从后往前找到第一个命中的组即可确定结果"""
+        groups = []
+        for negate, regex in rules:
+            if groups and groups[-1][0] == negate:
+                groups[-1][1].append(regex)
+            else:
+                groups.append((negate, [regex]))
+        return [(negate, cls.__combine(regex_list)) for negate, regex_list in groups]
+
+    @staticmethod
+    def __parse_gitignore(pattern: str):
+        pattern = pattern.rstrip(' ')
+        if not pattern or pattern.startswith('#'):
+            return None
+        negate = pattern.startswith('!')
+        if negate:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+
+        regex = ''
+        i, n = 0, len(pattern)
+        while i < n:
+            if pattern.startswith('**/', i):
+                regex += r'(?:.*/)?'
+                i += 3
+            elif pattern.startswith('**', i):
+                regex += r'.*'
+                i += 2
+            elif pattern[i] == '*':
+                regex += r'[^/]*'
+                i += 1
+            elif pattern[i] == '?':
+                regex += r'[^/]'
+                i += 1
+            elif pattern[i] == '[' and pattern.find(']', i + 2) != -1:
+                end = pattern.find(']', i + 2)
+                content = pattern[i + 1:end].replace('\\', '\\\\')
+                if content.startswith('!'):
+                    content = '^' + content[1:]
+                regex += '[%s]' % content
+                i = end + 1
+            elif pattern[i] == '\\' and i + 1 < n:
+                regex += re.escape(pattern[i + 1])
+                i += 2
+            else:
+                regex += re.escape(pattern[i])
+                i += 1
+        if not anchored:
+            regex = r'(?:.*/)?' + regex
+        return negate, regex, dir_only
+
+    @staticmethod
+    def __match(rules, path: str) -> bool:
+        for negate, regex in reversed(rules):
+            if regex is not None and regex.match(path):
+                return not negate
+        return False
+
+    def match_file(self, path: str) -> bool:
+        """文件是否被排除
+
+        Args:
+            path (str): 相对于local_base_dir的文件路径
+        """
+        if self.__style == "fnmatch" and self.__match_literal(path):
+            return True
+        return self.__match(self.__file_rules, path)
+
+    def __match_literal(self, path: str, include_suffixes: bool = True) -> bool:
+        if self.__prefixes and path.startswith(self.__prefixes):
+            return True
+        if include_suffixes and self.__suffixes and path.endswith(self.__suffixes):
+            return True
+        return self.__substrings is not None and self.__substrings.search(path) is not None
+
+    def match_dir(self, path: str) -> bool:
+        """目录下的所有文件是否都被排除，返回True时扫描可以不再进入该目录
+
+        Args:
+            path (str): 相对于local_base_dir的目录路径，不带后导/
+        """
+        if self.__style == "fnmatch":
+            path = path.rstrip('/') + '/'
+            # *后缀 形式的模式不以*结尾，不能用于剪枝
+            return self.__match_literal(path, include_suffixes=False) or self.__match(self.__dir_rules, path)
+        return self.__match(self.__dir_rules, path.rstrip('/'))
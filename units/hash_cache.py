@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger("hash_cache")
+
+
+class HashCache(object):
+    """本地sha256缓存
+
+    以(路径, 文件大小, mtime_ns, inode, ctime_ns)作为键，元数据未发生变化的文件直接复用缓存中的sha256，无需重新读取文件
+    """
+
+    def __init__(self, db_file: str, rehash_older_than: float = None, commit_interval: int = 5000):
+        """
+        Args:
+            db_file (str): 缓存数据库路径
+            rehash_older_than (float, 可选): 缓存条目的最长有效期(秒)，超过后强制重新计算sha256，None为永不过期
+            commit_interval (int, 可选): 每写入多少条记录提交一次事务
+        """
+        if os.path.dirname(db_file) and not os.path.isdir(os.path.dirname(db_file)):
+            os.makedirs(os.path.dirname(db_file))
+        self.__db = sqlite3.connect(db_file)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS file_hash ("
+                          "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, ctime_ns INTEGER, sha256 TEXT, hashed_at REAL)")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS file_hash_inode ON file_hash (inode)")
+        self.__db.commit()
+        self.__rehash_older_than = rehash_older_than
+        self.__commit_interval = commit_interval
+        self.__pending = 0
+        self.hits = self.misses = 0
+
+    def get(self, path: str, stat_result: os.stat_result = None):
+        """查询缓存
+
+        Args:
+            path (str): 文件路径
+            stat_result (os.stat_result, 可选): 文件的stat信息，不提供时自动获取
+
+        Returns:
+            str: 元数据一致且未过期时返回缓存的sha256，否则返回None
+        """
+        if stat_result is None:
+            stat_result = os.stat(path)
+        row = self.__db.execute("SELECT size, mtime_ns, inode, ctime_ns, sha256, hashed_at FROM file_hash WHERE path=?", (path,)).fetchone()
+        if row is None or tuple(row[:4]) != (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_ctime_ns):
+            self.misses += 1
+            return None
+        if self.__rehash_older_than is not None and time.time() - row[5] > self.__rehash_older_than:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[4]
+
+    def get_by_inode(self, stat_result: os.stat_result):
+        """按(inode, 文件大小, mtime_ns)查询缓存，用于识别被重命名或移动的文件(重命名会改变ctime，因此不比较ctime)
+
+        Returns:
+            str: 匹配条目的sha256，未找到时返回None
+        """
+        row = self.__db.execute("SELECT sha256 FROM file_hash WHERE inode=? AND size=? AND mtime_ns=? LIMIT 1",
+                                (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def set(self, path: str, stat_result: os.stat_result, sha256: str):
+        """写入缓存
+
+        Args:
+            path (str): 文件路径
+            stat_result (os.stat_result): 计算sha256之前获取的stat信息
+            sha256 (str): 文件的sha256
+        """
+        key = (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_ctime_ns)
+        row = self.__db.execute("SELECT size, mtime_ns, inode, ctime_ns, sha256 FROM file_hash WHERE path=?", (path,)).fetchone()
+        if row is not None and tuple(row[:4]) == key and row[4] != sha256:
+            logger.warning("[HashCache] 文件%s的元数据未改变但sha256发生变化(%s -> %s)，文件可能已损坏" % (path, row[4], sha256))
+        self.__db.execute("INSERT OR REPLACE INTO file_hash VALUES (?, ?, ?, ?, ?, ?, ?)", (path, *key, sha256, time.time()))
+        self.__pending += 1
+        if self.__pending >= self.__commit_interval:
+            self.commit()
+
+    def prune(self, live_paths):
+        """删除不在live_paths中的缓存条目
+
+        Args:
+            live_paths (Iterable[str]): 本次扫描到的文件路径
+        """
+        self.__db.execute("CREATE TEMP TABLE IF NOT EXISTS live_path (path TEXT PRIMARY KEY)")
+        self.__db.execute("DELETE FROM live_path")
+        self.__db.executemany("INSERT OR IGNORE INTO live_path VALUES (?)", ((path,) for path in live_paths))
+        removed = self.__db.execute("DELETE FROM file_hash WHERE path NOT IN (SELECT path FROM live_path)").rowcount
+        self.__db.execute("DROP TABLE live_path")
+        self.commit()
+        return removed
+
+    def commit(self):
+        self.__db.commit()
+        self.__pending = 0
+
+    def close(self):
+        self.commit()
+        self.__db.close()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import oss2
+
+from units.remote_index import PathIndex
+
+logger = logging.getLogger("index_journal")
+
+
+class IndexJournal(object):
+    """远端索引的追加写日志
+
+    每条已在OSS上生效的修改(add: 路径 -> sha256, del: 路径)都带有递增的序号，先追加写入本地日志文件并定期fsync，
+    再按条数或时间分批作为日志段上传至OSS；日志段累计到一定数量后在后台合并为新的分片索引(RemoteIndex.save)。
+    运行中断后，下次运行通过replay将未合并的日志段和本地日志应用到远端索引上，已上传的文件不会被重复处理。
+    上传失败的日志段原样(相同的序号范围和Object名)保留，在上传之后的日志段之前重试，远端的日志段序号始终连续。
+    """
+
+    def __init__(self, oss, remote_index, journal_file: str, segment_records: int = 1000, segment_interval: float = 60,
+                 compact_segments: int = 64, fsync_interval: float = 1):
+        """
+        Args:
+            oss (OssOperation)
+            remote_index (RemoteIndex): 已调用过load()的远端索引
+            journal_file (str): 本地日志文件路径
+            segment_records (int, 可选): 每个日志段的最大条数
+            segment_interval (float, 可选): 距上次上传日志段超过此秒数时，即使条数不足也上传
+            compact_segments (int, 可选): 未合并的日志段达到此数量时在后台合并为新的分片索引
+            fsync_interval (float, 可选): 本地日志fsync的最小间隔(秒)，0为每条记录都fsync
+        """
+        self.__oss = oss
+        self.__remote_index = remote_index
+        self.__journal_file = journal_file
+        self.__segment_records = segment_records
+        self.__segment_interval = segment_interval
+        self.__compact_segments = compact_segments
+        self.__fsync_interval = fsync_interval
+
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=1)  # 日志段上传与合并在同一个后台线程中按顺序执行
+        self.__state = None
+        self.__seq = 0
+        self.__pending = []  # 尚未上传的记录
+        self.__failed = []  # 上传失败的日志段(记录列表)，按序号排列
+        self.__futures = []  # 后台任务，close时检查其结果
+        self.__segment_count = 0  # 远端未合并的日志段数量
+        self.__last_segment_time = self.__last_fsync_time = time.monotonic()
+        self.__fobj = None
+
+    @staticmethod
+    def __apply(state: PathIndex, record: dict):
+        if record['op'] == 'add':
+            state[record['path']] = record['sha256']
+        else:
+            state.pop(record['path'], None)
+
+    @staticmethod
+    def __read_records(file_name: str):
+        with open(file_name, 'r', encoding='utf-8') as fobj:
+            for line in fobj:
+                try:
+                    yield json.loads(line)
+                except ValueError:  # 写入过程中断产生的不完整记录
+                    logger.warning("[IndexJournal] 忽略%s中不完整的记录" % file_name)
+
+    def replay(self, state: PathIndex) -> int:
+        """将远端未合并的日志段和本地日志应用到state，此后对索引的修改都应通过add/delete进行
+
+        Args:
+            state (PathIndex): RemoteIndex.load_paths()得到的远端索引，会被直接修改
+
+        Returns:
+            int: 应用的记录数
+        """
+        self.__state = state
+        seq = self.__remote_index.journal_seq
+        applied = 0
+        local_segment = os.path.join(os.path.dirname(self.__journal_file), "segment.jsonl")
+        for first_seq, last_seq, obj in self.__remote_index.list_segments():
+            if last_seq <= seq:  # 已合并但上次未能删除的日志段
+                continue
+            # 日志段缺失时不能忽略，否则会丢失已上传的文件记录
+            if self.__oss.download_and_decrypt_file(local_segment, obj) != 200:
+                raise FileNotFoundError("远端索引日志段%s不存在" % obj)
+            for record in self.__read_records(local_segment):
+                if record['seq'] > seq:
+                    self.__apply(state, record)
+                    seq = record['seq']
+                    applied += 1
+            self.__segment_count += 1
+        if os.path.exists(local_segment):
+            os.remove(local_segment)
+
+        # 本地日志中序号大于远端的记录尚未上传，应用后重新加入待上传队列
+        if os.path.exists(self.__journal_file):
+            for record in self.__read_records(self.__journal_file):
+                if record['seq'] > seq:
+                    self.__apply(state, record)
+                    self.__pending.append(record)
+                    seq = record['seq']
+                    applied += 1
+        self.__seq = seq
+
+        with open(self.__journal_file + ".tmp", 'w', encoding='utf-8') as fobj:
+            for record in self.__pending:
+                fobj.write(json.dumps(record, ensure_ascii=False) + '\n')
+            fobj.flush()
+            os.fsync(fobj.fileno())
+        os.replace(self.__journal_file + ".tmp", self.__journal_file)
+        self.__fobj = open(self.__journal_file, 'a', encoding='utf-8')
+        if applied:
+            logger.info("[IndexJournal] 从日志中恢复了%d条索引修改" % applied)
+        return applied
+
+    def add(self, path: str, sha256: str):
+        """记录路径对应的远端文件已更新为sha256"""
+        with self.__lock:
+            if self.__state.get(path) == sha256:
+                return
+            self.__append({'op': 'add', 'path': path, 'sha256': sha256})
+
+    def delete(self, path: str):
+        """记录路径对应的远端文件已删除"""
+        with self.__lock:
+            if path not in self.__state:
+                return
+            self.__append({'op': 'del', 'path': path})
+
+    def reconcile(self, files_sha256, keep=()):
+        """记录使索引与files_sha256一致所需的全部修改
+
+        Args:
+            files_sha256 (Mapping): {路径: sha256}
+            keep (Container, 可选): 不在files_sha256中但仍需保留在索引中的路径(如删除失败的文件)
+        """
+        for path, sha256 in files_sha256.items():
+            self.add(path, sha256)
+        for path in [path for path in self.__state if path not in files_sha256 and path not in keep]:
+            self.delete(path)
+
+    def __append(self, record: dict):
+        self.__seq += 1
+        record['seq'] = self.__seq
+        self.__fobj.write(json.dumps(record, ensure_ascii=False) + '\n')
+        now = time.monotonic()
+        if now - self.__last_fsync_time >= self.__fsync_interval:
+            self.__fobj.flush()
+            os.fsync(self.__fobj.fileno())
+            self.__last_fsync_time = now
+        self.__apply(self.__state, record)
+        self.__pending.append(record)
+        if len(self.__pending) >= self.__segment_records or now - self.__last_segment_time >= self.__segment_interval:
+            self.__submit_segment()
+
+    def __submit_segment(self):
+        self.__fobj.flush()
+        os.fsync(self.__fobj.fileno())
+        self.__last_fsync_time = self.__last_segment_time = time.monotonic()
+        if self.__pending:
+            records, self.__pending = self.__pending, []
+            self.__submit(self.__upload_segment, records)
+
+    def __submit(self, fn, *args):
+        self.__futures = [future for future in self.__futures if not future.done() or future.exception()]
+        self.__futures.append(self.__executor.submit(fn, *args))
+
+    def __upload_segment(self, records: list = None):
+        """按顺序上传之前失败的日志段和records，某个日志段失败时其后的日志段都不上传，留待下次重试"""
+        if records:
+            self.__failed.append(records)
+        while self.__failed:
+            records = self.__failed[0]
+            first_seq, last_seq = records[0]['seq'], records[-1]['seq']
+            if last_seq > self.__remote_index.journal_seq:  # 否则已包含在合并后的分片中
+                try:
+                    self.__put_segment(records)
+                except (oss2.exceptions.OssError, OSError):
+                    logger.warning("[IndexJournal] 日志段%d-%d上传失败，将在下次上传时重试" % (first_seq, last_seq))
+                    return
+                self.__segment_count += 1
+            self.__failed.pop(0)
+        if self.__segment_count >= self.__compact_segments:
+            self.__compact()
+
+    def __put_segment(self, records: list):
+        first_seq, last_seq = records[0]['seq'], records[-1]['seq']
+        local_segment = os.path.join(os.path.dirname(self.__journal_file), "segment-%d.jsonl" % first_seq)
+        try:
+            with open(local_segment, 'w', encoding='utf-8') as fobj:
+                for record in records:
+                    fobj.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.__oss.encrypt_and_upload_files(local_segment, self.__remote_index.segment_object(first_seq, last_seq), storage_class='Standard')
+        finally:
+            if os.path.exists(local_segment):
+                os.remove(local_segment)
+
+    def __compact(self):
+        with self.__lock:
+            snapshot = self.__state.copy()
+            seq = self.__seq
+        try:
+            self.__remote_index.save(snapshot, journal_seq=seq)
+        except (oss2.exceptions.OssError, OSError):
+            logger.warning("[IndexJournal] 合并索引日志失败，将在下次合并时重试")
+            return
+        self.__segment_count = 0
+        self.__failed = [records for records in self.__failed if records[-1]['seq'] > seq]
+        logger.info("[IndexJournal] 已将序号%d之前的索引日志合并为分片索引" % seq)
+
+    def close(self, compact: bool = False):
+        """上传剩余的记录并等待后台任务完成
+
+        Args:
+            compact (bool, 可选): 是否无论日志段数量多少都合并为分片索引
+        """
+        with self.__lock:
+            self.__submit_segment()
+            self.__submit(self.__upload_segment)  # 没有新的记录时也重试之前失败的日志段
+            if compact or self.__segment_count >= self.__compact_segments:
+                self.__submit(self.__compact)
+        uploaded = True
+        for future in self.__futures:
+            try:
+                future.result()
+            except Exception:
+                logger.exception("[IndexJournal] 后台任务失败")
+                uploaded = False
+        self.__executor.shutdown()
+        with self.__lock:
+            uploaded = uploaded and not self.__pending and not self.__failed
+        if uploaded:  # 所有记录都已保存在OSS上，本地日志可以清空
+            self.__fobj.truncate(0)
+        self.__fobj.close()
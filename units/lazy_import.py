@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """延迟导入模块，首次访问其属性时才真正执行导入
+
+    只计算sha256的进程池工作进程、--help等不访问OSS的路径不需要导入oss2等较重的依赖。
+    已经导入的模块直接返回；Python 3.12之前LazyLoader不是线程安全的，应保证首次访问发生在启动工作线程之前
+
+    Args:
+        name (str): 模块名，eg: oss2
+
+    Returns:
+        module
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named '%s'" % name, name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from oss_sync_libs import sha256_to_path
+
+logger = logging.getLogger("pack_store")
+
+
+class PackStore(object):
+    """小文件的打包存储
+
+    小文件逐个上传时每个文件都需要一次PUT请求，低频访问和归档类型的Object不足64KB时还会按64KB计费。打包存储将小文件依次拼接为约pack_size大小的包，
+    包以其内容的sha256为文件名存储在remote_base_dir/.packs/data/下；每个包另有一个包内索引({"files": {文件sha256: [偏移, 长度]}})，
+    以Standard类型存储在remote_base_dir/.packs/index/下，读取时不需要解冻。
+    远端索引仍然记录{路径: 文件sha256}，文件的sha256存在于某个包内索引时即为打包存储，恢复时按(包, 偏移, 长度)分段下载。
+    """
+
+    PREFIX = ".packs/"
+
+    def __init__(self, oss, remote_base_dir: str, cache_dir: str, pack_size: int = 1024 * 1024 * 64, storage_class: str = 'Standard',
+                 max_uploads: int = 2):
+        """
+        Args:
+            oss (OssOperation)
+            remote_base_dir (str)
+            cache_dir (str): 包内索引的本地缓存目录，包内索引以包的sha256命名，内容不会改变
+            pack_size (int, 可选): 包的大小达到此值时上传(B)
+            storage_class (str, 可选): 包的存储类型，只能为Standard或IA：恢复和校验时直接按范围读取包，不会先解冻；包内索引始终为Standard
+            max_uploads (int, 可选): 同时上传的包数，内存占用约为(max_uploads + 1) * pack_size
+        """
+        if storage_class not in ('Standard', 'IA'):
+            raise ValueError("包的存储类型只能为Standard或IA，不能为%s" % storage_class)
+        self.__oss = oss
+        self.__remote_base_dir = remote_base_dir
+        self.__cache_dir = cache_dir
+        self.__pack_size = pack_size
+        self.__storage_class = storage_class
+        self.__max_uploads = max(1, max_uploads)
+        self.__lock = threading.Lock()
+        self.__locations = {}  # {文件sha256: (包sha256, 偏移, 长度)}
+        self.__packs = {}  # {包sha256: 包内文件数}，只包括包内索引已上传的包
+        self.__orphans = set()  # 包内索引未上传(上传中断)的包
+        self.__buffer = bytearray()
+        self.__pending = {}  # 当前包中的文件{文件sha256: [偏移, 长度]}
+        self.__in_flight = set()  # 正在上传的包中的文件sha256
+        self.__executor = None
+        self.__futures = deque()
+        self.__results = queue.Queue()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def pack_object(self, pack_sha256: str) -> str:
+        return self.__remote_base_dir + self.PREFIX + "data/" + sha256_to_path(pack_sha256)
+
+    def index_object(self, pack_sha256: str) -> str:
+        return self.__remote_base_dir + self.PREFIX + "index/" + sha256_to_path(pack_sha256)
+
+    def __list_sha256(self, prefix: str) -> set:
+        prefix = self.__remote_base_dir + self.PREFIX + prefix
+        return {obj.key[len(prefix):].replace("/", "") for obj in self.__oss.list_remote_files(prefix)}
+
+    def __read_index(self, pack_sha256: str) -> dict:
+        cache_file = os.path.join(self.__cache_dir, pack_sha256 + ".json")
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as fobj:
+                return json.load(fobj)['files']
+        data = self.__oss.download_and_decrypt_bytes(self.index_object(pack_sha256))
+        self.__save_index_cache(pack_sha256, data)
+        return json.loads(data)['files']
+
+    def __save_index_cache(self, pack_sha256: str, data: bytes):
+        cache_file = os.path.join(self.__cache_dir, pack_sha256 + ".json")
+        with open(cache_file + ".tmp", 'wb') as fobj:
+            fobj.write(data)
+        os.replace(cache_file + ".tmp", cache_file)
+
+    def load(self, max_workers: int = 16):
+        """列举远端的包，并读取本地缓存中没有的包内索引"""
+        packs = self.__list_sha256("index/")
+        self.__orphans = self.__list_sha256("data/") - packs
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for pack_sha256, files in zip(packs, executor.map(self.__read_index, packs)):
+                self.__packs[pack_sha256] = len(files)
+                for file_sha256, (offset, length) in files.items():
+                    self.__locations.setdefault(file_sha256, (pack_sha256, offset, length))
+        for name in os.listdir(self.__cache_dir):  # 清理已删除的包的缓存
+            if name.endswith(".json") and name[:-5] not in self.__packs:
+                os.remove(os.path.join(self.__cache_dir, name))
+        logger.info("[PackStore] 远端共有%d个包，%d个打包存储的文件" % (len(self.__packs), len(self.__locations)))
+
+    def has_file(self, file_sha256: str) -> bool:
+        """sha256为file_sha256的文件是否已打包存储(所在的包已上传完成)"""
+        with self.__lock:
+            return file_sha256 in self.__locations
+
+    def location(self, file_sha256: str) -> tuple:
+        """
+        Returns:
+            tuple: (包Object, 偏移, 长度)
+        """
+        with self.__lock:
+            pack_sha256, offset, length = self.__locations[file_sha256]
+        return self.pack_object(pack_sha256), offset, length
+
+    def add(self, local_file_name: str, file_sha256: str):
+        """将一个文件加入当前的包，包已满时提交上传，同时上传的包已达上限时阻塞
+
+        已存储或已在包中的文件直接忽略。文件在计算sha256之后被修改时抛出ValueError，不加入包
+
+        Args:
+            local_file_name (str)
+            file_sha256 (str)
+        """
+        with self.__lock:
+            if file_sha256 in self.__locations or file_sha256 in self.__pending or file_sha256 in self.__in_flight:
+                return
+        with open(local_file_name, 'rb') as fobj:
+            data = fobj.read()
+        if hashlib.sha256(data).hexdigest() != file_sha256:
+            raise ValueError("文件%s在计算sha256之后被修改" % local_file_name)
+        self.__pending[file_sha256] = [len(self.__buffer), len(data)]
+        self.__buffer += data
+        if len(self.__buffer) >= self.__pack_size:
+            self.__seal()
+
+    def __seal(self):
+        """提交当前的包"""
+        if not self.__pending:
+            return
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.__max_uploads, thread_name_prefix="pack")
+        data, files = bytes(self.__buffer), self.__pending
+        self.__buffer, self.__pending = bytearray(), {}
+        with self.__lock:
+            self.__in_flight.update(files)
+        self.__futures.append(self.__executor.submit(self.__upload, data, files))
+        while len(self.__futures) > self.__max_uploads:
+            self.__futures.popleft().result()
+
+    def __upload(self, data: bytes, files: dict):
+        """先上传包再上传包内索引，中断时只会留下没有索引的包，在collect_garbage中删除"""
+        pack_sha256 = hashlib.sha256(data).hexdigest()
+        error = None
+        try:
+            self.__oss.encrypt_and_upload_bytes(data, self.pack_object(pack_sha256), pack_sha256, storage_class=self.__storage_class)
+            index = json.dumps({'files': files}, separators=(',', ':')).encode('utf-8')
+            self.__oss.encrypt_and_upload_bytes(index, self.index_object(pack_sha256), hashlib.sha256(index).hexdigest())
+            self.__save_index_cache(pack_sha256, index)
+        except Exception as err:
+            logger.warning("[PackStore] 上传包%s失败：%s" % (pack_sha256, err))
+            error = err
+        with self.__lock:
+            self.__in_flight.difference_update(files)
+            if error is None:
+                self.__packs[pack_sha256] = len(files)
+                for file_sha256, (offset, length) in files.items():
+                    self.__locations.setdefault(file_sha256, (pack_sha256, offset, length))
+            else:
+                self.__orphans.add(pack_sha256)
+        self.__results.put((list(files), error))
+
+    def completed(self):
+        """返回已经上传完成的包中的文件，不阻塞
+
+        Yields:
+            tuple: ([文件sha256], 上传失败时的异常或None)
+        """
+        while True:
+            try:
+                yield self.__results.get_nowait()
+            except queue.Empty:
+                return
+
+    def join(self):
+        """上传当前未满的包，等待全部上传完成并返回剩余的结果，见completed"""
+        self.__seal()
+        while self.__futures:
+            self.__futures.popleft().result()
+        yield from self.completed()
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+
+    def restore_file(self, file_sha256: str, local_file_name: str) -> str:
+        """从包中分段下载一个文件
+
+        Returns:
+            str: 下载的文件的sha256
+        """
+        pack_object, offset, length = self.location(file_sha256)
+        data = self.__oss.download_and_decrypt_bytes(pack_object, byte_range=(offset, offset + length - 1))
+        with open(local_file_name, 'wb') as fobj:
+            fobj.write(data)
+        return hashlib.sha256(data).hexdigest()
+
+    def iter_packs(self, file_sha256_list):
+        """逐个返回file_sha256_list中的文件所在的包(不重复)
+
+        Yields:
+            tuple: (包Object, 包sha256)
+        """
+        seen = set()
+        for file_sha256 in file_sha256_list:
+            pack_sha256 = self.__locations[file_sha256][0]
+            if pack_sha256 not in seen:
+                seen.add(pack_sha256)
+                yield self.pack_object(pack_sha256), pack_sha256
+
+    def collect_garbage(self, live_sha256) -> int:
+        """删除其中的文件全部不在live_sha256中的包，以及没有包内索引的包
+
+        部分文件已被删除的包会保留，其中仍在使用的文件不会重新打包
+
+        Args:
+            live_sha256 (Container): 仍需保留的文件的sha256
+
+        Returns:
+            int: 删除的包数
+        """
+        live_count = dict.fromkeys(self.__packs, 0)
+        for file_sha256, (pack_sha256, _, _) in self.__locations.items():
+            if file_sha256 in live_sha256:
+                live_count[pack_sha256] += 1
+        stale_packs = [pack_sha256 for pack_sha256, count in live_count.items() if count == 0]
+        dead_bytes = sum(length for file_sha256, (pack_sha256, _, length) in self.__locations.items()
+                         if file_sha256 not in live_sha256 and live_count[pack_sha256])
+        if dead_bytes:
+            logger.info("[PackStore] 仍在使用的包中有%d字节已不再被引用" % dead_bytes)
+        if not stale_packs and not self.__orphans:
+            return 0
+        # 先删除包内索引再删除包，中断时不会留下指向已删除包的索引
+        failed = set(self.__oss.delete_remote_files([self.index_object(pack_sha256) for pack_sha256 in stale_packs]))
+        deleted = [pack_sha256 for pack_sha256 in stale_packs if self.index_object(pack_sha256) not in failed]
+        for pack_sha256 in deleted:
+            del self.__packs[pack_sha256]
+            cache_file = os.path.join(self.__cache_dir, pack_sha256 + ".json")
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+        self.__locations = {file_sha256: location for file_sha256, location in self.__locations.items() if location[0] in self.__packs}
+        orphans = deleted + list(self.__orphans)
+        failed = set(self.__oss.delete_remote_files([self.pack_object(pack_sha256) for pack_sha256 in orphans]))
+        self.__orphans = {pack_sha256 for pack_sha256 in orphans if self.pack_object(pack_sha256) in failed}
+        logger.info("[PackStore] 删除了%d个不再使用的包" % (len(orphans) - len(self.__orphans)))
+        return len(deleted)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+from collections import defaultdict, deque
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+from oss_sync_libs import calculate_local_file_sha256
+
+logger = logging.getLogger("parallel_hash")
+
+
+class HashPool(object):
+    """并行sha256计算
+
+    hashlib在计算大块数据时会释放GIL，因此默认使用线程池；大量小文件时可以改用进程池。
+    每个设备(以st_dev区分)同时读取的文件数量受per_device限制，避免多个线程争抢同一块磁盘造成寻道抖动。
+    """
+
+    def __init__(self, max_workers: int = 4, per_device: int = 2, use_process_pool: bool = False, max_pending: int = None):
+        """
+        Args:
+            max_workers (int, 可选): 工作线程/进程数
+            per_device (int, 可选): 每个设备允许同时读取的文件数
+            use_process_pool (bool, 可选): 使用进程池代替线程池
+            max_pending (int, 可选): 预读取(已stat但未开始计算)的文件数上限，默认为max_workers的16倍
+        """
+        self.__max_workers = max(1, max_workers)
+        self.__per_device = max(1, per_device)
+        self.__use_process_pool = use_process_pool
+        self.__max_pending = max_pending or self.__max_workers * 16
+
+    def imap_unordered(self, paths, cache=None):
+        """按完成顺序逐个返回文件的sha256，调用方可以在全部文件计算完成之前开始处理结果
+
+        Args:
+            paths (Iterable[str | FileRecord]): 需要计算sha256的文件，传入FileRecord时直接使用其中的元数据，不再重复stat
+            cache (HashCache, 可选): sha256缓存，命中的文件不会提交给工作线程
+
+        Yields:
+            tuple: (文件路径, sha256, os.stat_result)，无法读取的文件sha256为False
+        """
+        source = iter(paths)
+        waiting = defaultdict(deque)  # {st_dev: deque[(path, stat)]}
+        waiting_count = 0
+        running = {}  # {future: (path, stat)}
+        device_running = defaultdict(int)
+        exhausted = False
+
+        executor_class = ProcessPoolExecutor if self.__use_process_pool else ThreadPoolExecutor
+        with executor_class(max_workers=self.__max_workers) as executor:
+            while True:
+                while not exhausted and waiting_count + len(running) < self.__max_pending:
+                    try:
+                        path = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if isinstance(path, str):
+                        try:
+                            file_stat = os.stat(path)
+                        except OSError:
+                            logger.warning("[HashPool] 无法读取文件%s的元数据" % path)
+                            yield path, False, None
+                            continue
+                    else:
+                        path, file_stat = path.path, path
+                    if cache:
+                        sha256 = cache.get(path, file_stat)
+                        if sha256:
+                            yield path, sha256, file_stat
+                            continue
+                    waiting[file_stat.st_dev].append((path, file_stat))
+                    waiting_count += 1
+
+                for device, queue in waiting.items():
+                    while queue and device_running[device] < self.__per_device:
+                        path, file_stat = queue.popleft()
+                        waiting_count -= 1
+                        running[executor.submit(calculate_local_file_sha256, path)] = (path, file_stat)
+                        device_running[device] += 1
+
+                if not running:
+                    if exhausted and not waiting_count:
+                        break
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, file_stat = running.pop(future)
+                    device_running[file_stat.st_dev] -= 1
+                    sha256 = future.result()
+                    if sha256 and cache:
+                        cache.set(path, file_stat, sha256)
+                    yield path, sha256, file_stat
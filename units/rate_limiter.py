@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+
+class TokenBucket(object):
+    """令牌桶
+
+    令牌数允许为负：一次取走大于桶容量的令牌(如一个大文件分块)时不会永久阻塞，而是由后续请求等待欠下的令牌补齐。
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Args:
+            rate (float): 每秒补充的令牌数，小于等于0时不限速
+            capacity (float, 可选): 桶容量，默认为1秒的令牌数
+        """
+        self.__lock = threading.Lock()
+        self.__tokens = 0.0
+        self.__last = time.monotonic()
+        self.rate = 0
+        self.set_rate(rate, capacity)
+
+    def set_rate(self, rate: float, capacity: float = None):
+        with self.__lock:
+            self.__refill()
+            self.rate = rate or 0
+            self.capacity = capacity or max(self.rate, 1)
+            self.__tokens = min(self.__tokens, self.capacity)
+
+    def __refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.__tokens = min(self.capacity, self.__tokens + (now - self.__last) * self.rate)
+        self.__last = now
+
+    def acquire(self, amount: float = 1):
+        """取走amount个令牌，令牌不足时阻塞"""
+        if amount <= 0:
+            return
+        while True:
+            with self.__lock:
+                if self.rate <= 0:
+                    return
+                self.__refill()
+                if self.__tokens > 0:
+                    self.__tokens -= amount
+                    return
+                delay = -self.__tokens / self.rate + 0.001
+            time.sleep(min(delay, 1))
+
+
+class RateLimiter(object):
+    """OSS请求速率(请求/秒)与带宽(字节/秒)限制，可按时间段设置不同的速率"""
+
+    def __init__(self, requests_per_second: float = 0, bytes_per_second: float = 0, windows: list = None):
+        """
+        Args:
+            requests_per_second (float, 可选): 默认每秒请求数，0为不限制
+            bytes_per_second (float, 可选): 默认每秒传输字节数，0为不限制
+            windows (list, 可选): 按时间段覆盖默认速率，[("开始时间HH:MM", "结束时间HH:MM", 请求/秒, 字节/秒), ...]，允许跨越零点
+        """
+        self.__default = (requests_per_second or 0, bytes_per_second or 0)
+        self.__windows = []
+        for start, end, rps, bps in windows or []:
+            self.__windows.append((self.__to_minutes(start), self.__to_minutes(end), rps or 0, bps or 0))
+        self.__requests = TokenBucket(0)
+        self.__bytes = TokenBucket(0)
+        self.__current = None
+        self.__checked_at = 0.0
+        self.__update_rates()
+
+    @classmethod
+    def from_config(cls):
+        import config
+        return cls(config.Rate_Limit_Requests_Per_Second, config.Rate_Limit_Bytes_Per_Second, config.Rate_Limit_Windows)
+
+    @staticmethod
+    def __to_minutes(hh_mm: str) -> int:
+        hour, minute = hh_mm.split(":")
+        return int(hour) * 60 + int(minute)
+
+    def __update_rates(self):
+        now = time.monotonic()
+        if self.__current is not None and now - self.__checked_at < 30:
+            return
+        self.__checked_at = now
+        local_time = time.localtime()
+        minutes = local_time.tm_hour * 60 + local_time.tm_min
+        rates = self.__default
+        for start, end, rps, bps in self.__windows:
+            if (start <= minutes < end) if start <= end else (minutes >= start or minutes < end):
+                rates = (rps, bps)
+                break
+        if rates != self.__current:
+            self.__current = rates
+            self.__requests.set_rate(rates[0])
+            self.__bytes.set_rate(rates[1])
+
+    def acquire_request(self, count: int = 1):
+        """在发出count个请求之前调用"""
+        self.__update_rates()
+        self.__requests.acquire(count)
+
+    def acquire_bytes(self, size: int):
+        """在传输size字节之前(或过程中)调用"""
+        self.__update_rates()
+        self.__bytes.acquire(size)
+
+    def progress_callback(self, inner=None):
+        """生成oss2的progress_callback，按实际传输的字节数消耗带宽令牌，从而在传输过程中限速
+
+        Args:
+            inner (callable, 可选): 同时调用的另一个progress_callback
+        """
+        lock = threading.Lock()
+        consumed = [0]
+
+        def callback(consumed_bytes, total_bytes):
+            with lock:
+                delta = consumed_bytes - consumed[0]
+                consumed[0] = max(consumed[0], consumed_bytes)
+            if delta > 0:
+                self.acquire_bytes(delta)
+            if inner:
+                inner(consumed_bytes, total_bytes)
+
+        return callback
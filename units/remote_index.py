@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("remote_index")
+
+SHARD_MAGIC = b'OSI1'
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(buffer, offset: int):
+    result = shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def encode_shard(entries) -> bytes:
+    """编码一个分片
+
+    格式: magic(4B) | 条目数(uint32 LE) | 条目...
+    条目: 与上一条路径的公共前缀长度(varint) | 剩余部分长度(varint) | 剩余部分(UTF-8) | sha256(32B)
+    条目按路径的UTF-8字节序排列
+
+    Args:
+        entries (Iterable[tuple[str, bytes]]): (路径, 32字节sha256)
+    """
+    encoded = sorted((path.encode('utf-8'), digest) for path, digest in entries)
+    out = bytearray(SHARD_MAGIC)
+    out += struct.pack('<I', len(encoded))
+    previous = b''
+    for path, digest in encoded:
+        shared = 0
+        limit = min(len(previous), len(path))
+        while shared < limit and previous[shared] == path[shared]:
+            shared += 1
+        out += encode_varint(shared)
+        out += encode_varint(len(path) - shared)
+        out += path[shared:]
+        out += digest
+        previous = path
+    return bytes(out)
+
+
+def decode_shard(buffer):
+    """解码一个分片，逐条返回(路径, 32字节sha256)
+
+    Args:
+        buffer (bytes | mmap.mmap)
+    """
+    if buffer[:4] != SHARD_MAGIC:
+        raise ValueError("不是有效的索引分片")
+    count = struct.unpack_from('<I', buffer, 4)[0]
+    offset = 8
+    previous = b''
+    for _ in range(count):
+        shared, offset = decode_varint(buffer, offset)
+        length, offset = decode_varint(buffer, offset)
+        path = previous[:shared] + buffer[offset:offset + length]
+        offset += length
+        yield path.decode('utf-8'), bytes(buffer[offset:offset + 32])
+        offset += 32
+        previous = path
+
+
+def file_sha256(file_name: str) -> str:
+    with open(file_name, 'rb') as fobj:
+        return hashlib.sha256(fobj.read()).hexdigest()
+
+
+class PathIndex(MutableMapping):
+    """{路径: sha256}，sha256以32字节保存以节约内存，读写时使用16进制字符串"""
+
+    def __init__(self, items=None):
+        self.__data = {}
+        if items:
+            for path, sha256 in (items.items() if isinstance(items, Mapping) else items):
+                self[path] = sha256
+
+    def set_digest(self, path: str, digest: bytes):
+        self.__data[path] = digest
+
+    def copy(self):
+        index = PathIndex()
+        for path, digest in self.__data.items():
+            index.set_digest(path, digest)
+        return index
+
+    def digest_items(self):
+        return self.__data.items()
+
+    def __getitem__(self, path):
+        return self.__data[path].hex()
+
+    def __setitem__(self, path, sha256):
+        self.__data[path] = bytes.fromhex(sha256)
+
+    def __delitem__(self, path):
+        del self.__data[path]
+
+    def __contains__(self, path):
+        return path in self.__data
+
+    def __iter__(self):
+        return iter(self.__data)
+
+    def __len__(self):
+        return len(self.__data)
+
+
+class DigestIndex(MutableMapping):
+    """{sha256: 路径}，键以32字节保存以节约内存，读写时使用16进制字符串"""
+
+    def __init__(self):
+        self.__data = {}
+
+    @classmethod
+    def from_path_index(cls, path_index: PathIndex):
+        index = cls()
+        for path, digest in path_index.digest_items():
+            index.set_digest(digest, path)
+        return index
+
+    def set_digest(self, digest: bytes, path: str):
+        self.__data[digest] = path
+
+    def __getitem__(self, sha256):
+        return self.__data[bytes.fromhex(sha256)]
+
+    def __setitem__(self, sha256, path):
+        self.__data[bytes.fromhex(sha256)] = path
+
+    def __delitem__(self, sha256):
+        del self.__data[bytes.fromhex(sha256)]
+
+    def __contains__(self, sha256):
+        try:
+            return bytes.fromhex(sha256) in self.__data
+        except (ValueError, TypeError):
+            return False
+
+    def __iter__(self):
+        return (digest.hex() for digest in self.__data)
+
+    def __len__(self):
+        return len(self.__data)
+
+
+class RemoteIndex(object):
+    """OSS上按sha256前缀分片存储的远端索引
+
+    index/<remote_base_dir>/manifest.json 记录每个分片的sha256和条目数，分片以内容寻址保存在 index/<remote_base_dir>/shards/<前缀>-<分片sha256>.idx，
+    因此上传manifest之前中断不会破坏旧索引。保存时只上传内容发生变化的分片；读取时分片按需下载，本地缓存与manifest一致时不重复下载，并通过mmap解码。
+    运行期间的增量修改以日志段保存在 index/<remote_base_dir>/journal/ 下(见IndexJournal)，manifest中的journal_seq为已合并进分片的最后一条日志序号。
+    不存在manifest时读取旧版 index/<remote_base_dir>.json 以便迁移。
+    """
+
+    def __init__(self, oss, remote_base_dir: str, cache_dir: str, prefix_length: int = 2, max_workers: int = 8):
+        """
+        Args:
+            oss (OssOperation)
+            remote_base_dir (str): 带有后导/的远端工作目录
+            cache_dir (str): 本地分片缓存目录
+            prefix_length (int, 可选): 分片所用的sha256前缀长度(16进制字符数)，2为256个分片
+            max_workers (int, 可选): 并发上传/下载分片的数量
+        """
+        self.__oss = oss
+        self.__name = remote_base_dir[:-1]
+        self.__cache_dir = cache_dir
+        self.__prefix_length = prefix_length
+        self.__max_workers = max_workers
+        self.__manifest = None
+        self.__legacy = None
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @property
+    def manifest_object(self) -> str:
+        return "index/%s/manifest.json" % self.__name
+
+    @property
+    def legacy_object(self) -> str:
+        return "index/%s.json" % self.__name
+
+    @property
+    def journal_prefix(self) -> str:
+        return "index/%s/journal/" % self.__name
+
+    @property
+    def journal_seq(self) -> int:
+        return self.__manifest.get('journal_seq', 0) if self.__manifest else 0
+
+    def shard_object(self, shard: str, digest: str) -> str:
+        return "index/%s/shards/%s-%s.idx" % (self.__name, shard, digest)
+
+    def segment_object(self, first_seq: int, last_seq: int) -> str:
+        return "%s%012d-%012d.jsonl" % (self.journal_prefix, first_seq, last_seq)
+
+    def list_segments(self) -> list:
+        """列举远端日志段
+
+        Returns:
+            list: 按序号排列的[(首条序号, 末条序号, Object名称)]
+        """
+        segments = []
+        for obj in self.__oss.list_remote_files(self.journal_prefix):
+            name = obj.key[len(self.journal_prefix):]
+            try:
+                first_seq, last_seq = (int(seq) for seq in name[:-len(".jsonl")].split('-'))
+            except ValueError:
+                logger.warning("[RemoteIndex] 忽略无法识别的日志段%s" % obj.key)
+                continue
+            segments.append((first_seq, last_seq, obj.key))
+        return sorted(segments)
+
+    def load(self) -> bool:
+        """下载manifest(或旧版json)
+
+        Returns:
+            bool: 远端存在索引时返回True，不存在时返回False
+        """
+        local_manifest = os.path.join(self.__cache_dir, "manifest.json")
+        if self.__oss.download_and_decrypt_file(local_manifest, self.manifest_object) == 200:
+            with open(local_manifest, 'r') as fobj:
+                self.__manifest = json.load(fobj)
+            if self.__manifest.get('prefix_length') != self.__prefix_length:
+                logger.warning("[RemoteIndex] 远端索引的分片前缀长度为%s，与设置不一致，将使用远端设置读取并在保存时重新分片" % self.__manifest.get('prefix_length'))
+            return True
+        self.__manifest = {'version': 1, 'prefix_length': self.__prefix_length, 'shards': {}}
+        local_legacy = os.path.join(self.__cache_dir, "legacy.json")
+        if self.__oss.download_and_decrypt_file(local_legacy, self.legacy_object) == 200:
+            logger.info("[RemoteIndex] 读取旧版json索引%s，保存时将迁移为分片索引" % self.legacy_object)
+            with open(local_legacy, 'r') as fobj:
+                self.__legacy = json.load(fobj)
+            return True
+        return False
+
+    def __shard_file(self, shard: str) -> str:
+        """返回本地分片文件路径，本地缓存与manifest不一致时重新下载"""
+        digest = self.__manifest['shards'][shard]['sha256']
+        local_file = os.path.join(self.__cache_dir, "%s.idx" % shard)
+        if os.path.exists(local_file) and file_sha256(local_file) == digest:
+            return local_file
+        # 分片缺失或损坏时不能当作空分片处理，否则会导致大量远端文件被误删
+        if self.__oss.download_and_decrypt_file(local_file, self.shard_object(shard, digest)) != 200:
+            raise FileNotFoundError("远端索引分片%s不存在" % self.shard_object(shard, digest))
+        if file_sha256(local_file) != digest:
+            raise ValueError("远端索引分片%s校验失败" % self.shard_object(shard, digest))
+        return local_file
+
+    def iter_shard(self, shard: str):
+        """逐条返回一个分片中的(路径, 32字节sha256)"""
+        if shard not in self.__manifest['shards']:
+            return
+        with open(self.__shard_file(shard), 'rb') as fobj:
+            with mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield from decode_shard(buffer)
+
+    def iter_digests(self):
+        """逐条返回整个索引的(路径, 32字节sha256)，不在内存中保留完整索引"""
+        if self.__legacy is not None:
+            for path, sha256 in self.__legacy.items():
+                yield path, bytes.fromhex(sha256)
+            return
+        shards = sorted(self.__manifest['shards'])
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:  # 预先并发下载分片
+            for _ in executor.map(self.__shard_file, shards):
+                pass
+        for shard in shards:
+            yield from self.iter_shard(shard)
+
+    def find_by_sha256(self, sha256: str):
+        """按sha256查找一个远端路径，只需要读取对应的分片"""
+        if self.__legacy is not None:
+            return next((path for path, value in self.__legacy.items() if value == sha256), None)
+        digest = bytes.fromhex(sha256)
+        prefix_length = self.__manifest.get('prefix_length', self.__prefix_length)
+        for path, value in self.iter_shard(sha256[:prefix_length].lower()):
+            if value == digest:
+                return path
+        return None
+
+    def load_paths(self, prefix: str = "") -> PathIndex:
+        """读取路径以prefix开头的索引条目
+
+        分片按sha256前缀划分，同一目录下的文件分散在所有分片中，因此按路径查找或判断远端文件是否已删除都需要读取全部分片；
+        这里逐个分片解码，只保留以prefix开头的条目，按sha256查找见find_by_sha256，需要{sha256: 路径}时由DigestIndex.from_path_index生成
+
+        Args:
+            prefix (str, 可选): 只保留以此开头的路径
+
+        Returns:
+            PathIndex: {路径: sha256}
+        """
+        path_index = PathIndex()
+        for path, digest in self.iter_digests():
+            if path.startswith(prefix):
+                path_index.set_digest(path, digest)
+        return path_index
+
+    def save(self, files_sha256, journal_seq: int = None) -> int:
+        """以files_sha256替换远端索引，只上传发生变化的分片，最后上传manifest并删除已合并的日志段
+
+        Args:
+            files_sha256 (Mapping): {路径: sha256}
+            journal_seq (int, 可选): files_sha256已包含的最后一条日志序号，默认为files_sha256包含当前所有日志段
+
+        Returns:
+            int: 上传的分片数量
+        """
+        if self.__manifest is None:
+            self.load()
+        segments = self.list_segments()
+        if journal_seq is None:
+            journal_seq = max([self.journal_seq] + [last_seq for _, last_seq, _ in segments])
+        shards = {}
+        items = files_sha256.digest_items() if isinstance(files_sha256, PathIndex) else \
+            ((path, bytes.fromhex(sha256)) for path, sha256 in files_sha256.items())
+        for path, digest in items:
+            shards.setdefault(digest.hex()[:self.__prefix_length], []).append((path, digest))
+
+        old_shards = self.__manifest['shards'] if self.__manifest.get('prefix_length') == self.__prefix_length else {}
+        new_manifest = {'version': 1, 'prefix_length': self.__prefix_length, 'journal_seq': journal_seq, 'shards': {}}
+        changed = []
+        for shard, entries in shards.items():
+            data = encode_shard(entries)
+            digest = hashlib.sha256(data).hexdigest()
+            new_manifest['shards'][shard] = {'sha256': digest, 'count': len(entries)}
+            if old_shards.get(shard, {}).get('sha256') != digest:
+                local_file = os.path.join(self.__cache_dir, "%s.idx" % shard)
+                with open(local_file, 'wb') as fobj:
+                    fobj.write(data)
+                changed.append(shard)
+        del shards
+
+        def upload(shard):
+            self.__oss.encrypt_and_upload_files(os.path.join(self.__cache_dir, "%s.idx" % shard),
+                                                self.shard_object(shard, new_manifest['shards'][shard]['sha256']), storage_class='Standard')
+
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+            for _ in executor.map(upload, changed):
+                pass
+
+        local_manifest = os.path.join(self.__cache_dir, "manifest.json")
+        with open(local_manifest, 'w') as fobj:
+            json.dump(new_manifest, fobj, separators=(',', ':'))
+        self.__oss.encrypt_and_upload_files(local_manifest, self.manifest_object, storage_class='Standard')
+
+        new_objects = {self.shard_object(shard, info['sha256']) for shard, info in new_manifest['shards'].items()}
+        removed = [self.shard_object(shard, info['sha256']) for shard, info in self.__manifest['shards'].items()]
+        removed = [obj for obj in removed if obj not in new_objects]
+        removed += [obj for _, last_seq, obj in segments if last_seq <= journal_seq]
+        if removed:
+            self.__oss.delete_remote_files(removed)
+        self.__manifest = new_manifest
+        self.__legacy = None
+        logger.info("[RemoteIndex] 索引共%d个分片，上传了其中%d个发生变化的分片" % (len(new_manifest['shards']), len(changed)))
+        return len(changed)
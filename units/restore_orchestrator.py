@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import oss2
+
+logger = logging.getLogger("restore_orchestrator")
+
+PENDING, SUBMITTED, RESTORED, FAILED = "pending", "submitted", "restored", "failed"
+
+
+class RestoreOrchestrator(object):
+    """批量解冻归档/冷归档文件并在解冻完成后立即复制
+
+    每个源文件的解冻状态保存在sqlite中，进程重启后不会重复提交解冻，已完成的复制也不会重复执行。
+    解冻请求并发提交；之后按轮次并发HEAD查询仍在解冻中的文件，某一轮有文件解冻完成时轮询间隔重置为最小值，否则加倍直至最大值。
+    每个文件解冻完成后立即开始复制，不必等待全部文件解冻。
+    """
+
+    # 首次查询前的等待时间(秒)，None为归档类型，0/1/2为冷归档的高优先级/标准/批量解冻
+    INITIAL_DELAY = {None: 60, 0: 600, 1: 3600 * 2, 2: 3600 * 5}
+
+    def __init__(self, oss, state_file: str, max_workers: int = 16, copy_workers: int = 16, min_poll_interval: float = 60,
+                 max_poll_interval: float = 1800):
+        """
+        Args:
+            oss (OssOperation)
+            state_file (str): 解冻状态数据库路径
+            max_workers (int, 可选): 同时提交解冻或查询解冻状态的请求数
+            copy_workers (int, 可选): 同时复制的文件数
+            min_poll_interval (float, 可选): 最小轮询间隔(秒)
+            max_poll_interval (float, 可选): 最大轮询间隔(秒)
+        """
+        self.__oss = oss
+        self.__state_file = state_file
+        self.__max_workers = max(1, max_workers)
+        self.__copy_workers = max(1, copy_workers)
+        self.__min_poll_interval = min_poll_interval
+        self.__max_poll_interval = max_poll_interval
+        self.__db = sqlite3.connect(state_file)
+        self.__db.execute("CREATE TABLE IF NOT EXISTS restore_state (src TEXT PRIMARY KEY, state TEXT, tier INTEGER, submitted_at REAL)")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS copy_done (dst TEXT PRIMARY KEY, src TEXT)")
+        self.__db.commit()
+
+    def __set_state(self, src_obj: str, state: str, tier=None, submitted_at: float = None):
+        self.__db.execute("INSERT OR REPLACE INTO restore_state VALUES (?, ?, ?, ?)", (src_obj, state, tier, submitted_at))
+
+    def __submit(self, src_obj: str, restore_configuration):
+        try:
+            return self.__oss.restore_remote_file(src_obj, restore_configuration=restore_configuration)
+        except oss2.exceptions.OssError:
+            logger.exception("[RestoreOrchestrator] 无法解冻文件%s" % src_obj)
+            return None
+
+    def __check(self, src_obj: str):
+        try:
+            return self.__oss.check_restore_status(src_obj)
+        except oss2.exceptions.OssError:
+            logger.warning("[RestoreOrchestrator] 无法获取文件%s的解冻状态" % src_obj)
+            return None
+
+    def __submit_restores(self, executor, src_list: list, restore_configuration) -> dict:
+        """并发提交解冻请求并记录结果
+
+        Returns:
+            dict: {源文件: 状态}
+        """
+        now = time.time()
+        states = {}
+        for src_obj, status in zip(src_list, executor.map(lambda src_obj: self.__submit(src_obj, restore_configuration), src_list)):
+            if status in (200, 202, 409):  # 已提交或正在解冻中
+                states[src_obj] = SUBMITTED
+            elif status == 400:  # 非归档类型的文件无需解冻
+                states[src_obj] = RESTORED
+            else:
+                states[src_obj] = FAILED
+            self.__set_state(src_obj, states[src_obj], restore_configuration, now)
+        self.__db.commit()
+        return states
+
+    def run(self, copy_list: dict, restore_configuration: int = None, storage_class=oss2.BUCKET_STORAGE_CLASS_STANDARD, src_sizes: dict = None,
+            progress_callback=None) -> dict:
+        """解冻copy_list中的源文件，并在每个源文件解冻完成后复制到目标文件
+
+        Args:
+            copy_list (dict): {目标文件: 源文件}
+            restore_configuration (int, 可选): 冷归档文件的解冻优先级，见OssOperation.restore_remote_file，归档文件为None
+            storage_class (str, 可选): 目标文件的存储类型
+            src_sizes (dict, 可选): {源文件: 大小}，见OssOperation.copy_remote_file
+            progress_callback (callable, 可选): 每个复制完成(包括失败)时以progress_callback(目标文件, 是否成功)调用
+
+        Returns:
+            dict: 复制失败的{目标文件: 源文件}
+        """
+        src_sizes = src_sizes or {}
+        dst_by_src = {}
+        for dst_obj, src_obj in copy_list.items():
+            dst_by_src.setdefault(src_obj, []).append(dst_obj)
+        copied = {dst_obj for dst_obj, src_obj in self.__db.execute("SELECT dst, src FROM copy_done") if copy_list.get(dst_obj) == src_obj}
+        if copied:
+            logger.info("[RestoreOrchestrator] 从上次运行中恢复，跳过%d个已复制的文件" % len(copied))
+            if progress_callback:
+                for dst_obj in copied:
+                    progress_callback(dst_obj, True)
+
+        states = {src_obj: (state, submitted_at) for src_obj, state, submitted_at in
+                  self.__db.execute("SELECT src, state, submitted_at FROM restore_state")}
+        submitted_at = {}
+        pending = []
+        for src_obj, dst_list in dst_by_src.items():
+            if all(dst_obj in copied for dst_obj in dst_list):
+                continue
+            state, timestamp = states.get(src_obj, (PENDING, None))
+            if state in (SUBMITTED, RESTORED):  # 解冻状态可能已过期，重新查询
+                submitted_at[src_obj] = timestamp
+            else:
+                pending.append(src_obj)
+
+        failed = {}
+        copying = {}  # {future: 目标文件}
+
+        def fail(src_obj):
+            for dst_obj in dst_by_src[src_obj]:
+                if dst_obj not in copied:
+                    failed[dst_obj] = src_obj
+                    if progress_callback:
+                        progress_callback(dst_obj, False)
+
+        def track(states: dict):
+            for src_obj, state in states.items():
+                if state == SUBMITTED:
+                    submitted_at[src_obj] = time.time()
+                elif state == RESTORED:
+                    restored.append(src_obj)
+                else:
+                    fail(src_obj)
+
+        with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix="restore") as executor, \
+                ThreadPoolExecutor(max_workers=self.__copy_workers, thread_name_prefix="copy") as copy_executor:
+            restored = []
+            track(self.__submit_restores(executor, pending, restore_configuration))
+            if pending:
+                logger.info("[RestoreOrchestrator] 已提交%d个文件的解冻请求" % len(pending))
+
+            interval = self.__min_poll_interval
+            next_poll = max(submitted_at.values(), default=0) + self.INITIAL_DELAY.get(restore_configuration, self.__min_poll_interval)
+            while submitted_at or restored or copying:
+                for src_obj in restored:  # 解冻完成的文件立即开始复制
+                    for dst_obj in dst_by_src[src_obj]:
+                        if dst_obj not in copied:
+                            future = copy_executor.submit(self.__oss.copy_remote_file, src_obj, dst_obj, storage_class, src_sizes.get(src_obj))
+                            copying[future] = dst_obj
+                restored = []
+
+                if submitted_at and time.time() >= next_poll:
+                    src_list = list(submitted_at)
+                    resubmit = []
+                    for src_obj, status in zip(src_list, executor.map(self.__check, src_list)):
+                        if status == 200:
+                            restored.append(src_obj)
+                            self.__set_state(src_obj, RESTORED, restore_configuration, submitted_at.pop(src_obj))
+                        elif status == 404:
+                            submitted_at.pop(src_obj)
+                            self.__set_state(src_obj, FAILED, restore_configuration)
+                            fail(src_obj)
+                        elif status == 410:  # 没有提交解冻或者解冻已过期
+                            submitted_at.pop(src_obj)
+                            resubmit.append(src_obj)
+                    self.__db.commit()
+                    if resubmit:
+                        logger.info("[RestoreOrchestrator] %d个文件的解冻已过期，重新提交解冻" % len(resubmit))
+                        track(self.__submit_restores(executor, resubmit, restore_configuration))
+                    interval = self.__min_poll_interval if restored else min(interval * 2, self.__max_poll_interval)
+                    next_poll = time.time() + interval
+                    logger.info("[RestoreOrchestrator] 本轮有%d个文件解冻完成，%d个文件仍在解冻中" % (len(restored), len(submitted_at)))
+                    if restored:
+                        continue
+
+                timeout = max(0, next_poll - time.time()) if submitted_at else None
+                if not copying:
+                    if timeout:
+                        time.sleep(timeout)
+                    continue
+                done, _ = wait(copying, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dst_obj = copying.pop(future)
+                    try:
+                        future.result()
+                    except oss2.exceptions.OssError as err:
+                        logger.error("[RestoreOrchestrator] 无法复制文件%s <-- %s: %s" % (dst_obj, copy_list[dst_obj], err))
+                        failed[dst_obj] = copy_list[dst_obj]
+                    else:
+                        copied.add(dst_obj)
+                        self.__db.execute("INSERT OR REPLACE INTO copy_done VALUES (?, ?)", (dst_obj, copy_list[dst_obj]))
+                    if progress_callback:
+                        progress_callback(dst_obj, dst_obj not in failed)
+                self.__db.commit()
+
+        self.__db.close()
+        if not failed:
+            os.remove(self.__state_file)
+        return failed
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import functools
+import inspect
+import logging
+import random
+import threading
+import time
+
+from units.lazy_import import lazy_import
+
+oss2 = lazy_import("oss2")
+requests = lazy_import("requests")
+logger = logging.getLogger("retry_policy")
+
+THROTTLED, NETWORK, PERMANENT = "throttled", "network", "permanent"
+THROTTLING_CODES = {'SlowDown', 'TooManyRequests', 'QpsLimitExceeded', 'ServiceUnavailable', 'RequestTimeout'}
+
+
+def classify(err: BaseException) -> str:
+    """错误分类
+
+    Returns:
+        str: THROTTLED(服务端限流，需要更长的等待)、NETWORK(网络错误或服务端5xx，可以重试)或PERMANENT(重试也不会成功)
+    """
+    if isinstance(err, oss2.exceptions.ServerError):
+        if err.status in (429, 503) or err.code in THROTTLING_CODES:
+            return THROTTLED
+        return NETWORK if err.status >= 500 else PERMANENT
+    # ClientError包括传输中断导致的解密失败、CRC校验失败(InconsistentError)等，与网络错误一样重试
+    if isinstance(err, (oss2.exceptions.RequestError, oss2.exceptions.ClientError, oss2.exceptions.InconsistentError, ConnectionError,
+                        TimeoutError, requests.exceptions.RequestException)):
+        return NETWORK
+    return PERMANENT
+
+
+class CircuitBreaker(object):
+    """所有OSS请求共用的熔断器
+
+    连续failure_threshold次请求出现网络错误或限流时打开，打开期间所有线程在发出请求前一起等待，而不是各自重试直至耗尽次数；
+    等待结束后放行请求，此时再失败一次立即重新打开并将等待时间加倍，成功一次则关闭并恢复初始等待时间。
+    """
+
+    __shared = None
+    __shared_lock = threading.Lock()
+
+    def __init__(self, failure_threshold: int = 8, reset_timeout: float = 15, max_reset_timeout: float = 300):
+        """
+        Args:
+            failure_threshold (int, 可选): 连续失败多少次后打开，0为不使用熔断
+            reset_timeout (float, 可选): 首次打开时的等待时间(秒)
+            max_reset_timeout (float, 可选): 等待时间上限(秒)
+        """
+        self.__lock = threading.Lock()
+        self.__threshold = failure_threshold
+        self.__base_timeout = reset_timeout
+        self.__max_timeout = max_reset_timeout
+        self.__timeout = reset_timeout
+        self.__failures = 0
+        self.__open_until = 0.0
+        self.__half_open = False
+
+    @classmethod
+    def shared(cls):
+        """进程内共用的熔断器，按config创建"""
+        with cls.__shared_lock:
+            if cls.__shared is None:
+                import config
+                cls.__shared = cls(config.Circuit_Breaker_Threshold, config.Circuit_Breaker_Timeout)
+            return cls.__shared
+
+    def remaining(self) -> float:
+        """距离放行请求还需等待的秒数"""
+        with self.__lock:
+            return max(0.0, self.__open_until - time.monotonic())
+
+    def wait(self):
+        """熔断器打开时阻塞，直至放行请求"""
+        while True:
+            delay = self.remaining()
+            if delay <= 0:
+                return
+            time.sleep(min(delay, 1))
+
+    async def wait_async(self):
+        import asyncio
+
+        while True:
+            delay = self.remaining()
+            if delay <= 0:
+                return
+            await asyncio.sleep(min(delay, 1))
+
+    def record_success(self):
+        with self.__lock:
+            self.__failures = 0
+            if self.__half_open:
+                self.__half_open = False
+                self.__timeout = self.__base_timeout
+                logger.info("[CircuitBreaker] 请求已恢复")
+
+    def record_failure(self):
+        """记录一次网络错误或限流"""
+        if self.__threshold <= 0:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            if now < self.__open_until:  # 打开之前已发出的请求
+                return
+            self.__failures += 1
+            if self.__half_open or self.__failures >= self.__threshold:
+                self.__open_until = now + self.__timeout
+                logger.warning("[CircuitBreaker] 连续%d次请求失败，暂停所有OSS请求%g秒" % (self.__failures, self.__timeout))
+                self.__timeout = min(self.__timeout * 2, self.__max_timeout)
+                self.__half_open = True
+                self.__failures = 0
+
+
+class RetryPolicy(object):
+    """统一的重试策略，可作为同步或异步函数的装饰器
+
+    只重试THROTTLED和NETWORK类错误，等待时间为带完全抖动(full jitter)的指数退避，限流错误的基础等待时间更长；
+    每个操作有独立的预算(最大尝试次数和总时长)，耗尽后抛出最后一次的异常，非oss2的网络异常包装为oss2.exceptions.RequestError。
+    """
+
+    DEFAULT_BUDGETS = {  # {操作: (最大尝试次数, 总时长上限(秒))}，尝试次数为None时使用Max_Retries
+        'upload': (None, 1800),
+        'download': (None, 1800),
+        'copy': (None, 1800),
+        'metadata': (None, 300),
+        'delete': (None, 600),
+        }
+
+    def __init__(self, name: str, max_attempts: int = 5, max_elapsed: float = None, base_delay: float = 1, max_delay: float = 60,
+                 throttle_delay: float = 5, breaker: CircuitBreaker = None):
+        """
+        Args:
+            name (str): 操作名称，用于日志
+            max_attempts (int, 可选): 最大尝试次数(包括第一次)
+            max_elapsed (float, 可选): 从第一次尝试开始的总时长上限(秒)，None为不限制
+            base_delay (float, 可选): 网络错误第一次重试的最大等待时间(秒)，之后每次加倍
+            max_delay (float, 可选): 单次等待时间上限(秒)
+            throttle_delay (float, 可选): 限流错误第一次重试的最大等待时间(秒)
+            breaker (CircuitBreaker, 可选)
+        """
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.max_elapsed = max_elapsed
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__throttle_delay = throttle_delay
+        self.__breaker = breaker
+
+    @classmethod
+    def from_config(cls, operation: str):
+        """按config.Retry_Budgets(未设置时为DEFAULT_BUDGETS)创建operation的重试策略，共用同一个熔断器"""
+        import config
+        max_attempts, max_elapsed = config.Retry_Budgets.get(operation, cls.DEFAULT_BUDGETS.get(operation, (None, None)))
+        return cls(operation, max_attempts or config.Max_Retries, max_elapsed, breaker=CircuitBreaker.shared())
+
+    def __delay(self, err: BaseException, attempt: int, started: float) -> float:
+        """第attempt次尝试失败后的等待时间，不应重试时重新抛出err"""
+        kind = classify(err)
+        if kind == PERMANENT:
+            raise err
+        if self.__breaker:
+            self.__breaker.record_failure()
+        elapsed = time.monotonic() - started
+        if attempt >= self.max_attempts or (self.max_elapsed is not None and elapsed >= self.max_elapsed):
+            logger.error("[%s] 重试%d次后仍然失败：%s" % (self.name, attempt - 1, err))
+            if isinstance(err, oss2.exceptions.OssError):
+                raise err
+            raise oss2.exceptions.RequestError(err) from err
+        base = self.__throttle_delay if kind == THROTTLED else self.__base_delay
+        delay = random.uniform(0, min(self.__max_delay, base * 2 ** (attempt - 1)))
+        if self.__breaker:
+            delay = max(delay, self.__breaker.remaining())
+        if self.max_elapsed is not None:
+            delay = min(delay, max(0.0, self.max_elapsed - elapsed))
+        logger.warning("[%s] 第%d次尝试失败(%s)，%.1f秒后重试：%s" % (self.name, attempt, kind, delay, err))
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.__breaker:
+                self.__breaker.wait()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as err:
+                time.sleep(self.__delay(err, attempt, started))
+            else:
+                if self.__breaker:
+                    self.__breaker.record_success()
+                return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        import asyncio
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.__breaker:
+                await self.__breaker.wait_async()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as err:
+                await asyncio.sleep(self.__delay(err, attempt, started))
+            else:
+                if self.__breaker:
+                    self.__breaker.record_success()
+                return result
+
+    def __call__(self, fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                return await self.call_async(fn, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        return wrapper
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import queue
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger("scanner")
+
+
+class FileRecord(namedtuple('FileRecord', ['path', 'size', 'mtime_ns', 'inode', 'ctime_ns', 'dev'])):
+    """扫描得到的文件信息，提供与os.stat_result同名的st_*属性，可以直接代替stat_result传给HashCache和HashPool"""
+    __slots__ = ()
+
+    @classmethod
+    def from_stat(cls, path: str, stat_result: os.stat_result):
+        return cls(path, stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_ctime_ns, stat_result.st_dev)
+
+    st_size = property(lambda self: self.size)
+    st_mtime_ns = property(lambda self: self.mtime_ns)
+    st_ino = property(lambda self: self.inode)
+    st_ctime_ns = property(lambda self: self.ctime_ns)
+    st_dev = property(lambda self: self.dev)
+
+
+def walk_files(root: str, is_excluded=None, is_dir_excluded=None):
+    """使用os.scandir遍历目录，复用DirEntry缓存的类型信息，跳过符号链接
+
+    Args:
+        root (str): 起始目录
+        is_excluded (callable, 可选): is_excluded(文件路径)返回True时跳过该文件
+        is_dir_excluded (callable, 可选): is_dir_excluded(目录路径)返回True时不再进入该目录
+
+    Yields:
+        FileRecord
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            iterator = os.scandir(directory)
+        except OSError:
+            logger.warning("[walk_files] 无法读取目录%s" % directory)
+            continue
+        with iterator:
+            for entry in iterator:
+                path = os.path.join(directory, entry.name)
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (is_dir_excluded and is_dir_excluded(path)):
+                            stack.append(path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False) or (is_excluded and is_excluded(path)):
+                        continue
+                    yield FileRecord.from_stat(path, entry.stat(follow_symlinks=False))
+                except OSError:
+                    logger.warning("[walk_files] 无法读取文件%s的元数据，可能是由于文件被删除" % path)
+
+
+def walk_roots(roots: list, is_excluded=None, is_dir_excluded=None, max_queued: int = 10000):
+    """并行遍历多个目录，按扫描顺序逐个返回结果，下游可以在扫描结束前开始处理
+
+    Args:
+        roots (list): 起始目录列表
+        is_excluded (callable, 可选): 见walk_files
+        is_dir_excluded (callable, 可选): 见walk_files
+        max_queued (int, 可选): 扫描结果缓冲区大小，下游处理较慢时扫描线程会阻塞
+
+    Yields:
+        FileRecord
+    """
+    if len(roots) <= 1:
+        for root in roots:
+            yield from walk_files(root, is_excluded, is_dir_excluded)
+        return
+
+    results = queue.Queue(maxsize=max_queued)
+    finished = object()
+    stop = threading.Event()
+
+    def worker(root):
+        try:
+            for record in walk_files(root, is_excluded, is_dir_excluded):
+                while not stop.is_set():
+                    try:
+                        results.put(record, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception:
+            logger.exception("[walk_roots] 扫描目录%s时出错" % root)
+        finally:
+            results.put(finished)
+
+    threads = [threading.Thread(target=worker, args=(root,), daemon=True) for root in roots]
+    for thread in threads:
+        thread.start()
+    try:
+        remaining = len(threads)
+        while remaining:
+            record = results.get()
+            if record is finished:
+                remaining -= 1
+                continue
+            yield record
+    finally:
+        stop.set()
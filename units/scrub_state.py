@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger("scrub_state")
+
+
+class ScrubState(object):
+    """记录每个Object上次校验的时间和结果
+
+    每次运行按上次校验时间从早到晚(从未校验过的最先)选取一部分Object，多次运行后依次覆盖整个Bucket
+    """
+
+    def __init__(self, db_file: str, commit_interval: int = 1000):
+        """
+        Args:
+            db_file (str): 数据库路径
+            commit_interval (int, 可选): 每写入多少条记录提交一次事务
+        """
+        if os.path.dirname(db_file) and not os.path.isdir(os.path.dirname(db_file)):
+            os.makedirs(os.path.dirname(db_file))
+        self.__db = sqlite3.connect(db_file)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS last_verified (object TEXT PRIMARY KEY, sha256 TEXT, verified_at REAL, ok INTEGER)")
+        self.__db.commit()
+        self.__commit_interval = commit_interval
+        self.__pending = 0
+
+    def select(self, objects: dict, fraction: float = None, byte_budget: int = None) -> list:
+        """选取本次需要校验的Object
+
+        Args:
+            objects (dict): {Object: (sha256, 大小)}
+            fraction (float, 可选): 按数量选取的比例(0~1]
+            byte_budget (int, 可选): 按大小选取的总字节数上限，至少选取一个Object；与fraction同时提供时两者都需满足
+
+        Returns:
+            list: 按上次校验时间从早到晚排列的Object；sha256发生变化或上次校验未通过的Object视为从未校验过
+        """
+        verified_at = {obj: timestamp for obj, sha256, timestamp in self.__db.execute("SELECT object, sha256, verified_at FROM last_verified WHERE ok=1")
+                       if obj in objects and objects[obj][0] == sha256}
+        order = sorted(objects, key=lambda obj: verified_at.get(obj, 0))
+        if fraction is not None:
+            order = order[:max(1, int(len(order) * fraction))] if order else order
+        if byte_budget is not None:
+            selected_bytes = 0
+            for count, obj in enumerate(order):
+                selected_bytes += objects[obj][1]
+                if selected_bytes > byte_budget and count > 0:
+                    return order[:count]
+        return order
+
+    def record(self, remote_object: str, sha256: str, ok: bool):
+        """记录一个Object的校验结果"""
+        self.__db.execute("INSERT OR REPLACE INTO last_verified VALUES (?, ?, ?, ?)", (remote_object, sha256, time.time(), int(ok)))
+        self.__pending += 1
+        if self.__pending >= self.__commit_interval:
+            self.__db.commit()
+            self.__pending = 0
+
+    def prune(self, objects):
+        """删除已不在objects中的记录"""
+        stale = [(row[0],) for row in self.__db.execute("SELECT object FROM last_verified") if row[0] not in objects]
+        if stale:
+            self.__db.executemany("DELETE FROM last_verified WHERE object=?", stale)
+            logger.info("[ScrubState] 清除了%d条已删除的Object的记录" % len(stale))
+
+    def close(self):
+        self.__db.commit()
+        self.__db.close()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import oss2
+
+logger = logging.getLogger("upload_scheduler")
+
+UploadResult = namedtuple('UploadResult', ['local_file_name', 'remote_object_name', 'file_sha256', 'file_size', 'error'])
+
+
+class UploadScheduler(object):
+    """并发上传调度器
+
+    小文件的耗时主要在请求延迟上，因此同时上传大量小文件；大文件本身会以多线程分片上传，所以由单独的线程池上传并限制数量，
+    等待中的大文件不会占用小文件的上传线程。
+    队列已满时submit会阻塞，避免哈希计算远快于上传时无限堆积任务。
+    """
+
+    def __init__(self, oss, max_workers: int = 16, max_large_uploads: int = 2, large_file_size: int = 1024 * 1024 * 50, max_queued: int = None,
+                 chunk_store=None):
+        """
+        Args:
+            oss (OssOperation)
+            max_workers (int, 可选): 同时上传的小文件数
+            max_large_uploads (int, 可选): 同时上传的大文件数
+            large_file_size (int, 可选): 大于等于此大小的文件视为大文件(B)，应与分片上传阈值一致
+            max_queued (int, 可选): 已提交但未完成的任务数上限，默认为max_workers的4倍
+            chunk_store (ChunkStore, 可选): 以chunked=True提交的任务使用的分块存储
+        """
+        self.__oss = oss
+        self.__chunk_store = chunk_store
+        self.__large_file_size = large_file_size
+        self.__executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="upload")
+        self.__large_executor = ThreadPoolExecutor(max_workers=max(1, max_large_uploads), thread_name_prefix="upload-large")
+        self.__slots = threading.BoundedSemaphore(max_queued or max(1, max_workers) * 4)
+        self.__results = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__in_flight = 0
+
+    def submit(self, local_file_name: str, remote_object_name: str, file_sha256: str = None, file_size: int = None, stream: bool = False, chunked: bool = False,
+               **kwargs):
+        """提交一个上传任务，队列已满时阻塞
+
+        Args:
+            local_file_name (str): 本地文件路径
+            remote_object_name (str): 远程文件路径
+            file_sha256 (str, 可选)
+            file_size (int, 可选): 文件大小，不提供时自动获取
+            stream (bool, 可选): 使用OssOperation.stream_upload_file单次读取上传，上传结果中的file_sha256为上传时计算的sha256
+            chunked (bool, 可选): 使用ChunkStore.upload_file分块上传，此时remote_object_name只用于上传结果，kwargs被忽略
+            **kwargs: 传递给OssOperation.encrypt_and_upload_files(或stream_upload_file)的其余参数
+        """
+        if file_size is None:
+            try:
+                file_size = os.path.getsize(local_file_name)
+            except OSError:
+                file_size = 0
+        self.__slots.acquire()
+        with self.__lock:
+            self.__in_flight += 1
+        executor = self.__large_executor if file_size >= self.__large_file_size else self.__executor
+        executor.submit(self.__upload, local_file_name, remote_object_name, file_sha256, file_size, stream, chunked, kwargs)
+
+    def __upload(self, local_file_name, remote_object_name, file_sha256, file_size, stream, chunked, kwargs):
+        error = None
+        try:
+            if chunked:
+                self.__chunk_store.upload_file(local_file_name, file_sha256)
+            elif stream:
+                file_sha256 = self.__oss.stream_upload_file(local_file_name, remote_object_name, **kwargs)
+            else:
+                self.__oss.encrypt_and_upload_files(local_file_name, remote_object_name, file_sha256=file_sha256, **kwargs)
+        except Exception as err:
+            if not isinstance(err, (FileNotFoundError, ValueError, oss2.exceptions.RequestError)):
+                logger.exception("[UploadScheduler] 上传文件%s时发生未知错误" % local_file_name)
+            error = err
+        finally:
+            self.__results.put(UploadResult(local_file_name, remote_object_name, file_sha256, file_size, error))
+            self.__slots.release()
+
+    def completed(self):
+        """返回已经完成的上传结果，不阻塞"""
+        while True:
+            try:
+                result = self.__results.get_nowait()
+            except queue.Empty:
+                return
+            with self.__lock:
+                self.__in_flight -= 1
+            yield result
+
+    def join(self):
+        """等待全部任务完成并返回剩余的上传结果"""
+        while True:
+            with self.__lock:
+                if self.__in_flight == 0:
+                    return
+            result = self.__results.get()
+            with self.__lock:
+                self.__in_flight -= 1
+            yield result
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=True)
+        self.__large_executor.shutdown(wait=True)
+